@@ -13,10 +13,23 @@ import { BatchImportDialog } from '@/components/batch-import-dialog'
 import { KamImportDialog } from '@/components/kam-import-dialog'
 import { BatchVerifyDialog, type VerifyResult } from '@/components/batch-verify-dialog'
 import { useCredentials, useDeleteCredential, useResetFailure, useLoadBalancingMode, useSetLoadBalancingMode } from '@/hooks/use-credentials'
-import { getCredentialBalance } from '@/api/credentials'
+import { getCredentialBalance, type LoadBalancingMode } from '@/api/credentials'
 import { extractErrorMessage } from '@/lib/utils'
 import type { BalanceResponse } from '@/types/api'
 
+const LOAD_BALANCING_MODE_NAMES: Record<LoadBalancingMode, string> = {
+  priority: '优先级模式',
+  balanced: '均衡负载',
+  'least-in-flight': '最少在途',
+}
+
+// 按钮点击时依次切换：优先级 -> 均衡 -> 最少在途 -> 优先级
+const NEXT_LOAD_BALANCING_MODE: Record<LoadBalancingMode, LoadBalancingMode> = {
+  priority: 'balanced',
+  balanced: 'least-in-flight',
+  'least-in-flight': 'priority',
+}
+
 interface DashboardProps {
   onLogout: () => void
 }
@@ -447,12 +460,11 @@ export function Dashboard({ onLogout }: DashboardProps) {
   // 切换负载均衡模式
   const handleToggleLoadBalancing = () => {
     const currentMode = loadBalancingData?.mode || 'priority'
-    const newMode = currentMode === 'priority' ? 'balanced' : 'priority'
+    const newMode = NEXT_LOAD_BALANCING_MODE[currentMode]
 
     setLoadBalancingMode(newMode, {
       onSuccess: () => {
-        const modeName = newMode === 'priority' ? '优先级模式' : '均衡负载模式'
-        toast.success(`已切换到${modeName}`)
+        toast.success(`已切换到${LOAD_BALANCING_MODE_NAMES[newMode]}`)
       },
       onError: (error) => {
         toast.error(`切换失败: ${extractErrorMessage(error)}`)
@@ -505,7 +517,7 @@ export function Dashboard({ onLogout }: DashboardProps) {
               disabled={isLoadingMode || isSettingMode}
               title="切换负载均衡模式"
             >
-              {isLoadingMode ? '加载中...' : (loadBalancingData?.mode === 'priority' ? '优先级模式' : '均衡负载')}
+              {isLoadingMode ? '加载中...' : LOAD_BALANCING_MODE_NAMES[loadBalancingData?.mode || 'priority']}
             </Button>
             <Button variant="ghost" size="icon" onClick={toggleDarkMode}>
               {darkMode ? <Sun className="h-5 w-5" /> : <Moon className="h-5 w-5" />}
@@ -20,6 +20,7 @@ export interface CredentialStatusItem {
   refreshTokenHash?: string
   successCount: number
   lastUsedAt: string | null
+  inFlight: number
   hasProxy: boolean
   proxyUrl?: string
 }
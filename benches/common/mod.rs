@@ -0,0 +1,164 @@
+//! 基准测试共用的输入构造
+
+#![allow(dead_code)]
+
+use kiro_rs::anthropic::types::MessagesRequest;
+use kiro_rs::kiro::parser::frame::encode_frame;
+use serde_json::json;
+
+/// 编码一个 JSON 载荷的事件帧
+pub fn event_frame(event_type: &str, payload: &serde_json::Value) -> Vec<u8> {
+    encode_frame(
+        &[
+            (":message-type", "event"),
+            (":event-type", event_type),
+            (":content-type", "application/json"),
+        ],
+        &serde_json::to_vec(payload).unwrap(),
+    )
+}
+
+/// 构造一段典型的上游事件流
+///
+/// thinking 块 + `text_chunks` 个正文增量 + 一次分片的工具调用 + 上下文使用率 + 计费
+pub fn sample_event_stream(text_chunks: usize) -> Vec<u8> {
+    let mut stream = Vec::new();
+    let mut push_text = |content: &str| {
+        stream.extend(event_frame(
+            "assistantResponseEvent",
+            &json!({ "content": content }),
+        ));
+    };
+
+    push_text("<thinking>\n");
+    for i in 0..text_chunks / 4 {
+        push_text(&format!("Considering step {} of the request. ", i));
+    }
+    push_text("</thinking>\n\n");
+    for i in 0..text_chunks {
+        push_text(&format!(
+            "This is streamed text chunk number {} of the answer. ",
+            i
+        ));
+    }
+
+    for (input, stop) in [
+        (r#"{"path": "src/main.rs", "#, false),
+        (r#""content": "fn main() {}"}"#, true),
+    ] {
+        stream.extend(event_frame(
+            "toolUseEvent",
+            &json!({
+                "name": "write_file",
+                "toolUseId": "tooluse_bench",
+                "input": input,
+                "stop": stop
+            }),
+        ));
+    }
+
+    stream.extend(event_frame(
+        "contextUsageEvent",
+        &json!({ "contextUsagePercentage": 12.5 }),
+    ));
+    stream.extend(event_frame(
+        "meteringEvent",
+        &json!({ "unit": "credit", "usage": 0.1 }),
+    ));
+    stream
+}
+
+/// 构造一段约 `total_bytes` 字节的 thinking 正文（含被引用的 `</thinking>` 标签）
+pub fn large_thinking_stream(total_bytes: usize) -> String {
+    let line = "分析一下 `</thinking>` 标签的处理方式，然后继续推理 step by step.\n";
+    let mut thinking = String::with_capacity(total_bytes + line.len());
+    while thinking.len() < total_bytes {
+        thinking.push_str(line);
+    }
+    format!("<thinking>\n{}</thinking>\n\nDone.", thinking)
+}
+
+/// 构造一个包含 `turns` 轮工具调用历史的请求
+///
+/// `session` 为 Some 时带上 Claude Code 的 metadata.user_id，启用会话级历史缓存
+pub fn large_messages_request(turns: usize, session: Option<&str>) -> MessagesRequest {
+    let mut messages = Vec::with_capacity(turns * 2 + 1);
+    for i in 0..turns {
+        let mut content = Vec::new();
+        if i > 0 {
+            content.push(json!({
+                "type": "tool_result",
+                "tool_use_id": format!("toolu_{}", i - 1),
+                "content": "file contents ".repeat(64)
+            }));
+        }
+        content.push(json!({
+            "type": "text",
+            "text": format!("Step {}: please continue with the refactor.", i)
+        }));
+        messages.push(json!({ "role": "user", "content": content }));
+        messages.push(json!({
+            "role": "assistant",
+            "content": [
+                { "type": "text", "text": "Reading the next file. ".repeat(16) },
+                {
+                    "type": "tool_use",
+                    "id": format!("toolu_{}", i),
+                    "name": "read_file",
+                    "input": { "path": format!("src/module_{}.rs", i) }
+                }
+            ]
+        }));
+    }
+    messages.push(json!({
+        "role": "user",
+        "content": [
+            {
+                "type": "tool_result",
+                "tool_use_id": format!("toolu_{}", turns.saturating_sub(1)),
+                "content": "fn main() {}"
+            },
+            { "type": "text", "text": "Summarize the changes." }
+        ]
+    }));
+
+    let tools: Vec<_> = (0..32)
+        .map(|i| {
+            json!({
+                "name": format!("tool_{}", i),
+                "description": format!("Benchmark tool number {}. ", i).repeat(8),
+                "input_schema": {
+                    "type": "object",
+                    "properties": {
+                        "path": { "type": "string", "description": "File path" },
+                        "content": { "type": "string" }
+                    },
+                    "required": ["path"]
+                }
+            })
+        })
+        .chain(std::iter::once(json!({
+            "name": "read_file",
+            "description": "Read a file",
+            "input_schema": {
+                "type": "object",
+                "properties": { "path": { "type": "string" } }
+            }
+        })))
+        .collect();
+
+    let mut request = json!({
+        "model": "claude-sonnet-4-5",
+        "max_tokens": 8192,
+        "stream": true,
+        "system": "You are a helpful coding assistant. ".repeat(32),
+        "messages": messages,
+        "tools": tools
+    });
+    if let Some(session) = session {
+        request["metadata"] = json!({
+            "user_id": format!("user_bench_account__session_{}", session)
+        });
+    }
+    serde_json::from_value(request).unwrap()
+}
@@ -0,0 +1,31 @@
+//! 请求转换基准：大历史会话下的 `convert_request`
+//!
+//! - `cold`：无会话信息，每次完整转换历史
+//! - `session`：带 Claude Code 会话信息，复用上一轮已转换的历史前缀
+
+mod common;
+
+use std::hint::black_box;
+
+use criterion::{BenchmarkId, Criterion, criterion_group, criterion_main};
+use kiro_rs::anthropic::converter::convert_request;
+
+fn bench_convert_request(c: &mut Criterion) {
+    let mut group = c.benchmark_group("convert_request");
+    for turns in [10usize, 100, 400] {
+        let cold = common::large_messages_request(turns, None);
+        group.bench_with_input(BenchmarkId::new("cold", turns), &cold, |b, req| {
+            b.iter(|| convert_request(black_box(req)).unwrap())
+        });
+
+        let session = format!("00000000-0000-4000-8000-{:012}", turns);
+        let warm = common::large_messages_request(turns, Some(&session));
+        group.bench_with_input(BenchmarkId::new("session", turns), &warm, |b, req| {
+            b.iter(|| convert_request(black_box(req)).unwrap())
+        });
+    }
+    group.finish();
+}
+
+criterion_group!(benches, bench_convert_request);
+criterion_main!(benches);
@@ -0,0 +1,81 @@
+//! AWS Event Stream 解析基准：CRC 校验、单帧解析、分块流式解码
+
+mod common;
+
+use std::hint::black_box;
+
+use criterion::{BenchmarkId, Criterion, Throughput, criterion_group, criterion_main};
+use kiro_rs::kiro::model::events::Event;
+use kiro_rs::kiro::parser::crc::crc32;
+use kiro_rs::kiro::parser::decoder::EventStreamDecoder;
+use kiro_rs::kiro::parser::frame::parse_frame;
+use serde_json::json;
+
+fn bench_crc32(c: &mut Criterion) {
+    let mut group = c.benchmark_group("crc32");
+    for size in [64usize, 1024, 16 * 1024] {
+        let data = vec![0xa5u8; size];
+        group.throughput(Throughput::Bytes(size as u64));
+        group.bench_with_input(BenchmarkId::from_parameter(size), &data, |b, data| {
+            b.iter(|| crc32(black_box(data)))
+        });
+    }
+    group.finish();
+}
+
+fn bench_parse_frame(c: &mut Criterion) {
+    let mut group = c.benchmark_group("parse_frame");
+    for content_len in [32usize, 512, 8 * 1024] {
+        let frame = common::event_frame(
+            "assistantResponseEvent",
+            &json!({ "content": "x".repeat(content_len) }),
+        );
+        group.throughput(Throughput::Bytes(frame.len() as u64));
+        group.bench_with_input(
+            BenchmarkId::from_parameter(content_len),
+            &frame,
+            |b, frame| b.iter(|| parse_frame(black_box(frame)).unwrap().unwrap()),
+        );
+    }
+    group.finish();
+}
+
+/// 按 `chunk_size` 模拟网络分块，解码整段事件流并解析为 `Event`
+fn decode_stream(stream: &[u8], chunk_size: usize) -> usize {
+    let mut decoder = EventStreamDecoder::new();
+    let mut events = 0;
+    for chunk in stream.chunks(chunk_size) {
+        decoder.feed(chunk).unwrap();
+        for frame in decoder.decode_iter() {
+            if Event::from_frame(frame.unwrap()).is_ok() {
+                events += 1;
+            }
+        }
+    }
+    events
+}
+
+fn bench_decoder(c: &mut Criterion) {
+    let stream = common::sample_event_stream(256);
+    let expected = decode_stream(&stream, stream.len());
+
+    let mut group = c.benchmark_group("event_stream_decoder");
+    group.throughput(Throughput::Bytes(stream.len() as u64));
+    for chunk_size in [64usize, 1024, 16 * 1024] {
+        group.bench_with_input(
+            BenchmarkId::from_parameter(chunk_size),
+            &chunk_size,
+            |b, &chunk_size| {
+                b.iter(|| {
+                    let events = decode_stream(black_box(&stream), chunk_size);
+                    debug_assert_eq!(events, expected);
+                    events
+                })
+            },
+        );
+    }
+    group.finish();
+}
+
+criterion_group!(benches, bench_crc32, bench_parse_frame, bench_decoder);
+criterion_main!(benches);
@@ -0,0 +1,112 @@
+//! SSE 转换基准：`StreamContext::process_kiro_event`（含 thinking 标签扫描）
+//!
+//! - `process_kiro_event`：典型事件流，按事件数计吞吐
+//! - `thinking_stream`：多 MiB thinking 流按不同 chunk 大小输入，按字节计吞吐
+
+mod common;
+
+use std::hint::black_box;
+
+use criterion::{BatchSize, BenchmarkId, Criterion, Throughput, criterion_group, criterion_main};
+use kiro_rs::anthropic::stream::StreamContext;
+use kiro_rs::kiro::model::events::{AssistantResponseEvent, Event};
+use kiro_rs::kiro::parser::decoder::EventStreamDecoder;
+
+/// 预先解码事件，基准只覆盖事件到 SSE 的转换
+fn sample_events(text_chunks: usize) -> Vec<Event> {
+    let mut decoder = EventStreamDecoder::new();
+    decoder
+        .feed(&common::sample_event_stream(text_chunks))
+        .unwrap();
+    decoder
+        .decode_iter()
+        .map(|frame| Event::from_frame(frame.unwrap()).unwrap())
+        .collect()
+}
+
+/// 将文本按约 `chunk_bytes` 字节（对齐字符边界）切分为正文事件
+fn assistant_response_events(text: &str, chunk_bytes: usize) -> Vec<Event> {
+    let mut events = Vec::with_capacity(text.len() / chunk_bytes + 1);
+    let mut start = 0;
+    while start < text.len() {
+        let mut end = (start + chunk_bytes).min(text.len());
+        while !text.is_char_boundary(end) {
+            end += 1;
+        }
+        let payload: AssistantResponseEvent =
+            serde_json::from_value(serde_json::json!({ "content": &text[start..end] })).unwrap();
+        events.push(Event::AssistantResponse(payload));
+        start = end;
+    }
+    events
+}
+
+fn bench_process_kiro_event(c: &mut Criterion) {
+    let events = sample_events(512);
+
+    let mut group = c.benchmark_group("process_kiro_event");
+    group.throughput(Throughput::Elements(events.len() as u64));
+    for thinking_enabled in [false, true] {
+        group.bench_with_input(
+            BenchmarkId::new("thinking", thinking_enabled),
+            &thinking_enabled,
+            |b, &thinking_enabled| {
+                b.iter_batched(
+                    || {
+                        StreamContext::new_with_thinking(
+                            "claude-sonnet-4-5",
+                            1000,
+                            thinking_enabled,
+                        )
+                    },
+                    |mut ctx| {
+                        let mut sse_events = ctx.generate_initial_events().len();
+                        for event in &events {
+                            sse_events += ctx.process_kiro_event(black_box(event)).len();
+                        }
+                        sse_events + ctx.generate_final_events().len()
+                    },
+                    BatchSize::SmallInput,
+                )
+            },
+        );
+    }
+    group.finish();
+}
+
+fn bench_thinking_stream(c: &mut Criterion) {
+    let stream = common::large_thinking_stream(8 * 1024 * 1024);
+
+    let mut group = c.benchmark_group("thinking_stream");
+    group.throughput(Throughput::Bytes(stream.len() as u64));
+    group.sample_size(10);
+    for chunk_bytes in [64, 4096] {
+        let events = assistant_response_events(&stream, chunk_bytes);
+        group.bench_with_input(
+            BenchmarkId::new("chunk_bytes", chunk_bytes),
+            &events,
+            |b, events| {
+                b.iter_batched(
+                    || {
+                        let mut ctx =
+                            StreamContext::new_with_thinking("claude-sonnet-4-5", 1000, true);
+                        ctx.generate_initial_events();
+                        ctx
+                    },
+                    |mut ctx| {
+                        let mut sse_events = 0;
+                        for event in events {
+                            sse_events += ctx.process_kiro_event(black_box(event)).len();
+                        }
+                        sse_events + ctx.generate_final_events().len()
+                    },
+                    BatchSize::LargeInput,
+                )
+            },
+        );
+    }
+    group.finish();
+}
+
+criterion_group!(benches, bench_process_kiro_event, bench_thinking_stream);
+criterion_main!(benches);
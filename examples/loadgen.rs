@@ -0,0 +1,203 @@
+//! `/v1/messages` 压测工具
+//!
+//! 以固定并发向代理发送请求，统计吞吐量以及首字节 / 完整响应延迟分位数。
+//! 配合 `examples/mock_upstream.rs` 可在单机上压测完整链路：
+//!
+//! ```text
+//! cargo run --release --example mock_upstream
+//! cargo run --release -- -c bench-config.json --credentials bench-credentials.json
+//! cargo run --release --example loadgen -- --api-key sk-bench --requests 2000 --concurrency 64
+//! ```
+
+use std::path::PathBuf;
+use std::sync::Arc;
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::time::{Duration, Instant};
+
+use clap::Parser;
+use futures::StreamExt;
+use serde_json::json;
+
+/// `/v1/messages` 压测工具
+#[derive(Parser, Debug)]
+struct Args {
+    /// 代理地址
+    #[arg(long, default_value = "http://127.0.0.1:8080")]
+    url: String,
+
+    /// 代理 API Key
+    #[arg(long)]
+    api_key: String,
+
+    /// 总请求数
+    #[arg(long, default_value_t = 200)]
+    requests: usize,
+
+    /// 并发数
+    #[arg(long, default_value_t = 16)]
+    concurrency: usize,
+
+    /// 使用非流式请求
+    #[arg(long)]
+    no_stream: bool,
+
+    /// 模型名称
+    #[arg(long, default_value = "claude-sonnet-4-5")]
+    model: String,
+
+    /// 自定义请求体（JSON 文件，覆盖 --model / --no-stream）
+    #[arg(long)]
+    body: Option<PathBuf>,
+}
+
+/// 单个请求的测量结果
+struct Sample {
+    /// 收到第一个响应体分片的耗时
+    ttfb: Duration,
+    /// 读完整个响应体的耗时
+    total: Duration,
+    bytes: usize,
+}
+
+#[tokio::main]
+async fn main() -> anyhow::Result<()> {
+    let args = Args::parse();
+
+    let body = match &args.body {
+        Some(path) => std::fs::read_to_string(path)?,
+        None => json!({
+            "model": args.model,
+            "max_tokens": 1024,
+            "stream": !args.no_stream,
+            "messages": [{ "role": "user", "content": "Write a short poem about benchmarks." }]
+        })
+        .to_string(),
+    };
+    let endpoint = format!("{}/v1/messages", args.url.trim_end_matches('/'));
+    let client = reqwest::Client::builder()
+        .pool_max_idle_per_host(args.concurrency)
+        .build()?;
+
+    let next = Arc::new(AtomicUsize::new(0));
+    let started = Instant::now();
+    let workers: Vec<_> = (0..args.concurrency.max(1))
+        .map(|_| {
+            let client = client.clone();
+            let endpoint = endpoint.clone();
+            let api_key = args.api_key.clone();
+            let body = body.clone();
+            let next = next.clone();
+            let total_requests = args.requests;
+            tokio::spawn(async move {
+                let mut samples = Vec::new();
+                let mut errors = Vec::new();
+                while next.fetch_add(1, Ordering::Relaxed) < total_requests {
+                    match send_one(&client, &endpoint, &api_key, &body).await {
+                        Ok(sample) => samples.push(sample),
+                        Err(e) => errors.push(e.to_string()),
+                    }
+                }
+                (samples, errors)
+            })
+        })
+        .collect();
+
+    let mut samples = Vec::with_capacity(args.requests);
+    let mut errors = Vec::new();
+    for worker in workers {
+        let (s, e) = worker.await?;
+        samples.extend(s);
+        errors.extend(e);
+    }
+    let elapsed = started.elapsed();
+
+    report(&samples, &errors, elapsed, args.concurrency);
+    Ok(())
+}
+
+/// 发送一个请求并读完响应体
+async fn send_one(
+    client: &reqwest::Client,
+    endpoint: &str,
+    api_key: &str,
+    body: &str,
+) -> anyhow::Result<Sample> {
+    let started = Instant::now();
+    let response = client
+        .post(endpoint)
+        .header("x-api-key", api_key)
+        .header("anthropic-version", "2023-06-01")
+        .header("content-type", "application/json")
+        .body(body.to_string())
+        .send()
+        .await?;
+
+    let status = response.status();
+    if !status.is_success() {
+        let text = response.text().await.unwrap_or_default();
+        anyhow::bail!("{} {}", status, text);
+    }
+
+    let mut ttfb = None;
+    let mut bytes = 0;
+    let mut stream = response.bytes_stream();
+    while let Some(chunk) = stream.next().await {
+        let chunk = chunk?;
+        ttfb.get_or_insert_with(|| started.elapsed());
+        bytes += chunk.len();
+    }
+
+    let total = started.elapsed();
+    Ok(Sample {
+        ttfb: ttfb.unwrap_or(total),
+        total,
+        bytes,
+    })
+}
+
+/// 输出吞吐量与延迟分位数
+fn report(samples: &[Sample], errors: &[String], elapsed: Duration, concurrency: usize) {
+    let secs = elapsed.as_secs_f64();
+    let bytes: usize = samples.iter().map(|s| s.bytes).sum();
+
+    println!("并发: {}", concurrency);
+    println!("耗时: {:.2}s", secs);
+    println!("成功: {}，失败: {}", samples.len(), errors.len());
+    println!(
+        "吞吐量: {:.1} req/s，{:.2} MiB/s",
+        samples.len() as f64 / secs,
+        bytes as f64 / secs / (1024.0 * 1024.0)
+    );
+
+    let mut ttfb: Vec<_> = samples.iter().map(|s| s.ttfb).collect();
+    let mut total: Vec<_> = samples.iter().map(|s| s.total).collect();
+    print_percentiles("首字节", &mut ttfb);
+    print_percentiles("完整响应", &mut total);
+
+    // 相同错误只显示一次，避免刷屏
+    let mut distinct: Vec<_> = errors.to_vec();
+    distinct.sort();
+    distinct.dedup();
+    for error in distinct.iter().take(5) {
+        println!("错误示例: {}", error);
+    }
+}
+
+fn print_percentiles(label: &str, values: &mut [Duration]) {
+    if values.is_empty() {
+        return;
+    }
+    values.sort_unstable();
+    let percentile = |q: f64| {
+        let rank = ((values.len() as f64 * q).ceil() as usize).clamp(1, values.len());
+        values[rank - 1].as_secs_f64() * 1000.0
+    };
+    println!(
+        "{}延迟(ms): p50 {:.1}  p90 {:.1}  p99 {:.1}  max {:.1}",
+        label,
+        percentile(0.5),
+        percentile(0.9),
+        percentile(0.99),
+        percentile(1.0)
+    );
+}
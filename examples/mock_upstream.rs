@@ -0,0 +1,261 @@
+//! 本地 Mock Kiro 上游
+//!
+//! 在无 AWS 环境下压测完整的 `/v1/messages` 链路：
+//! - `POST /generateAssistantResponse`：回放录制的 AWS Event Stream（按帧节奏发送）
+//! - `POST /refreshToken`、`POST /token`：模拟 Social / IdC Token 刷新
+//! - `GET /getUsageLimits`：模拟额度查询
+//!
+//! 录制文件支持原始二进制，或 `tools/event-viewer.html` 可识别的 Hex 文本
+//! （包括 `debug::print_hex` 输出的带偏移 / ASCII 列的格式）。未指定录制文件时
+//! 生成一段合成事件流。
+//!
+//! 代理侧在 `config.json` 中配置 `"upstreamBaseUrl": "http://127.0.0.1:9000"` 即可指向本服务。
+//!
+//! ```text
+//! cargo run --release --example mock_upstream -- --capture capture.hex --ttfb-ms 300 --frame-interval-ms 20
+//! ```
+
+use std::convert::Infallible;
+use std::path::PathBuf;
+use std::sync::Arc;
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::time::Duration;
+
+use axum::{
+    Json, Router,
+    body::Body,
+    extract::State,
+    http::{StatusCode, header},
+    response::{IntoResponse, Response},
+    routing::{get, post},
+};
+use bytes::Bytes;
+use clap::Parser;
+use futures::stream;
+use kiro_rs::kiro::parser::frame::{encode_frame, parse_frame};
+use serde_json::json;
+
+/// Mock Kiro 上游
+#[derive(Parser, Debug)]
+struct Args {
+    /// 监听地址
+    #[arg(long, default_value = "127.0.0.1:9000")]
+    listen: String,
+
+    /// 事件流录制文件（可重复指定，按请求轮流回放）
+    #[arg(long)]
+    capture: Vec<PathBuf>,
+
+    /// 返回响应头前的等待时间（毫秒），模拟上游首字节延迟
+    #[arg(long, default_value_t = 0)]
+    ttfb_ms: u64,
+
+    /// 相邻帧之间的发送间隔（毫秒），为 0 时整段一次写出
+    #[arg(long, default_value_t = 0)]
+    frame_interval_ms: u64,
+
+    /// 未指定录制文件时，合成事件流的正文分片数
+    #[arg(long, default_value_t = 64)]
+    text_chunks: usize,
+}
+
+struct MockState {
+    /// 每个录制文件按帧切分后的内容
+    captures: Vec<Vec<Bytes>>,
+    next_capture: AtomicUsize,
+    ttfb: Duration,
+    frame_interval: Duration,
+}
+
+#[tokio::main]
+async fn main() -> anyhow::Result<()> {
+    let args = Args::parse();
+    tracing_subscriber::fmt()
+        .with_env_filter(
+            tracing_subscriber::EnvFilter::try_from_default_env()
+                .unwrap_or_else(|_| tracing_subscriber::EnvFilter::new("info")),
+        )
+        .init();
+
+    let mut captures = Vec::with_capacity(args.capture.len());
+    for path in &args.capture {
+        let data = load_capture(&std::fs::read(path)?);
+        let frames = split_frames(data);
+        tracing::info!("已加载录制文件 {:?}（{} 帧）", path, frames.len());
+        captures.push(frames);
+    }
+    if captures.is_empty() {
+        captures.push(split_frames(synthetic_stream(args.text_chunks)));
+        tracing::info!(
+            "未指定录制文件，使用合成事件流（{} 个正文分片）",
+            args.text_chunks
+        );
+    }
+
+    let state = Arc::new(MockState {
+        captures,
+        next_capture: AtomicUsize::new(0),
+        ttfb: Duration::from_millis(args.ttfb_ms),
+        frame_interval: Duration::from_millis(args.frame_interval_ms),
+    });
+
+    let app = Router::new()
+        .route(
+            "/generateAssistantResponse",
+            post(generate_assistant_response),
+        )
+        .route("/refreshToken", post(refresh_token))
+        .route("/token", post(refresh_token))
+        .route("/getUsageLimits", get(get_usage_limits))
+        .with_state(state);
+
+    tracing::info!("Mock 上游已启动: http://{}", args.listen);
+    let listener = tokio::net::TcpListener::bind(&args.listen).await?;
+    axum::serve(listener, app).await?;
+    Ok(())
+}
+
+/// POST /generateAssistantResponse
+/// 按帧节奏回放事件流
+async fn generate_assistant_response(State(state): State<Arc<MockState>>) -> Response {
+    if !state.ttfb.is_zero() {
+        tokio::time::sleep(state.ttfb).await;
+    }
+
+    let index = state.next_capture.fetch_add(1, Ordering::Relaxed) % state.captures.len();
+    let frames = state.captures[index].clone();
+    let interval = state.frame_interval;
+
+    let body = if interval.is_zero() {
+        Body::from(frames.concat())
+    } else {
+        let frames = stream::unfold(
+            frames.into_iter().enumerate(),
+            move |mut frames| async move {
+                let (i, frame) = frames.next()?;
+                if i > 0 {
+                    tokio::time::sleep(interval).await;
+                }
+                Some((Ok::<_, Infallible>(frame), frames))
+            },
+        );
+        Body::from_stream(frames)
+    };
+
+    Response::builder()
+        .status(StatusCode::OK)
+        .header(header::CONTENT_TYPE, "application/vnd.amazon.eventstream")
+        .body(body)
+        .unwrap()
+}
+
+/// POST /refreshToken、POST /token
+/// Social 与 IdC 刷新响应字段相同，统一返回 1 小时有效的 Token
+///
+/// 返回的 refreshToken 长度超过 100 字符，以通过代理侧的截断检查
+async fn refresh_token() -> impl IntoResponse {
+    let refresh_token = uuid::Uuid::new_v4().simple().to_string().repeat(4);
+    Json(json!({
+        "accessToken": format!("mock-access-{}", uuid::Uuid::new_v4()),
+        "refreshToken": format!("mock-refresh-{}", refresh_token),
+        "profileArn": "arn:aws:codewhisperer:us-east-1:000000000000:profile/MOCK",
+        "expiresIn": 3600,
+        "tokenType": "Bearer"
+    }))
+}
+
+/// GET /getUsageLimits
+async fn get_usage_limits() -> impl IntoResponse {
+    Json(json!({
+        "subscriptionInfo": { "subscriptionTitle": "KIRO MOCK" },
+        "usageBreakdownList": [{
+            "currentUsage": 0,
+            "currentUsageWithPrecision": 0.0,
+            "usageLimit": 1000000,
+            "usageLimitWithPrecision": 1000000.0,
+            "bonuses": []
+        }]
+    }))
+}
+
+/// 解析录制文件：Hex 文本（可带 `print_hex` 的偏移与 ASCII 列）或原始二进制
+fn load_capture(data: &[u8]) -> Vec<u8> {
+    let Ok(text) = std::str::from_utf8(data) else {
+        return data.to_vec();
+    };
+
+    let mut hex = String::with_capacity(text.len());
+    for line in text.lines() {
+        // 去掉 `00000010: ` 偏移前缀和 `|....|` ASCII 列
+        let line = match line.split_once(": ") {
+            Some((offset, rest)) if offset.chars().all(|c| c.is_ascii_hexdigit()) => rest,
+            _ => line,
+        };
+        let line = line.split_once('|').map_or(line, |(bytes, _)| bytes);
+        hex.push_str(&line.replace("0x", "").replace("0X", ""));
+    }
+    hex.retain(|c| !c.is_whitespace());
+
+    if hex.is_empty() || hex.len() % 2 != 0 || !hex.chars().all(|c| c.is_ascii_hexdigit()) {
+        return data.to_vec();
+    }
+    (0..hex.len())
+        .step_by(2)
+        .map(|i| u8::from_str_radix(&hex[i..i + 2], 16).unwrap())
+        .collect()
+}
+
+/// 按帧边界切分事件流，无法解析的剩余数据作为最后一块原样发送
+fn split_frames(data: Vec<u8>) -> Vec<Bytes> {
+    let data = Bytes::from(data);
+    let mut frames = Vec::new();
+    let mut offset = 0;
+    while offset < data.len() {
+        match parse_frame(&data[offset..]) {
+            Ok(Some((_, consumed))) => {
+                frames.push(data.slice(offset..offset + consumed));
+                offset += consumed;
+            }
+            _ => {
+                tracing::warn!(
+                    "录制数据在偏移 {} 处无法解析为完整帧，剩余数据原样发送",
+                    offset
+                );
+                frames.push(data.slice(offset..));
+                break;
+            }
+        }
+    }
+    frames
+}
+
+/// 合成事件流：正文增量 + 上下文使用率 + 计费
+fn synthetic_stream(text_chunks: usize) -> Vec<u8> {
+    let event = |event_type: &str, payload: serde_json::Value| {
+        encode_frame(
+            &[
+                (":message-type", "event"),
+                (":event-type", event_type),
+                (":content-type", "application/json"),
+            ],
+            payload.to_string().as_bytes(),
+        )
+    };
+
+    let mut data = Vec::new();
+    for i in 0..text_chunks {
+        data.extend(event(
+            "assistantResponseEvent",
+            json!({ "content": format!("Mock response chunk {}. ", i) }),
+        ));
+    }
+    data.extend(event(
+        "contextUsageEvent",
+        json!({ "contextUsagePercentage": 1.5 }),
+    ));
+    data.extend(event(
+        "meteringEvent",
+        json!({ "unit": "credit", "usage": 0.01 }),
+    ));
+    data
+}
@@ -3,6 +3,7 @@
 use axum::{
     Json,
     extract::{Path, State},
+    http::header,
     response::IntoResponse,
 };
 
@@ -113,6 +114,25 @@ pub async fn get_load_balancing_mode(State(state): State<AdminState>) -> impl In
     Json(response)
 }
 
+/// GET /api/admin/persistence
+/// 获取状态文件落盘统计（写入次数、耗时）
+pub async fn get_persistence_stats(State(state): State<AdminState>) -> impl IntoResponse {
+    let response = state.service.get_persistence_stats();
+    Json(response)
+}
+
+/// GET /api/admin/metrics
+/// 获取 Prometheus 文本格式的运行时指标
+pub async fn get_metrics(State(state): State<AdminState>) -> impl IntoResponse {
+    (
+        [(
+            header::CONTENT_TYPE,
+            "text/plain; version=0.0.4; charset=utf-8",
+        )],
+        state.service.render_metrics(),
+    )
+}
+
 /// PUT /api/admin/config/load-balancing
 /// 设置负载均衡模式
 pub async fn set_load_balancing_mode(
@@ -8,6 +8,8 @@ use chrono::Utc;
 use parking_lot::Mutex;
 use serde::{Deserialize, Serialize};
 
+use crate::common::metrics::metrics;
+use crate::common::persist::PersistStats;
 use crate::kiro::model::credentials::KiroCredentials;
 use crate::kiro::token_manager::MultiTokenManager;
 
@@ -73,6 +75,7 @@ impl AdminService {
                 email: entry.email,
                 success_count: entry.success_count,
                 last_used_at: entry.last_used_at.clone(),
+                in_flight: entry.in_flight,
                 has_proxy: entry.has_proxy,
                 proxy_url: entry.proxy_url,
             })
@@ -260,9 +263,9 @@ impl AdminService {
         req: SetLoadBalancingModeRequest,
     ) -> Result<LoadBalancingModeResponse, AdminServiceError> {
         // 验证模式值
-        if req.mode != "priority" && req.mode != "balanced" {
+        if !MultiTokenManager::is_valid_load_balancing_mode(&req.mode) {
             return Err(AdminServiceError::InvalidCredential(
-                "mode 必须是 'priority' 或 'balanced'".to_string(),
+                "mode 必须是 'priority'、'balanced' 或 'least-in-flight'".to_string(),
             ));
         }
 
@@ -273,6 +276,18 @@ impl AdminService {
         Ok(LoadBalancingModeResponse { mode: req.mode })
     }
 
+    /// 获取落盘统计
+    pub fn get_persistence_stats(&self) -> PersistStats {
+        self.token_manager.persist_stats()
+    }
+
+    /// 导出 Prometheus 文本格式的运行时指标（全局指标 + 凭据级指标）
+    pub fn render_metrics(&self) -> String {
+        let mut out = metrics().render();
+        self.token_manager.render_metrics(&mut out);
+        out
+    }
+
     // ============ 余额缓存持久化 ============
 
     fn load_balance_cache_from(cache_path: &Option<PathBuf>) -> HashMap<u64, CachedBalance> {
@@ -315,17 +330,16 @@ impl AdminService {
             None => return,
         };
 
-        // 持有锁期间完成序列化和写入，防止并发损坏
+        // 持有锁期间完成序列化和提交，保证提交顺序与缓存变更顺序一致
         let cache = self.balance_cache.lock();
         let map: HashMap<String, &CachedBalance> =
             cache.iter().map(|(k, v)| (k.to_string(), v)).collect();
 
         match serde_json::to_string_pretty(&map) {
-            Ok(json) => {
-                if let Err(e) = std::fs::write(path, json) {
-                    tracing::warn!("保存余额缓存失败: {}", e);
-                }
-            }
+            Ok(json) => self
+                .token_manager
+                .persist_writer()
+                .submit(path.clone(), json.into_bytes()),
             Err(e) => tracing::warn!("序列化余额缓存失败: {}", e),
         }
     }
@@ -2,8 +2,17 @@
 //!
 //! 负责将 Anthropic API 请求格式转换为 Kiro API 请求格式
 
+use std::collections::HashMap;
+use std::hash::{DefaultHasher, Hash, Hasher};
+use std::sync::{Arc, OnceLock};
+use std::time::Instant;
+
+use parking_lot::Mutex;
 use uuid::Uuid;
 
+use crate::common::cache::{
+    FastHasher, GenerationalCache, estimate_json_size, hash_json_map, hash_json_value,
+};
 use crate::kiro::model::requests::conversation::{
     AssistantMessage, ConversationState, CurrentMessage, HistoryAssistantMessage,
     HistoryUserMessage, KiroImage, Message, UserInputMessage, UserInputMessageContext, UserMessage,
@@ -149,11 +158,11 @@ fn extract_session_id(user_id: &str) -> Option<String> {
 }
 
 /// 收集历史消息中使用的所有工具名称
-fn collect_history_tool_names(history: &[Message]) -> Vec<String> {
+fn collect_history_tool_names(history: &[Arc<Message>]) -> Vec<String> {
     let mut tool_names = Vec::new();
 
     for msg in history {
-        if let Message::Assistant(assistant_msg) = msg {
+        if let Message::Assistant(assistant_msg) = msg.as_ref() {
             if let Some(ref tool_uses) = assistant_msg.assistant_response_message.tool_uses {
                 for tool_use in tool_uses {
                     if !tool_names.contains(&tool_use.name) {
@@ -212,11 +221,13 @@ pub fn convert_request(req: &MessagesRequest) -> Result<ConversionResult, Conver
 
     // 3. 生成会话 ID 和代理 ID
     // 优先从 metadata.user_id 中提取 session UUID 作为 conversationId
-    let conversation_id = req
+    let session_id = req
         .metadata
         .as_ref()
         .and_then(|m| m.user_id.as_ref())
-        .and_then(|user_id| extract_session_id(user_id))
+        .and_then(|user_id| extract_session_id(user_id));
+    let conversation_id = session_id
+        .clone()
         .unwrap_or_else(|| Uuid::new_v4().to_string());
     let agent_continuation_id = Uuid::new_v4().to_string();
 
@@ -231,7 +242,8 @@ pub fn convert_request(req: &MessagesRequest) -> Result<ConversionResult, Conver
     let mut tools = convert_tools(&req.tools);
 
     // 7. 构建历史消息（需要先构建，以便收集历史中使用的工具）
-    let mut history = build_history(req, messages, &model_id)?;
+    // 同一会话的历史前缀会复用上一轮的转换结果
+    let mut history = build_history(req, messages, &model_id, session_id.as_deref())?;
 
     // 8. 验证并过滤 tool_use/tool_result 配对
     // 移除孤立的 tool_result（没有对应的 tool_use）
@@ -396,7 +408,7 @@ fn extract_tool_result_content(content: &Option<serde_json::Value>) -> String {
 /// # Returns
 /// 元组：(经过验证和过滤后的 tool_result 列表, 孤立的 tool_use_id 集合)
 fn validate_tool_pairing(
-    history: &[Message],
+    history: &[Arc<Message>],
     tool_results: &[ToolResult],
 ) -> (Vec<ToolResult>, std::collections::HashSet<String>) {
     use std::collections::HashSet;
@@ -407,7 +419,7 @@ fn validate_tool_pairing(
     let mut history_tool_result_ids: HashSet<String> = HashSet::new();
 
     for msg in history {
-        match msg {
+        match msg.as_ref() {
             Message::Assistant(assistant_msg) => {
                 if let Some(ref tool_uses) = assistant_msg.assistant_response_message.tool_uses {
                     for tool_use in tool_uses {
@@ -472,12 +484,13 @@ fn validate_tool_pairing(
 ///
 /// Kiro API 要求每个 tool_use 必须有对应的 tool_result，否则返回 400 Bad Request。
 /// 此函数遍历历史中的 assistant 消息，移除没有对应 tool_result 的 tool_use。
+/// 历史消息可能与会话历史缓存共享，只有需要修改的消息才会被克隆。
 ///
 /// # Arguments
 /// * `history` - 可变的历史消息列表
 /// * `orphaned_ids` - 需要移除的孤立 tool_use_id 集合
 fn remove_orphaned_tool_uses(
-    history: &mut [Message],
+    history: &mut [Arc<Message>],
     orphaned_ids: &std::collections::HashSet<String>,
 ) {
     if orphaned_ids.is_empty() {
@@ -485,7 +498,19 @@ fn remove_orphaned_tool_uses(
     }
 
     for msg in history.iter_mut() {
-        if let Message::Assistant(assistant_msg) = msg {
+        let has_orphaned = match msg.as_ref() {
+            Message::Assistant(assistant_msg) => assistant_msg
+                .assistant_response_message
+                .tool_uses
+                .as_ref()
+                .is_some_and(|t| t.iter().any(|tu| orphaned_ids.contains(&tu.tool_use_id))),
+            Message::User(_) => false,
+        };
+        if !has_orphaned {
+            continue;
+        }
+
+        if let Message::Assistant(assistant_msg) = Arc::make_mut(msg) {
             if let Some(ref mut tool_uses) = assistant_msg.assistant_response_message.tool_uses {
                 let original_len = tool_uses.len();
                 tool_uses.retain(|tu| !orphaned_ids.contains(&tu.tool_use_id));
@@ -504,43 +529,65 @@ fn remove_orphaned_tool_uses(
     }
 }
 
+/// 工具定义转换缓存每一代的容量（总容量为两倍）
+const TOOL_CACHE_CAPACITY: usize = 1024;
+
+/// 已转换的工具定义缓存，key 为工具名称、描述和 input_schema 的内容哈希
+///
+/// 客户端每轮都会重发完整的工具列表，缓存后无需重复规范化 schema
+static TOOL_CACHE: OnceLock<GenerationalCache<Tool>> = OnceLock::new();
+
+fn tool_cache() -> &'static GenerationalCache<Tool> {
+    TOOL_CACHE.get_or_init(|| GenerationalCache::new(TOOL_CACHE_CAPACITY))
+}
+
 /// 转换工具定义
 fn convert_tools(tools: &Option<Vec<super::types::Tool>>) -> Vec<Tool> {
     let Some(tools) = tools else {
         return Vec::new();
     };
 
+    let cache = tool_cache();
     tools
         .iter()
         .map(|t| {
-            let mut description = t.description.clone();
+            let mut hasher = DefaultHasher::new();
+            t.name.hash(&mut hasher);
+            t.description.hash(&mut hasher);
+            hash_json_map(&t.input_schema, &mut hasher);
+            cache.get_or_insert_with(hasher.finish(), || convert_tool(t))
+        })
+        .collect()
+}
 
-            // 对 Write/Edit 工具追加自定义描述后缀
-            let suffix = match t.name.as_str() {
-                "Write" => WRITE_TOOL_DESCRIPTION_SUFFIX,
-                "Edit" => EDIT_TOOL_DESCRIPTION_SUFFIX,
-                _ => "",
-            };
-            if !suffix.is_empty() {
-                description.push('\n');
-                description.push_str(suffix);
-            }
+/// 转换单个工具定义
+fn convert_tool(t: &super::types::Tool) -> Tool {
+    let mut description = t.description.clone();
 
-            // 限制描述长度为 10000 字符（安全截断 UTF-8，单次遍历）
-            let description = match description.char_indices().nth(10000) {
-                Some((idx, _)) => description[..idx].to_string(),
-                None => description,
-            };
+    // 对 Write/Edit 工具追加自定义描述后缀
+    let suffix = match t.name.as_str() {
+        "Write" => WRITE_TOOL_DESCRIPTION_SUFFIX,
+        "Edit" => EDIT_TOOL_DESCRIPTION_SUFFIX,
+        _ => "",
+    };
+    if !suffix.is_empty() {
+        description.push('\n');
+        description.push_str(suffix);
+    }
 
-            Tool {
-                tool_specification: ToolSpecification {
-                    name: t.name.clone(),
-                    description,
-                    input_schema: InputSchema::from_json(normalize_json_schema(serde_json::json!(t.input_schema))),
-                },
-            }
-        })
-        .collect()
+    // 限制描述长度为 10000 字符（安全截断 UTF-8，单次遍历）
+    let description = match description.char_indices().nth(10000) {
+        Some((idx, _)) => description[..idx].to_string(),
+        None => description,
+    };
+
+    Tool {
+        tool_specification: ToolSpecification {
+            name: t.name.clone(),
+            description,
+            input_schema: InputSchema::from_json(normalize_json_schema(serde_json::json!(t.input_schema))),
+        },
+    }
 }
 
 /// 生成thinking标签前缀
@@ -579,7 +626,13 @@ fn has_thinking_tags(content: &str) -> bool {
 ///   注意：该切片与 `req.messages` 可能不同（prefill 时会截断末尾的 assistant 消息），
 ///   调用方应始终使用此参数而非 `req.messages`。
 /// * `model_id` - 已映射的 Kiro 模型 ID
-fn build_history(req: &MessagesRequest, messages: &[super::types::Message], model_id: &str) -> Result<Vec<Message>, ConversionError> {
+/// * `session_id` - 会话 ID，存在时复用该会话已转换的历史前缀
+fn build_history(
+    req: &MessagesRequest,
+    messages: &[super::types::Message],
+    model_id: &str,
+    session_id: Option<&str>,
+) -> Result<Vec<Arc<Message>>, ConversionError> {
     let mut history = Vec::new();
 
     // 生成thinking前缀（如果需要）
@@ -610,69 +663,306 @@ fn build_history(req: &MessagesRequest, messages: &[super::types::Message], mode
 
             // 系统消息作为 user + assistant 配对
             let user_msg = HistoryUserMessage::new(final_content, model_id);
-            history.push(Message::User(user_msg));
+            history.push(Arc::new(Message::User(user_msg)));
 
             let assistant_msg = HistoryAssistantMessage::new("I will follow these instructions.");
-            history.push(Message::Assistant(assistant_msg));
+            history.push(Arc::new(Message::Assistant(assistant_msg)));
         }
     } else if let Some(ref prefix) = thinking_prefix {
         // 没有系统消息但有thinking配置，插入新的系统消息
         let user_msg = HistoryUserMessage::new(prefix.clone(), model_id);
-        history.push(Message::User(user_msg));
+        history.push(Arc::new(Message::User(user_msg)));
 
         let assistant_msg = HistoryAssistantMessage::new("I will follow these instructions.");
-        history.push(Message::Assistant(assistant_msg));
+        history.push(Arc::new(Message::Assistant(assistant_msg)));
     }
 
     // 2. 处理常规消息历史
     // 最后一条消息作为 currentMessage，不加入历史
     // 经过 prefill 预处理后，messages 末尾必定是 user，故直接截掉最后一条即可
     let history_end_index = messages.len().saturating_sub(1);
+    let groups = convert_history_groups(&messages[..history_end_index], model_id, session_id)?;
 
-    // 收集并配对消息
-    let mut user_buffer: Vec<&super::types::Message> = Vec::new();
-    let mut assistant_buffer: Vec<&super::types::Message> = Vec::new();
+    // 结尾是孤立的 user 消息时，自动配对一个 "OK" 的 assistant 响应
+    let ends_with_user = groups.last().is_some_and(|g| g.is_user);
+    // 与缓存共享转换结果，只增加引用计数
+    history.extend(groups.iter().map(|g| g.message.clone()));
+    if ends_with_user {
+        let auto_assistant = HistoryAssistantMessage::new("OK");
+        history.push(Arc::new(Message::Assistant(auto_assistant)));
+    }
 
-    for i in 0..history_end_index {
-        let msg = &messages[i];
+    Ok(history)
+}
 
-        if msg.role == "user" {
-            // 先处理累积的 assistant 消息
-            if !assistant_buffer.is_empty() {
-                let merged = merge_assistant_messages(&assistant_buffer)?;
-                history.push(Message::Assistant(merged));
-                assistant_buffer.clear();
-            }
-            user_buffer.push(msg);
-        } else if msg.role == "assistant" {
-            // 先处理累积的 user 消息
-            if !user_buffer.is_empty() {
-                let merged_user = merge_user_messages(&user_buffer, model_id)?;
-                history.push(Message::User(merged_user));
-                user_buffer.clear();
-            }
-            // 累积 assistant 消息（支持连续多条）
-            assistant_buffer.push(msg);
+// === 会话历史转换缓存 ===
+
+/// 会话历史缓存最多保留的会话数，超出时淘汰最久未使用的会话
+const SESSION_CACHE_MAX_SESSIONS: usize = 128;
+
+/// 会话历史缓存的内存预算（按分组大小估算），超出时淘汰最久未使用的会话
+///
+/// 历史中可能包含 base64 图片，仅按会话数限制无法约束内存
+const SESSION_CACHE_MAX_BYTES: usize = 128 * 1024 * 1024;
+
+/// 已转换的历史消息分组
+///
+/// 源消息中同一角色的连续消息会合并为一条历史消息，
+/// 每个分组只依赖自身的源消息，可以跨请求复用
+#[derive(Debug)]
+struct ConvertedGroup {
+    /// 分组最后一条源消息之后的位置
+    end: usize,
+    /// 源消息 `[..end]` 的前缀哈希
+    prefix_hash: u64,
+    /// 是否为 user 分组
+    is_user: bool,
+    /// 估算的内存占用（字节）
+    size: usize,
+    /// 转换后的历史消息（与输出的请求共享）
+    message: Arc<Message>,
+}
+
+struct SessionHistory {
+    groups: Arc<Vec<Arc<ConvertedGroup>>>,
+    /// 各分组估算内存之和
+    bytes: usize,
+    last_used: Instant,
+}
+
+#[derive(Default)]
+struct Sessions {
+    map: HashMap<String, SessionHistory>,
+    /// 所有会话估算内存之和
+    total_bytes: usize,
+}
+
+/// 会话级历史转换缓存
+///
+/// 以 session ID 为 key 保存上一轮已转换的历史分组。
+/// 新请求先按前缀哈希确认历史未被改写，再复用匹配的分组，只转换新增的尾部消息。
+/// 同时受会话数与内存预算约束，超出任一限制时淘汰最久未使用的会话。
+struct SessionHistoryCache {
+    max_sessions: usize,
+    max_bytes: usize,
+    sessions: Mutex<Sessions>,
+}
+
+impl SessionHistoryCache {
+    fn new(max_sessions: usize, max_bytes: usize) -> Self {
+        Self {
+            max_sessions: max_sessions.max(1),
+            max_bytes,
+            sessions: Mutex::new(Sessions::default()),
         }
     }
 
-    // 处理末尾累积的 assistant 消息
-    if !assistant_buffer.is_empty() {
-        let merged = merge_assistant_messages(&assistant_buffer)?;
-        history.push(Message::Assistant(merged));
+    fn get(&self, session_id: &str) -> Option<Arc<Vec<Arc<ConvertedGroup>>>> {
+        let mut sessions = self.sessions.lock();
+        let entry = sessions.map.get_mut(session_id)?;
+        entry.last_used = Instant::now();
+        Some(entry.groups.clone())
     }
 
-    // 处理结尾的孤立 user 消息
-    if !user_buffer.is_empty() {
-        let merged_user = merge_user_messages(&user_buffer, model_id)?;
-        history.push(Message::User(merged_user));
+    fn put(&self, session_id: &str, groups: Vec<Arc<ConvertedGroup>>) {
+        let bytes: usize = groups.iter().map(|g| g.size).sum();
+        let mut sessions = self.sessions.lock();
+        if let Some(old) = sessions.map.remove(session_id) {
+            sessions.total_bytes -= old.bytes;
+        }
+        // 单个会话超出预算时不缓存，避免挤掉所有其他会话
+        if bytes > self.max_bytes {
+            return;
+        }
+
+        while sessions.map.len() >= self.max_sessions
+            || sessions.total_bytes + bytes > self.max_bytes
+        {
+            let oldest = sessions
+                .map
+                .iter()
+                .min_by_key(|(_, s)| s.last_used)
+                .map(|(id, _)| id.clone());
+            let Some(evicted) = oldest.and_then(|id| sessions.map.remove(&id)) else {
+                break;
+            };
+            sessions.total_bytes -= evicted.bytes;
+        }
 
-        // 自动配对一个 "OK" 的 assistant 响应
-        let auto_assistant = HistoryAssistantMessage::new("OK");
-        history.push(Message::Assistant(auto_assistant));
+        sessions.total_bytes += bytes;
+        sessions.map.insert(
+            session_id.to_string(),
+            SessionHistory {
+                groups: Arc::new(groups),
+                bytes,
+                last_used: Instant::now(),
+            },
+        );
+    }
+}
+
+static SESSION_HISTORY_CACHE: OnceLock<SessionHistoryCache> = OnceLock::new();
+
+fn session_history_cache() -> &'static SessionHistoryCache {
+    SESSION_HISTORY_CACHE.get_or_init(|| {
+        SessionHistoryCache::new(SESSION_CACHE_MAX_SESSIONS, SESSION_CACHE_MAX_BYTES)
+    })
+}
+
+/// 消息角色：user 返回 `Some(true)`，assistant 返回 `Some(false)`，其他角色忽略
+fn role_is_user(role: &str) -> Option<bool> {
+    match role {
+        "user" => Some(true),
+        "assistant" => Some(false),
+        _ => None,
     }
+}
 
-    Ok(history)
+/// 计算源消息的前缀哈希，`hashes[i]` 覆盖 `messages[..i]`
+///
+/// 模型 ID 参与哈希，切换模型后不会复用旧的转换结果。
+/// 每轮都要校验完整历史，使用 `FastHasher` 降低长文本与图片的哈希开销
+fn prefix_hashes(messages: &[super::types::Message], model_id: &str) -> Vec<u64> {
+    let mut hashes = Vec::with_capacity(messages.len() + 1);
+    let mut hasher = FastHasher::default();
+    model_id.hash(&mut hasher);
+    hashes.push(hasher.finish());
+
+    for msg in messages {
+        msg.role.hash(&mut hasher);
+        hash_json_value(&msg.content, &mut hasher);
+        hashes.push(hasher.finish());
+    }
+
+    hashes
+}
+
+/// 转换历史消息分组
+///
+/// 有 session ID 时复用该会话上一轮已转换的分组，只转换新增的尾部消息；
+/// 转换结果再写回缓存供下一轮使用
+fn convert_history_groups(
+    messages: &[super::types::Message],
+    model_id: &str,
+    session_id: Option<&str>,
+) -> Result<Vec<Arc<ConvertedGroup>>, ConversionError> {
+    let Some(session_id) = session_id else {
+        return convert_message_groups(messages, 0, model_id, &[]);
+    };
+
+    let prefix_hashes = prefix_hashes(messages, model_id);
+    let cache = session_history_cache();
+    let cached = cache.get(session_id);
+
+    // 复用前缀哈希一致的分组（哈希链保证之前的分组也一致）
+    let mut groups: Vec<Arc<ConvertedGroup>> = cached
+        .iter()
+        .flat_map(|cached| cached.iter())
+        .take_while(|g| prefix_hashes.get(g.end) == Some(&g.prefix_hash))
+        .cloned()
+        .collect();
+
+    // 复用的最后一组之后紧跟同角色消息时，该组会继续合并，需要重新转换
+    if let Some(last) = groups.last() {
+        let next_is_user = messages[last.end..]
+            .iter()
+            .find_map(|m| role_is_user(&m.role));
+        if next_is_user == Some(last.is_user) {
+            groups.pop();
+        }
+    }
+
+    let reused = groups.len();
+    let start = groups.last().map_or(0, |g| g.end);
+    groups.extend(convert_message_groups(messages, start, model_id, &prefix_hashes)?);
+
+    // 最后一组可能在下一轮继续合并新消息，不写入缓存（复用的分组已确认闭合，仍然保留）
+    let keep = groups.len().saturating_sub(1).max(reused);
+    let unchanged = keep == reused && cached.as_ref().is_some_and(|c| c.len() == reused);
+    if !unchanged {
+        cache.put(session_id, groups[..keep].to_vec());
+    }
+
+    if reused > 0 {
+        tracing::debug!(
+            "会话 {} 复用 {} 个已转换的历史分组，新转换 {} 个",
+            session_id,
+            reused,
+            groups.len() - reused
+        );
+    }
+
+    Ok(groups)
+}
+
+/// 从 `start` 开始按角色分组转换源消息
+///
+/// 连续的 user 消息合并为一条，连续的 assistant 消息合并为一条，其他角色忽略
+fn convert_message_groups(
+    messages: &[super::types::Message],
+    start: usize,
+    model_id: &str,
+    prefix_hashes: &[u64],
+) -> Result<Vec<Arc<ConvertedGroup>>, ConversionError> {
+    let mut groups = Vec::new();
+    let mut buffer: Vec<&super::types::Message> = Vec::new();
+    let mut buffer_is_user = false;
+    let mut buffer_end = start;
+
+    for (i, msg) in messages.iter().enumerate().skip(start) {
+        let Some(is_user) = role_is_user(&msg.role) else {
+            continue;
+        };
+        if !buffer.is_empty() && is_user != buffer_is_user {
+            groups.push(convert_group(
+                &buffer,
+                buffer_is_user,
+                buffer_end,
+                model_id,
+                prefix_hashes,
+            )?);
+            buffer.clear();
+        }
+        buffer_is_user = is_user;
+        buffer_end = i + 1;
+        buffer.push(msg);
+    }
+
+    if !buffer.is_empty() {
+        groups.push(convert_group(
+            &buffer,
+            buffer_is_user,
+            buffer_end,
+            model_id,
+            prefix_hashes,
+        )?);
+    }
+
+    Ok(groups)
+}
+
+/// 转换单个分组
+fn convert_group(
+    buffer: &[&super::types::Message],
+    is_user: bool,
+    end: usize,
+    model_id: &str,
+    prefix_hashes: &[u64],
+) -> Result<Arc<ConvertedGroup>, ConversionError> {
+    let message = if is_user {
+        Message::User(merge_user_messages(buffer, model_id)?)
+    } else {
+        Message::Assistant(merge_assistant_messages(buffer)?)
+    };
+    let size = buffer.iter().map(|m| estimate_json_size(&m.content)).sum();
+
+    Ok(Arc::new(ConvertedGroup {
+        end,
+        prefix_hash: prefix_hashes.get(end).copied().unwrap_or_default(),
+        is_user,
+        size,
+        message: Arc::new(message),
+    }))
 }
 
 /// 合并多个 user 消息
@@ -920,13 +1210,13 @@ mod tests {
         ]);
 
         let history = vec![
-            Message::User(HistoryUserMessage::new(
+            Arc::new(Message::User(HistoryUserMessage::new(
                 "Read the file",
                 "claude-sonnet-4.5",
-            )),
-            Message::Assistant(HistoryAssistantMessage {
+            ))),
+            Arc::new(Message::Assistant(HistoryAssistantMessage {
                 assistant_response_message: assistant_msg,
-            }),
+            })),
         ];
 
         let tool_names = collect_history_tool_names(&history);
@@ -1099,8 +1389,13 @@ mod tests {
         // 测试孤立的 tool_result 被过滤
         // 历史中没有 tool_use，但 tool_results 中有 tool_result
         let history = vec![
-            Message::User(HistoryUserMessage::new("Hello", "claude-sonnet-4.5")),
-            Message::Assistant(HistoryAssistantMessage::new("Hi there!")),
+            Arc::new(Message::User(HistoryUserMessage::new(
+                "Hello",
+                "claude-sonnet-4.5",
+            ))),
+            Arc::new(Message::Assistant(HistoryAssistantMessage::new(
+                "Hi there!",
+            ))),
         ];
 
         let tool_results = vec![ToolResult::success("orphan-123", "some result")];
@@ -1123,13 +1418,13 @@ mod tests {
         ]);
 
         let history = vec![
-            Message::User(HistoryUserMessage::new(
+            Arc::new(Message::User(HistoryUserMessage::new(
                 "Read the file",
                 "claude-sonnet-4.5",
-            )),
-            Message::Assistant(HistoryAssistantMessage {
+            ))),
+            Arc::new(Message::Assistant(HistoryAssistantMessage {
                 assistant_response_message: assistant_msg,
-            }),
+            })),
         ];
 
         // 没有 tool_result
@@ -1155,13 +1450,13 @@ mod tests {
         ]);
 
         let history = vec![
-            Message::User(HistoryUserMessage::new(
+            Arc::new(Message::User(HistoryUserMessage::new(
                 "Read the file",
                 "claude-sonnet-4.5",
-            )),
-            Message::Assistant(HistoryAssistantMessage {
+            ))),
+            Arc::new(Message::Assistant(HistoryAssistantMessage {
                 assistant_response_message: assistant_msg,
-            }),
+            })),
         ];
 
         let tool_results = vec![ToolResult::success("tool-1", "file content")];
@@ -1186,10 +1481,13 @@ mod tests {
         ]);
 
         let history = vec![
-            Message::User(HistoryUserMessage::new("Do something", "claude-sonnet-4.5")),
-            Message::Assistant(HistoryAssistantMessage {
+            Arc::new(Message::User(HistoryUserMessage::new(
+                "Do something",
+                "claude-sonnet-4.5",
+            ))),
+            Arc::new(Message::Assistant(HistoryAssistantMessage {
                 assistant_response_message: assistant_msg,
-            }),
+            })),
         ];
 
         // tool_results: tool-1 配对，tool-3 孤立
@@ -1227,20 +1525,22 @@ mod tests {
 
         let history = vec![
             // 第一轮：用户请求
-            Message::User(HistoryUserMessage::new(
+            Arc::new(Message::User(HistoryUserMessage::new(
                 "Read the file",
                 "claude-sonnet-4.5",
-            )),
+            ))),
             // 第一轮：assistant 使用工具
-            Message::Assistant(HistoryAssistantMessage {
+            Arc::new(Message::Assistant(HistoryAssistantMessage {
                 assistant_response_message: assistant_msg1,
-            }),
+            })),
             // 第二轮：用户返回工具结果（历史中已配对）
-            Message::User(HistoryUserMessage {
+            Arc::new(Message::User(HistoryUserMessage {
                 user_input_message: user_msg_with_result,
-            }),
+            })),
             // 第二轮：assistant 响应
-            Message::Assistant(HistoryAssistantMessage::new("The file contains...")),
+            Arc::new(Message::Assistant(HistoryAssistantMessage::new(
+                "The file contains...",
+            ))),
         ];
 
         // 当前消息没有 tool_results（用户只是继续对话）
@@ -1272,17 +1572,17 @@ mod tests {
         user_msg_with_result = user_msg_with_result.with_context(ctx);
 
         let history = vec![
-            Message::User(HistoryUserMessage::new(
+            Arc::new(Message::User(HistoryUserMessage::new(
                 "Read the file",
                 "claude-sonnet-4.5",
-            )),
-            Message::Assistant(HistoryAssistantMessage {
+            ))),
+            Arc::new(Message::Assistant(HistoryAssistantMessage {
                 assistant_response_message: assistant_msg,
-            }),
-            Message::User(HistoryUserMessage {
+            })),
+            Arc::new(Message::User(HistoryUserMessage {
                 user_input_message: user_msg_with_result,
-            }),
-            Message::Assistant(HistoryAssistantMessage::new("Done")),
+            })),
+            Arc::new(Message::Assistant(HistoryAssistantMessage::new("Done"))),
         ];
 
         // 当前消息又发送了相同的 tool_result（重复）
@@ -1372,10 +1672,13 @@ mod tests {
         ]);
 
         let mut history = vec![
-            Message::User(HistoryUserMessage::new("Do something", "claude-sonnet-4.5")),
-            Message::Assistant(HistoryAssistantMessage {
+            Arc::new(Message::User(HistoryUserMessage::new(
+                "Do something",
+                "claude-sonnet-4.5",
+            ))),
+            Arc::new(Message::Assistant(HistoryAssistantMessage {
                 assistant_response_message: assistant_msg,
-            }),
+            })),
         ];
 
         // 移除 tool-1 和 tool-3
@@ -1386,7 +1689,7 @@ mod tests {
         remove_orphaned_tool_uses(&mut history, &orphaned);
 
         // 验证只剩下 tool-2
-        if let Message::Assistant(ref assistant_msg) = history[1] {
+        if let Message::Assistant(ref assistant_msg) = *history[1] {
             let tool_uses = assistant_msg
                 .assistant_response_message
                 .tool_uses
@@ -1410,10 +1713,13 @@ mod tests {
         ]);
 
         let mut history = vec![
-            Message::User(HistoryUserMessage::new("Do something", "claude-sonnet-4.5")),
-            Message::Assistant(HistoryAssistantMessage {
+            Arc::new(Message::User(HistoryUserMessage::new(
+                "Do something",
+                "claude-sonnet-4.5",
+            ))),
+            Arc::new(Message::Assistant(HistoryAssistantMessage {
                 assistant_response_message: assistant_msg,
-            }),
+            })),
         ];
 
         let mut orphaned = std::collections::HashSet::new();
@@ -1422,7 +1728,7 @@ mod tests {
         remove_orphaned_tool_uses(&mut history, &orphaned);
 
         // 验证 tool_uses 变为 None
-        if let Message::Assistant(ref assistant_msg) = history[1] {
+        if let Message::Assistant(ref assistant_msg) = *history[1] {
             assert!(
                 assistant_msg.assistant_response_message.tool_uses.is_none(),
                 "移除所有 tool_use 后应为 None"
@@ -1516,7 +1822,7 @@ mod tests {
         let state = result.unwrap().conversation_state;
         let mut found_tool_use = false;
         for msg in &state.history {
-            if let Message::Assistant(assistant_msg) = msg {
+            if let Message::Assistant(assistant_msg) = msg.as_ref() {
                 if let Some(ref tool_uses) = assistant_msg.assistant_response_message.tool_uses {
                     if tool_uses.iter().any(|t| t.tool_use_id == "toolu_01XYZ") {
                         found_tool_use = true;
@@ -1527,4 +1833,189 @@ mod tests {
         }
         assert!(found_tool_use, "合并后的 assistant 消息应包含 tool_use");
     }
+
+    fn session_request(
+        session_id: Option<&str>,
+        messages: &[(&str, serde_json::Value)],
+    ) -> MessagesRequest {
+        use super::super::types::{Message as AnthropicMessage, Metadata};
+
+        MessagesRequest {
+            model: "claude-sonnet-4".to_string(),
+            max_tokens: 1024,
+            messages: messages
+                .iter()
+                .map(|(role, content)| AnthropicMessage {
+                    role: role.to_string(),
+                    content: content.clone(),
+                })
+                .collect(),
+            stream: false,
+            system: None,
+            tools: None,
+            tool_choice: None,
+            thinking: None,
+            output_config: None,
+            metadata: session_id.map(|id| Metadata {
+                user_id: Some(format!("user_xxx_account__session_{}", id)),
+            }),
+        }
+    }
+
+    /// 带会话缓存转换的历史应与不带缓存完全一致
+    fn assert_history_matches_uncached(session_id: &str, messages: &[(&str, serde_json::Value)]) {
+        let cached = convert_request(&session_request(Some(session_id), messages)).unwrap();
+        let uncached = convert_request(&session_request(None, messages)).unwrap();
+        assert_eq!(
+            serde_json::to_value(&cached.conversation_state.history).unwrap(),
+            serde_json::to_value(&uncached.conversation_state.history).unwrap()
+        );
+    }
+
+    #[test]
+    fn test_session_history_cache_reuses_prefix() {
+        let session_id = Uuid::new_v4().to_string();
+        let mut messages = vec![
+            ("user", serde_json::json!("第一轮")),
+            ("assistant", serde_json::json!("回复一")),
+            ("user", serde_json::json!("第二轮")),
+        ];
+        assert_history_matches_uncached(&session_id, &messages);
+
+        messages.push(("assistant", serde_json::json!("回复二")));
+        messages.push(("user", serde_json::json!("第三轮")));
+        assert_history_matches_uncached(&session_id, &messages);
+
+        // 上一轮写入缓存的闭合分组：user、assistant、user（最后的 assistant 分组不缓存）
+        let cached = session_history_cache().get(&session_id).unwrap();
+        assert_eq!(cached.len(), 3);
+        assert!(cached[0].is_user && !cached[1].is_user && cached[2].is_user);
+    }
+
+    #[test]
+    fn test_session_history_cache_regroups_consecutive_messages() {
+        let session_id = Uuid::new_v4().to_string();
+        let mut messages = vec![
+            ("user", serde_json::json!("a")),
+            ("assistant", serde_json::json!("b")),
+            ("user", serde_json::json!("c")),
+            ("user", serde_json::json!("d")),
+        ];
+        assert_history_matches_uncached(&session_id, &messages);
+
+        // 连续 user 消息会与上一轮的尾部分组合并
+        messages.push(("user", serde_json::json!("e")));
+        assert_history_matches_uncached(&session_id, &messages);
+
+        messages.push(("assistant", serde_json::json!("f")));
+        messages.push(("assistant", serde_json::json!("g")));
+        messages.push(("user", serde_json::json!("h")));
+        assert_history_matches_uncached(&session_id, &messages);
+    }
+
+    #[test]
+    fn test_session_history_cache_detects_edited_history() {
+        let session_id = Uuid::new_v4().to_string();
+        let mut messages = vec![
+            ("user", serde_json::json!("原始问题")),
+            ("assistant", serde_json::json!("原始回复")),
+            ("user", serde_json::json!("追问")),
+            ("assistant", serde_json::json!("再次回复")),
+            ("user", serde_json::json!("继续")),
+        ];
+        assert_history_matches_uncached(&session_id, &messages);
+
+        // 客户端改写了较早的历史，缓存不应被复用
+        messages[1] = ("assistant", serde_json::json!("被改写的回复"));
+        assert_history_matches_uncached(&session_id, &messages);
+
+        // 回退到更短的对话
+        messages.truncate(3);
+        assert_history_matches_uncached(&session_id, &messages);
+    }
+
+    #[test]
+    fn test_session_history_cache_shares_converted_messages() {
+        let session_id = Uuid::new_v4().to_string();
+        let messages = vec![
+            ("user", serde_json::json!("第一轮")),
+            ("assistant", serde_json::json!("回复一")),
+            ("user", serde_json::json!("第二轮")),
+            ("assistant", serde_json::json!("回复二")),
+            ("user", serde_json::json!("第三轮")),
+        ];
+        convert_request(&session_request(Some(&session_id), &messages)).unwrap();
+        let result = convert_request(&session_request(Some(&session_id), &messages)).unwrap();
+
+        // 输出的历史与缓存引用同一份转换结果，而不是深拷贝
+        let cached = session_history_cache().get(&session_id).unwrap();
+        let history = &result.conversation_state.history;
+        assert!(
+            cached
+                .iter()
+                .zip(history)
+                .all(|(g, m)| Arc::ptr_eq(&g.message, m))
+        );
+    }
+
+    #[test]
+    fn test_session_history_cache_evicts_by_bytes() {
+        let group = |size: usize| {
+            Arc::new(ConvertedGroup {
+                end: 1,
+                prefix_hash: 0,
+                is_user: true,
+                size,
+                message: Arc::new(Message::Assistant(HistoryAssistantMessage::new("x"))),
+            })
+        };
+        let cache = SessionHistoryCache::new(16, 1000);
+
+        cache.put("a", vec![group(400)]);
+        cache.put("b", vec![group(400)]);
+        cache.get("a");
+        // 超出预算：淘汰最久未使用的 b
+        cache.put("c", vec![group(400)]);
+        assert!(cache.get("a").is_some());
+        assert!(cache.get("b").is_none());
+        assert!(cache.get("c").is_some());
+        assert_eq!(cache.sessions.lock().total_bytes, 800);
+
+        // 更新已有会话时按新大小重新计算
+        cache.put("a", vec![group(100)]);
+        assert_eq!(cache.sessions.lock().total_bytes, 500);
+
+        // 单个会话超出预算时不缓存
+        cache.put("d", vec![group(2000)]);
+        assert!(cache.get("d").is_none());
+        assert_eq!(cache.sessions.lock().map.len(), 2);
+    }
+
+    #[test]
+    fn test_convert_tools_uses_cache() {
+        let tool: super::super::types::Tool = serde_json::from_value(serde_json::json!({
+            "name": "Write",
+            "description": "Write a file",
+            "input_schema": {"type": "object", "properties": {"path": {"type": "string"}}, "required": null}
+        }))
+        .unwrap();
+        let tools = Some(vec![tool]);
+
+        let first = convert_tools(&tools);
+        let second = convert_tools(&tools);
+        assert_eq!(
+            serde_json::to_value(&first).unwrap(),
+            serde_json::to_value(&second).unwrap()
+        );
+        assert!(
+            first[0]
+                .tool_specification
+                .description
+                .ends_with(WRITE_TOOL_DESCRIPTION_SUFFIX)
+        );
+        assert_eq!(
+            first[0].tool_specification.input_schema.json["required"],
+            serde_json::json!([])
+        );
+    }
 }
@@ -3,9 +3,11 @@
 use std::convert::Infallible;
 
 use anyhow::Error;
+use crate::common::metrics::metrics;
 use crate::kiro::model::events::Event;
 use crate::kiro::model::requests::kiro::KiroRequest;
 use crate::kiro::parser::decoder::EventStreamDecoder;
+use crate::kiro::provider::ApiResponse;
 use crate::token;
 use axum::{
     Json as JsonExtractor,
@@ -23,7 +25,7 @@ use uuid::Uuid;
 
 use super::converter::{ConversionError, convert_request};
 use super::middleware::AppState;
-use super::stream::{BufferedStreamContext, SseEvent, StreamContext};
+use super::stream::{BufferedStreamContext, SseCoalesceConfig, SseEncoder, SseEvent, StreamContext};
 use super::types::{CountTokensRequest, CountTokensResponse, ErrorResponse, MessagesRequest, Model, ModelsResponse, OutputConfig, Thinking};
 use super::websearch;
 
@@ -229,11 +231,12 @@ pub async fn post_messages(
 
         // 估算输入 tokens
         let input_tokens = token::count_all_tokens(
-            payload.model.clone(),
-            payload.system.clone(),
-            payload.messages.clone(),
-            payload.tools.clone(),
-        ) as i32;
+            &payload.model,
+            payload.system.as_deref(),
+            &payload.messages,
+            payload.tools.as_deref(),
+        )
+        .await as i32;
 
         return websearch::handle_websearch_request(provider, &payload, input_tokens).await;
     }
@@ -284,11 +287,12 @@ pub async fn post_messages(
 
     // 估算输入 tokens
     let input_tokens = token::count_all_tokens(
-        payload.model.clone(),
-        payload.system,
-        payload.messages,
-        payload.tools,
-    ) as i32;
+        &payload.model,
+        payload.system.as_deref(),
+        &payload.messages,
+        payload.tools.as_deref(),
+    )
+    .await as i32;
 
     // 检查是否启用了thinking
     let thinking_enabled = payload
@@ -305,6 +309,7 @@ pub async fn post_messages(
             &payload.model,
             input_tokens,
             thinking_enabled,
+            state.sse_coalesce,
         )
         .await
     } else {
@@ -320,6 +325,7 @@ async fn handle_stream_request(
     model: &str,
     input_tokens: i32,
     thinking_enabled: bool,
+    sse_coalesce: SseCoalesceConfig,
 ) -> Response {
     // 调用 Kiro API（支持多凭据故障转移）
     let response = match provider.call_api_stream(request_body).await {
@@ -334,7 +340,12 @@ async fn handle_stream_request(
     let initial_events = ctx.generate_initial_events();
 
     // 创建 SSE 流
-    let stream = create_sse_stream(response, ctx, initial_events);
+    let stream = instrument_sse_stream(create_sse_stream(
+        response,
+        ctx,
+        initial_events,
+        sse_coalesce,
+    ));
 
     // 返回 SSE 响应
     Response::builder()
@@ -354,94 +365,131 @@ fn create_ping_sse() -> Bytes {
     Bytes::from("event: ping\ndata: {\"type\": \"ping\"}\n\n")
 }
 
+/// 为 SSE 流附加指标：流数量、活跃流数、写出次数与字节数
+///
+/// 活跃流计数守卫随流一起释放，客户端中途断开时同样会减少
+fn instrument_sse_stream(
+    stream: impl Stream<Item = Result<Bytes, Infallible>>,
+) -> impl Stream<Item = Result<Bytes, Infallible>> {
+    let m = metrics();
+    m.sse_streams.inc();
+    let active = m.sse_streams_active.track();
+    stream.inspect(move |item| {
+        let _active = &active;
+        if let Ok(bytes) = item {
+            m.sse_writes.inc();
+            m.sse_bytes.add(bytes.len() as u64);
+        }
+    })
+}
+
 /// 创建 SSE 事件流
+///
+/// 同一上游 chunk 产生的事件编码为一次写入；启用增量合并时，
+/// 输出会在合并窗口内累积，直到窗口到期、达到字节上限或发送 ping
 fn create_sse_stream(
-    response: reqwest::Response,
+    response: ApiResponse,
     ctx: StreamContext,
     initial_events: Vec<SseEvent>,
+    sse_coalesce: SseCoalesceConfig,
 ) -> impl Stream<Item = Result<Bytes, Infallible>> {
     // 先发送初始事件
-    let initial_stream = stream::iter(
-        initial_events
-            .into_iter()
-            .map(|e| Ok(Bytes::from(e.to_sse_string()))),
-    );
+    let mut encoder = SseEncoder::new(sse_coalesce);
+    for event in &initial_events {
+        encoder.push(event);
+    }
+    let initial_stream = stream::iter(encoder.take().map(Ok));
 
     // 然后处理 Kiro 响应流，同时每25秒发送 ping 保活
     let body_stream = response.bytes_stream();
 
     let processing_stream = stream::unfold(
-        (body_stream, ctx, EventStreamDecoder::new(), false, interval(Duration::from_secs(PING_INTERVAL_SECS))),
-        |(mut body_stream, mut ctx, mut decoder, finished, mut ping_interval)| async move {
+        (
+            body_stream,
+            ctx,
+            EventStreamDecoder::new(),
+            encoder,
+            false,
+            interval(Duration::from_secs(PING_INTERVAL_SECS)),
+        ),
+        |(mut body_stream, mut ctx, mut decoder, mut encoder, finished, mut ping_interval)| async move {
             if finished {
                 return None;
             }
 
-            // 使用 select! 同时等待数据和 ping 定时器
-            tokio::select! {
-                // 处理数据流
-                chunk_result = body_stream.next() => {
-                    match chunk_result {
-                        Some(Ok(chunk)) => {
-                            // 解码事件
-                            if let Err(e) = decoder.feed(&chunk) {
-                                tracing::warn!("缓冲区溢出: {}", e);
-                            }
+            loop {
+                // 合并窗口到期时输出缓冲内容（未启用合并时该分支不会触发）
+                let flush_deadline = encoder.flush_deadline();
+                let flush_at = flush_deadline.unwrap_or_else(std::time::Instant::now);
 
-                            let mut events = Vec::new();
-                            for result in decoder.decode_iter() {
-                                match result {
-                                    Ok(frame) => {
-                                        if let Ok(event) = Event::from_frame(frame) {
-                                            let sse_events = ctx.process_kiro_event(&event);
-                                            events.extend(sse_events);
+                // 使用 select! 同时等待数据、合并窗口和 ping 定时器
+                tokio::select! {
+                    // 处理数据流
+                    chunk_result = body_stream.next() => {
+                        match chunk_result {
+                            Some(Ok(chunk)) => {
+                                // 解码事件
+                                if let Err(e) = decoder.feed(&chunk) {
+                                    tracing::warn!("缓冲区溢出: {}", e);
+                                }
+
+                                for result in decoder.decode_iter() {
+                                    match result {
+                                        Ok(frame) => {
+                                            if let Ok(event) = Event::from_frame(frame) {
+                                                for sse_event in ctx.process_kiro_event(&event) {
+                                                    encoder.push(&sse_event);
+                                                }
+                                            }
+                                        }
+                                        Err(e) => {
+                                            tracing::warn!("解码事件失败: {}", e);
                                         }
                                     }
-                                    Err(e) => {
-                                        tracing::warn!("解码事件失败: {}", e);
+                                }
+
+                                if encoder.should_flush() {
+                                    if let Some(bytes) = encoder.take() {
+                                        return Some((Ok(bytes), (body_stream, ctx, decoder, encoder, false, ping_interval)));
                                     }
                                 }
                             }
-
-                            // 转换为 SSE 字节流
-                            let bytes: Vec<Result<Bytes, Infallible>> = events
-                                .into_iter()
-                                .map(|e| Ok(Bytes::from(e.to_sse_string())))
-                                .collect();
-
-                            Some((stream::iter(bytes), (body_stream, ctx, decoder, false, ping_interval)))
-                        }
-                        Some(Err(e)) => {
-                            tracing::error!("读取响应流失败: {}", e);
-                            // 发送最终事件并结束
-                            let final_events = ctx.generate_final_events();
-                            let bytes: Vec<Result<Bytes, Infallible>> = final_events
-                                .into_iter()
-                                .map(|e| Ok(Bytes::from(e.to_sse_string())))
-                                .collect();
-                            Some((stream::iter(bytes), (body_stream, ctx, decoder, true, ping_interval)))
+                            Some(Err(e)) => {
+                                tracing::error!("读取响应流失败: {}", e);
+                                // 发送最终事件并结束
+                                for event in &ctx.generate_final_events() {
+                                    encoder.push(event);
+                                }
+                                let bytes = encoder.take().unwrap_or_default();
+                                return Some((Ok(bytes), (body_stream, ctx, decoder, encoder, true, ping_interval)));
+                            }
+                            None => {
+                                // 流结束，发送最终事件
+                                for event in &ctx.generate_final_events() {
+                                    encoder.push(event);
+                                }
+                                let bytes = encoder.take().unwrap_or_default();
+                                return Some((Ok(bytes), (body_stream, ctx, decoder, encoder, true, ping_interval)));
+                            }
                         }
-                        None => {
-                            // 流结束，发送最终事件
-                            let final_events = ctx.generate_final_events();
-                            let bytes: Vec<Result<Bytes, Infallible>> = final_events
-                                .into_iter()
-                                .map(|e| Ok(Bytes::from(e.to_sse_string())))
-                                .collect();
-                            Some((stream::iter(bytes), (body_stream, ctx, decoder, true, ping_interval)))
+                    }
+                    // 合并窗口到期
+                    _ = tokio::time::sleep_until(flush_at.into()), if flush_deadline.is_some() => {
+                        if let Some(bytes) = encoder.take() {
+                            return Some((Ok(bytes), (body_stream, ctx, decoder, encoder, false, ping_interval)));
                         }
                     }
-                }
-                // 发送 ping 保活
-                _ = ping_interval.tick() => {
-                    tracing::trace!("发送 ping 保活事件");
-                    let bytes: Vec<Result<Bytes, Infallible>> = vec![Ok(create_ping_sse())];
-                    Some((stream::iter(bytes), (body_stream, ctx, decoder, false, ping_interval)))
+                    // 发送 ping 保活（连同尚未输出的增量一起写出）
+                    _ = ping_interval.tick() => {
+                        tracing::trace!("发送 ping 保活事件");
+                        encoder.push_raw(&create_ping_sse());
+                        let bytes = encoder.take().unwrap_or_default();
+                        return Some((Ok(bytes), (body_stream, ctx, decoder, encoder, false, ping_interval)));
+                    }
                 }
             }
         },
-    )
-    .flatten();
+    );
 
     initial_stream.chain(processing_stream)
 }
@@ -660,11 +708,12 @@ pub async fn count_tokens(
     );
 
     let total_tokens = token::count_all_tokens(
-        payload.model,
-        payload.system,
-        payload.messages,
-        payload.tools,
-    ) as i32;
+        &payload.model,
+        payload.system.as_deref(),
+        &payload.messages,
+        payload.tools.as_deref(),
+    )
+    .await as i32;
 
     Json(CountTokensResponse {
         input_tokens: total_tokens.max(1) as i32,
@@ -713,11 +762,12 @@ pub async fn post_messages_cc(
 
         // 估算输入 tokens
         let input_tokens = token::count_all_tokens(
-            payload.model.clone(),
-            payload.system.clone(),
-            payload.messages.clone(),
-            payload.tools.clone(),
-        ) as i32;
+            &payload.model,
+            payload.system.as_deref(),
+            &payload.messages,
+            payload.tools.as_deref(),
+        )
+        .await as i32;
 
         return websearch::handle_websearch_request(provider, &payload, input_tokens).await;
     }
@@ -768,11 +818,12 @@ pub async fn post_messages_cc(
 
     // 估算输入 tokens
     let input_tokens = token::count_all_tokens(
-        payload.model.clone(),
-        payload.system,
-        payload.messages,
-        payload.tools,
-    ) as i32;
+        &payload.model,
+        payload.system.as_deref(),
+        &payload.messages,
+        payload.tools.as_deref(),
+    )
+    .await as i32;
 
     // 检查是否启用了thinking
     let thinking_enabled = payload
@@ -789,6 +840,7 @@ pub async fn post_messages_cc(
             &payload.model,
             input_tokens,
             thinking_enabled,
+            state.sse_coalesce,
         )
         .await
     } else {
@@ -807,6 +859,7 @@ async fn handle_stream_request_buffered(
     model: &str,
     estimated_input_tokens: i32,
     thinking_enabled: bool,
+    sse_coalesce: SseCoalesceConfig,
 ) -> Response {
     // 调用 Kiro API（支持多凭据故障转移）
     let response = match provider.call_api_stream(request_body).await {
@@ -818,7 +871,7 @@ async fn handle_stream_request_buffered(
     let ctx = BufferedStreamContext::new(model, estimated_input_tokens, thinking_enabled);
 
     // 创建缓冲 SSE 流
-    let stream = create_buffered_sse_stream(response, ctx);
+    let stream = instrument_sse_stream(create_buffered_sse_stream(response, ctx, sse_coalesce));
 
     // 返回 SSE 响应
     Response::builder()
@@ -838,8 +891,9 @@ async fn handle_stream_request_buffered(
 /// 3. 流结束后，用正确的 input_tokens 更正 message_start 事件
 /// 4. 一次性发送所有事件
 fn create_buffered_sse_stream(
-    response: reqwest::Response,
+    response: ApiResponse,
     ctx: BufferedStreamContext,
+    sse_coalesce: SseCoalesceConfig,
 ) -> impl Stream<Item = Result<Bytes, Infallible>> {
     let body_stream = response.bytes_stream();
 
@@ -848,10 +902,11 @@ fn create_buffered_sse_stream(
             body_stream,
             ctx,
             EventStreamDecoder::new(),
+            SseEncoder::new(sse_coalesce),
             false,
             interval(Duration::from_secs(PING_INTERVAL_SECS)),
         ),
-        |(mut body_stream, mut ctx, mut decoder, finished, mut ping_interval)| async move {
+        |(mut body_stream, mut ctx, mut decoder, mut encoder, finished, mut ping_interval)| async move {
             if finished {
                 return None;
             }
@@ -865,8 +920,7 @@ fn create_buffered_sse_stream(
                     // 优先检查 ping 保活（等待期间唯一发送的数据）
                     _ = ping_interval.tick() => {
                         tracing::trace!("发送 ping 保活事件（缓冲模式）");
-                        let bytes: Vec<Result<Bytes, Infallible>> = vec![Ok(create_ping_sse())];
-                        return Some((stream::iter(bytes), (body_stream, ctx, decoder, false, ping_interval)));
+                        return Some((Ok(create_ping_sse()), (body_stream, ctx, decoder, encoder, false, ping_interval)));
                     }
 
                     // 然后处理数据流
@@ -896,21 +950,19 @@ fn create_buffered_sse_stream(
                             Some(Err(e)) => {
                                 tracing::error!("读取响应流失败: {}", e);
                                 // 发生错误，完成处理并返回所有事件
-                                let all_events = ctx.finish_and_get_all_events();
-                                let bytes: Vec<Result<Bytes, Infallible>> = all_events
-                                    .into_iter()
-                                    .map(|e| Ok(Bytes::from(e.to_sse_string())))
-                                    .collect();
-                                return Some((stream::iter(bytes), (body_stream, ctx, decoder, true, ping_interval)));
+                                for event in &ctx.finish_and_get_all_events() {
+                                    encoder.push(event);
+                                }
+                                let bytes = encoder.take().unwrap_or_default();
+                                return Some((Ok(bytes), (body_stream, ctx, decoder, encoder, true, ping_interval)));
                             }
                             None => {
                                 // 流结束，完成处理并返回所有事件（已更正 input_tokens）
-                                let all_events = ctx.finish_and_get_all_events();
-                                let bytes: Vec<Result<Bytes, Infallible>> = all_events
-                                    .into_iter()
-                                    .map(|e| Ok(Bytes::from(e.to_sse_string())))
-                                    .collect();
-                                return Some((stream::iter(bytes), (body_stream, ctx, decoder, true, ping_interval)));
+                                for event in &ctx.finish_and_get_all_events() {
+                                    encoder.push(event);
+                                }
+                                let bytes = encoder.take().unwrap_or_default();
+                                return Some((Ok(bytes), (body_stream, ctx, decoder, encoder, true, ping_interval)));
                             }
                         }
                     }
@@ -918,5 +970,4 @@ fn create_buffered_sse_stream(
             }
         },
     )
-    .flatten()
 }
@@ -13,6 +13,7 @@ use axum::{
 use crate::common::auth;
 use crate::kiro::provider::KiroProvider;
 
+use super::stream::SseCoalesceConfig;
 use super::types::ErrorResponse;
 
 /// 应用共享状态
@@ -25,6 +26,8 @@ pub struct AppState {
     pub kiro_provider: Option<Arc<KiroProvider>>,
     /// Profile ARN（可选，用于请求）
     pub profile_arn: Option<String>,
+    /// SSE 增量合并配置
+    pub sse_coalesce: SseCoalesceConfig,
 }
 
 impl AppState {
@@ -34,6 +37,7 @@ impl AppState {
             api_key: api_key.into(),
             kiro_provider: None,
             profile_arn: None,
+            sse_coalesce: SseCoalesceConfig::default(),
         }
     }
 
@@ -48,6 +52,12 @@ impl AppState {
         self.profile_arn = Some(arn.into());
         self
     }
+
+    /// 设置 SSE 增量合并配置
+    pub fn with_sse_coalesce(mut self, coalesce: SseCoalesceConfig) -> Self {
+        self.sse_coalesce = coalesce;
+        self
+    }
 }
 
 /// API Key 认证中间件
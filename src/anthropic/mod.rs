@@ -22,12 +22,13 @@
 //! axum::serve(listener, app).await?;
 //! ```
 
-mod converter;
+pub mod converter;
 mod handlers;
 mod middleware;
 mod router;
-mod stream;
+pub mod stream;
 pub mod types;
 mod websearch;
 
 pub use router::create_router_with_provider;
+pub use stream::SseCoalesceConfig;
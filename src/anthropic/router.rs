@@ -12,6 +12,7 @@ use crate::kiro::provider::KiroProvider;
 use super::{
     handlers::{count_tokens, get_models, post_messages, post_messages_cc},
     middleware::{AppState, auth_middleware, cors_layer},
+    stream::SseCoalesceConfig,
 };
 
 /// 请求体最大大小限制 (50MB)
@@ -32,14 +33,16 @@ const MAX_BODY_SIZE: usize = 50 * 1024 * 1024;
 /// # 参数
 /// - `api_key`: API 密钥，用于验证客户端请求
 /// - `kiro_provider`: 可选的 KiroProvider，用于调用上游 API
+/// - `sse_coalesce`: 流式响应的 SSE 增量合并配置
 
 /// 创建带有 KiroProvider 的 Anthropic API 路由
 pub fn create_router_with_provider(
     api_key: impl Into<String>,
     kiro_provider: Option<KiroProvider>,
     profile_arn: Option<String>,
+    sse_coalesce: SseCoalesceConfig,
 ) -> Router {
-    let mut state = AppState::new(api_key);
+    let mut state = AppState::new(api_key).with_sse_coalesce(sse_coalesce);
     if let Some(provider) = kiro_provider {
         state = state.with_kiro_provider(provider);
     }
@@ -3,7 +3,11 @@
 //! 实现 Kiro → Anthropic 流式响应转换和 SSE 状态管理
 
 use std::collections::HashMap;
+use std::io::Write;
+use std::time::{Duration, Instant};
 
+use bytes::{BufMut, Bytes, BytesMut};
+use serde::Serialize;
 use serde_json::json;
 use uuid::Uuid;
 
@@ -187,12 +191,227 @@ impl SseEvent {
     }
 
     /// 格式化为 SSE 字符串
+    ///
+    /// 直接写入 `String` 的底层缓冲，不经过 `BytesMut`
     pub fn to_sse_string(&self) -> String {
-        format!(
-            "event: {}\ndata: {}\n\n",
-            self.event,
-            serde_json::to_string(&self.data).unwrap_or_default()
-        )
+        let mut buf = Vec::new();
+        write_sse_frame(&mut buf, &self.event, &self.data);
+        // 帧由 UTF-8 文本与 serde_json 输出组成，校验必定通过（只扫描，不复制）
+        String::from_utf8(buf).unwrap_or_default()
+    }
+
+    /// 将 SSE 帧直接序列化到 `buf` 末尾，不产生中间字符串
+    pub fn encode_into(&self, buf: &mut BytesMut) {
+        write_sse_frame((&mut *buf).writer(), &self.event, &self.data);
+    }
+}
+
+/// 写入一个 SSE 帧：`event: <name>\ndata: <json>\n\n`
+fn write_sse_frame<W: Write, T: Serialize + ?Sized>(mut out: W, event: &str, data: &T) {
+    // 写入内存缓冲不会产生 IO 错误，事件数据的序列化也不会失败
+    let _ = out.write_all(b"event: ");
+    let _ = out.write_all(event.as_bytes());
+    let _ = out.write_all(b"\ndata: ");
+    let _ = serde_json::to_writer(&mut out, data);
+    let _ = out.write_all(b"\n\n");
+}
+
+/// SSE 增量合并配置
+#[derive(Debug, Clone, Copy, Default)]
+pub struct SseCoalesceConfig {
+    /// 合并窗口，为零时不合并
+    pub window: Duration,
+    /// 缓冲字节上限，达到后立即输出
+    pub max_bytes: usize,
+}
+
+impl SseCoalesceConfig {
+    /// 是否启用合并
+    pub fn is_enabled(&self) -> bool {
+        !self.window.is_zero()
+    }
+}
+
+/// 可合并的增量类型
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+enum DeltaKind {
+    Text,
+    Thinking,
+}
+
+/// 等待合并的增量
+struct PendingDelta {
+    index: i64,
+    kind: DeltaKind,
+    text: String,
+}
+
+/// content_block_delta 帧（合并后的增量按此结构直接序列化）
+#[derive(Serialize)]
+struct ContentBlockDeltaFrame<'a> {
+    #[serde(rename = "type")]
+    event_type: &'static str,
+    index: i64,
+    delta: DeltaFrame<'a>,
+}
+
+#[derive(Serialize)]
+#[serde(tag = "type", rename_all = "snake_case")]
+enum DeltaFrame<'a> {
+    TextDelta { text: &'a str },
+    ThinkingDelta { thinking: &'a str },
+}
+
+/// 提取可合并增量的块索引、类型和文本
+fn mergeable_delta(event: &SseEvent) -> Option<(i64, DeltaKind, &str)> {
+    if event.event != "content_block_delta" {
+        return None;
+    }
+    let index = event.data.get("index")?.as_i64()?;
+    let delta = event.data.get("delta")?;
+    let (kind, field) = match delta.get("type")?.as_str()? {
+        "text_delta" => (DeltaKind::Text, "text"),
+        "thinking_delta" => (DeltaKind::Thinking, "thinking"),
+        _ => return None,
+    };
+    Some((index, kind, delta.get(field)?.as_str()?))
+}
+
+/// SSE 输出编码器
+///
+/// 事件直接编码到复用的 `BytesMut` 中，每次输出一个 `Bytes`，
+/// 一批事件只产生一次写入。
+///
+/// 启用合并时，同一内容块上连续的 text_delta / thinking_delta 会合并为一个事件，
+/// 直到合并窗口到期或缓冲达到字节上限才输出。
+pub struct SseEncoder {
+    buf: BytesMut,
+    coalesce: SseCoalesceConfig,
+    pending: Option<PendingDelta>,
+    /// 复用的增量文本缓冲
+    spare_text: String,
+    /// 当前缓冲中最早一条数据的写入时间
+    buffered_since: Option<Instant>,
+}
+
+impl SseEncoder {
+    /// 初始缓冲容量
+    const INITIAL_CAPACITY: usize = 4096;
+
+    pub fn new(coalesce: SseCoalesceConfig) -> Self {
+        Self {
+            buf: BytesMut::with_capacity(Self::INITIAL_CAPACITY),
+            coalesce,
+            pending: None,
+            spare_text: String::new(),
+            buffered_since: None,
+        }
+    }
+
+    /// 写入一个事件
+    pub fn push(&mut self, event: &SseEvent) {
+        self.mark_buffered();
+
+        if self.coalesce.is_enabled() {
+            if let Some((index, kind, text)) = mergeable_delta(event) {
+                if let Some(pending) = &mut self.pending {
+                    if pending.index == index && pending.kind == kind {
+                        pending.text.push_str(text);
+                        return;
+                    }
+                }
+                self.flush_pending();
+                let mut buffer = std::mem::take(&mut self.spare_text);
+                buffer.push_str(text);
+                self.pending = Some(PendingDelta {
+                    index,
+                    kind,
+                    text: buffer,
+                });
+                return;
+            }
+        }
+
+        self.flush_pending();
+        event.encode_into(&mut self.buf);
+    }
+
+    /// 写入已编码的 SSE 数据（如 ping）
+    pub fn push_raw(&mut self, bytes: &[u8]) {
+        self.mark_buffered();
+        self.flush_pending();
+        self.buf.extend_from_slice(bytes);
+    }
+
+    /// 缓冲中的（近似）字节数
+    pub fn buffered_len(&self) -> usize {
+        self.buf.len() + self.pending.as_ref().map_or(0, |p| p.text.len())
+    }
+
+    /// 合并窗口的截止时间；未启用合并或缓冲为空时返回 None
+    pub fn flush_deadline(&self) -> Option<Instant> {
+        if !self.coalesce.is_enabled() {
+            return None;
+        }
+        self.buffered_since
+            .map(|since| since + self.coalesce.window)
+    }
+
+    /// 是否应当立即输出缓冲内容
+    pub fn should_flush(&self) -> bool {
+        if self.buffered_since.is_none() {
+            return false;
+        }
+        match self.flush_deadline() {
+            None => true,
+            Some(deadline) => {
+                self.buffered_len() >= self.coalesce.max_bytes || Instant::now() >= deadline
+            }
+        }
+    }
+
+    /// 取出缓冲内容；缓冲为空时返回 None
+    pub fn take(&mut self) -> Option<Bytes> {
+        self.flush_pending();
+        self.buffered_since = None;
+        if self.buf.is_empty() {
+            return None;
+        }
+        let bytes = self.buf.split().freeze();
+        // 已输出的 Bytes 仍被下游持有时，reserve 会重新分配；否则复用原有内存
+        self.buf.reserve(Self::INITIAL_CAPACITY);
+        Some(bytes)
+    }
+
+    fn mark_buffered(&mut self) {
+        if self.buffered_since.is_none() {
+            self.buffered_since = Some(Instant::now());
+        }
+    }
+
+    /// 将等待合并的增量编码到缓冲区
+    fn flush_pending(&mut self) {
+        let Some(pending) = self.pending.take() else {
+            return;
+        };
+        let delta = match pending.kind {
+            DeltaKind::Text => DeltaFrame::TextDelta {
+                text: &pending.text,
+            },
+            DeltaKind::Thinking => DeltaFrame::ThinkingDelta {
+                thinking: &pending.text,
+            },
+        };
+        let frame = ContentBlockDeltaFrame {
+            event_type: "content_block_delta",
+            index: pending.index,
+            delta,
+        };
+        write_sse_frame((&mut self.buf).writer(), "content_block_delta", &frame);
+
+        let mut text = pending.text;
+        text.clear();
+        self.spare_text = text;
     }
 }
 
@@ -639,29 +858,52 @@ impl StreamContext {
     }
 
     /// 处理包含thinking块的内容
+    ///
+    /// 增量扫描：`thinking_buffer` 只保存上一轮无法判定的尾部内容
+    /// （可能是被截断的标签、等待 `\n\n` 的结束标签或仅含空白的前缀），
+    /// 新内容只在存在残留时才拼接，已判定的内容直接按切片发出，不再重建缓冲区。
     fn process_content_with_thinking(&mut self, content: &str) -> Vec<SseEvent> {
         let mut events = Vec::new();
 
-        // 将内容添加到缓冲区进行处理
-        self.thinking_buffer.push_str(content);
+        let mut pending = std::mem::take(&mut self.thinking_buffer);
+        if pending.is_empty() {
+            // 没有残留时直接扫描本次内容，只把未判定的尾部存入缓冲区
+            let consumed = self.scan_thinking_content(content, &mut events);
+            pending.push_str(&content[consumed..]);
+        } else {
+            pending.push_str(content);
+            let consumed = self.scan_thinking_content(&pending, &mut events);
+            pending.drain(..consumed);
+        }
+        self.thinking_buffer = pending;
+
+        events
+    }
+
+    /// 扫描 thinking 模式下的内容并生成事件
+    ///
+    /// 返回已处理的字节数，`buffer[consumed..]` 需要保留到下一轮继续判定
+    fn scan_thinking_content(&mut self, buffer: &str, events: &mut Vec<SseEvent>) -> usize {
+        let mut pos = 0;
 
         loop {
+            let rest = &buffer[pos..];
+
             if !self.in_thinking_block && !self.thinking_extracted {
                 // 查找 <thinking> 开始标签（跳过被反引号包裹的）
-                if let Some(start_pos) = find_real_thinking_start_tag(&self.thinking_buffer) {
+                if let Some(start_pos) = find_real_thinking_start_tag(rest) {
                     // 发送 <thinking> 之前的内容作为 text_delta
                     // 注意：如果前面只是空白字符（如 adaptive 模式返回的 \n\n），则跳过，
                     // 避免在 thinking 块之前产生无意义的 text 块导致客户端解析失败
-                    let before_thinking = self.thinking_buffer[..start_pos].to_string();
-                    if !before_thinking.is_empty() && !before_thinking.trim().is_empty() {
-                        events.extend(self.create_text_delta_events(&before_thinking));
+                    let before_thinking = &rest[..start_pos];
+                    if !before_thinking.trim().is_empty() {
+                        events.extend(self.create_text_delta_events(before_thinking));
                     }
 
                     // 进入 thinking 块
                     self.in_thinking_block = true;
                     self.strip_thinking_leading_newline = true;
-                    self.thinking_buffer =
-                        self.thinking_buffer[start_pos + "<thinking>".len()..].to_string();
+                    pos += start_pos + "<thinking>".len();
 
                     // 创建 thinking 块的 content_block_start 事件
                     let thinking_index = self.state_manager.next_block_index();
@@ -682,21 +924,18 @@ impl StreamContext {
                 } else {
                     // 没有找到 <thinking>，检查是否可能是部分标签
                     // 保留可能是部分标签的内容
-                    let target_len = self
-                        .thinking_buffer
-                        .len()
-                        .saturating_sub("<thinking>".len());
-                    let safe_len = find_char_boundary(&self.thinking_buffer, target_len);
+                    let target_len = rest.len().saturating_sub("<thinking>".len());
+                    let safe_len = find_char_boundary(rest, target_len);
                     if safe_len > 0 {
-                        let safe_content = self.thinking_buffer[..safe_len].to_string();
+                        let safe_content = &rest[..safe_len];
                         // 如果 thinking 尚未提取，且安全内容只是空白字符，
                         // 则不发送为 text_delta，继续保留在缓冲区等待更多内容。
                         // 这避免了 4.6 模型中 <thinking> 标签跨事件分割时，
                         // 前导空白（如 "\n\n"）被错误地创建为 text 块，
                         // 导致 text 块先于 thinking 块出现的问题。
-                        if !safe_content.is_empty() && !safe_content.trim().is_empty() {
-                            events.extend(self.create_text_delta_events(&safe_content));
-                            self.thinking_buffer = self.thinking_buffer[safe_len..].to_string();
+                        if !safe_content.trim().is_empty() {
+                            events.extend(self.create_text_delta_events(safe_content));
+                            pos += safe_len;
                         }
                     }
                     break;
@@ -704,24 +943,25 @@ impl StreamContext {
             } else if self.in_thinking_block {
                 // 剥离 <thinking> 标签后紧跟的换行符（可能跨 chunk）
                 if self.strip_thinking_leading_newline {
-                    if self.thinking_buffer.starts_with('\n') {
-                        self.thinking_buffer = self.thinking_buffer[1..].to_string();
+                    if rest.starts_with('\n') {
+                        pos += 1;
                         self.strip_thinking_leading_newline = false;
-                    } else if !self.thinking_buffer.is_empty() {
+                    } else if !rest.is_empty() {
                         // buffer 非空但不以 \n 开头，不再需要剥离
                         self.strip_thinking_leading_newline = false;
                     }
                     // buffer 为空时保留标志，等待下一个 chunk
                 }
+                let rest = &buffer[pos..];
 
                 // 在 thinking 块内，查找 </thinking> 结束标签（跳过被反引号包裹的）
-                if let Some(end_pos) = find_real_thinking_end_tag(&self.thinking_buffer) {
+                if let Some(end_pos) = find_real_thinking_end_tag(rest) {
                     // 提取 thinking 内容
-                    let thinking_content = self.thinking_buffer[..end_pos].to_string();
+                    let thinking_content = &rest[..end_pos];
                     if !thinking_content.is_empty() {
                         if let Some(thinking_index) = self.thinking_block_index {
                             events.push(
-                                self.create_thinking_delta_event(thinking_index, &thinking_content),
+                                self.create_thinking_delta_event(thinking_index, thinking_content),
                             );
                         }
                     }
@@ -743,8 +983,7 @@ impl StreamContext {
                     }
 
                     // 剥离 `</thinking>\n\n`（find_real_thinking_end_tag 已确认 \n\n 存在）
-                    self.thinking_buffer =
-                        self.thinking_buffer[end_pos + "</thinking>\n\n".len()..].to_string();
+                    pos += end_pos + "</thinking>\n\n".len();
                 } else {
                     // 没有找到结束标签，发送当前缓冲区内容作为 thinking_delta。
                     // 保留末尾可能是部分 `</thinking>\n\n` 的内容：
@@ -752,36 +991,29 @@ impl StreamContext {
                     // 因此保留区必须覆盖 `</thinking>\n\n` 的完整长度（13 字节），
                     // 否则当 `</thinking>` 已在 buffer 但 `\n\n` 尚未到达时，
                     // 标签的前几个字符会被错误地作为 thinking_delta 发出。
-                    let target_len = self
-                        .thinking_buffer
-                        .len()
-                        .saturating_sub("</thinking>\n\n".len());
-                    let safe_len = find_char_boundary(&self.thinking_buffer, target_len);
+                    let target_len = rest.len().saturating_sub("</thinking>\n\n".len());
+                    let safe_len = find_char_boundary(rest, target_len);
                     if safe_len > 0 {
-                        let safe_content = self.thinking_buffer[..safe_len].to_string();
-                        if !safe_content.is_empty() {
-                            if let Some(thinking_index) = self.thinking_block_index {
-                                events.push(
-                                    self.create_thinking_delta_event(thinking_index, &safe_content),
-                                );
-                            }
+                        if let Some(thinking_index) = self.thinking_block_index {
+                            events.push(
+                                self.create_thinking_delta_event(thinking_index, &rest[..safe_len]),
+                            );
                         }
-                        self.thinking_buffer = self.thinking_buffer[safe_len..].to_string();
+                        pos += safe_len;
                     }
                     break;
                 }
             } else {
                 // thinking 已提取完成，剩余内容作为 text_delta
-                if !self.thinking_buffer.is_empty() {
-                    let remaining = self.thinking_buffer.clone();
-                    self.thinking_buffer.clear();
-                    events.extend(self.create_text_delta_events(&remaining));
+                if !rest.is_empty() {
+                    events.extend(self.create_text_delta_events(rest));
+                    pos = buffer.len();
                 }
                 break;
             }
         }
 
-        events
+        pos
     }
 
     /// 创建 text_delta 事件
@@ -1193,6 +1425,129 @@ mod tests {
         assert!(sse_str.ends_with("\n\n"));
     }
 
+    #[test]
+    fn test_encode_into_matches_sse_format() {
+        let events = [
+            SseEvent::new("message_start", json!({"type": "message_start"})),
+            SseEvent::new(
+                "content_block_delta",
+                json!({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "你好\n\"x\""}}),
+            ),
+        ];
+
+        let mut buf = BytesMut::new();
+        let mut expected = String::new();
+        for event in &events {
+            event.encode_into(&mut buf);
+            expected.push_str(&format!(
+                "event: {}\ndata: {}\n\n",
+                event.event,
+                serde_json::to_string(&event.data).unwrap()
+            ));
+        }
+        assert_eq!(std::str::from_utf8(&buf).unwrap(), expected);
+    }
+
+    /// 解析编码器输出的 SSE 帧
+    fn parse_sse_frames(bytes: &[u8]) -> Vec<(String, serde_json::Value)> {
+        std::str::from_utf8(bytes)
+            .unwrap()
+            .split_terminator("\n\n")
+            .map(|frame| {
+                let (event, data) = frame.split_once('\n').unwrap();
+                (
+                    event.strip_prefix("event: ").unwrap().to_string(),
+                    serde_json::from_str(data.strip_prefix("data: ").unwrap()).unwrap(),
+                )
+            })
+            .collect()
+    }
+
+    fn delta_event(index: i32, delta_type: &str, field: &str, text: &str) -> SseEvent {
+        SseEvent::new(
+            "content_block_delta",
+            json!({"type": "content_block_delta", "index": index, "delta": {"type": delta_type, field: text}}),
+        )
+    }
+
+    #[test]
+    fn test_sse_encoder_batches_without_coalescing() {
+        let mut encoder = SseEncoder::new(SseCoalesceConfig::default());
+        assert!(!encoder.should_flush());
+        assert!(encoder.take().is_none());
+
+        encoder.push(&delta_event(0, "text_delta", "text", "a"));
+        encoder.push(&delta_event(0, "text_delta", "text", "b"));
+        assert!(encoder.should_flush());
+        assert!(encoder.flush_deadline().is_none());
+
+        let frames = parse_sse_frames(&encoder.take().unwrap());
+        assert_eq!(frames.len(), 2);
+        assert_eq!(frames[0].1["delta"]["text"], "a");
+        assert_eq!(frames[1].1["delta"]["text"], "b");
+        assert!(encoder.take().is_none());
+    }
+
+    #[test]
+    fn test_sse_encoder_coalesces_consecutive_deltas() {
+        let mut encoder = SseEncoder::new(SseCoalesceConfig {
+            window: Duration::from_secs(60),
+            max_bytes: 1 << 20,
+        });
+
+        encoder.push(&delta_event(0, "thinking_delta", "thinking", "思"));
+        encoder.push(&delta_event(0, "thinking_delta", "thinking", "考"));
+        encoder.push(&SseEvent::new(
+            "content_block_stop",
+            json!({"type": "content_block_stop", "index": 0}),
+        ));
+        encoder.push(&delta_event(1, "text_delta", "text", "Hello"));
+        encoder.push(&delta_event(1, "text_delta", "text", ", "));
+        encoder.push(&delta_event(2, "text_delta", "text", "other block"));
+        encoder.push(&delta_event(2, "text_delta", "text", "!"));
+        assert!(!encoder.should_flush());
+        assert!(encoder.flush_deadline().is_some());
+
+        let frames = parse_sse_frames(&encoder.take().unwrap());
+        let summary: Vec<_> = frames
+            .iter()
+            .map(|(event, data)| (event.as_str(), data["index"].as_i64().unwrap()))
+            .collect();
+        assert_eq!(
+            summary,
+            vec![
+                ("content_block_delta", 0),
+                ("content_block_stop", 0),
+                ("content_block_delta", 1),
+                ("content_block_delta", 2),
+            ]
+        );
+        assert_eq!(
+            frames[0].1,
+            json!({"type": "content_block_delta", "index": 0, "delta": {"type": "thinking_delta", "thinking": "思考"}})
+        );
+        assert_eq!(frames[2].1["delta"]["text"], "Hello, ");
+        assert_eq!(frames[3].1["delta"]["text"], "other block!");
+        assert!(encoder.flush_deadline().is_none());
+    }
+
+    #[test]
+    fn test_sse_encoder_flushes_on_max_bytes() {
+        let mut encoder = SseEncoder::new(SseCoalesceConfig {
+            window: Duration::from_secs(60),
+            max_bytes: 8,
+        });
+
+        encoder.push(&delta_event(0, "text_delta", "text", "1234"));
+        assert!(!encoder.should_flush());
+        encoder.push(&delta_event(0, "text_delta", "text", "5678"));
+        assert!(encoder.should_flush());
+
+        let frames = parse_sse_frames(&encoder.take().unwrap());
+        assert_eq!(frames.len(), 1);
+        assert_eq!(frames[0].1["delta"]["text"], "12345678");
+    }
+
     #[test]
     fn test_sse_state_manager_message_start() {
         let mut manager = SseStateManager::new();
@@ -15,7 +15,7 @@ use serde::{Deserialize, Serialize};
 use serde_json::json;
 use uuid::Uuid;
 
-use super::stream::SseEvent;
+use super::stream::{SseCoalesceConfig, SseEncoder, SseEvent};
 use super::types::{ErrorResponse, MessagesRequest};
 
 /// MCP 请求
@@ -220,11 +220,12 @@ pub fn create_websearch_sse_stream(
     let events =
         generate_websearch_events(&model, &query, &tool_use_id, search_results, input_tokens);
 
-    stream::iter(
-        events
-            .into_iter()
-            .map(|e| Ok(Bytes::from(e.to_sse_string()))),
-    )
+    // 事件已全部生成，编码到同一缓冲后一次输出
+    let mut encoder = SseEncoder::new(SseCoalesceConfig::default());
+    for event in &events {
+        encoder.push(event);
+    }
+    stream::iter(encoder.take().map(Ok))
 }
 
 /// 生成 WebSearch SSE 事件序列
@@ -0,0 +1,273 @@
+//! 内容哈希缓存工具
+//!
+//! 为按内容哈希做 key 的热点计算（token 计数、请求转换等）提供：
+//! - 有界的双代近似 LRU 缓存
+//! - 与序列化顺序无关的 JSON 内容哈希
+//! - 面向长文本的快速内容哈希与 JSON 内存估算
+
+use std::collections::HashMap;
+use std::hash::{Hash, Hasher};
+
+use parking_lot::Mutex;
+
+/// 有界缓存（双代近似 LRU）
+///
+/// 当前代写满后整体降为上一代，原上一代被丢弃；
+/// 命中上一代的条目会被提升回当前代。所有操作均为 O(1)，
+/// 最多保留 `2 * generation_capacity` 个条目。
+pub struct GenerationalCache<V> {
+    generation_capacity: usize,
+    generations: Mutex<Generations<V>>,
+}
+
+struct Generations<V> {
+    current: HashMap<u64, V>,
+    previous: HashMap<u64, V>,
+}
+
+impl<V> Generations<V> {
+    fn insert(&mut self, capacity: usize, key: u64, value: V) {
+        if self.current.len() >= capacity {
+            self.previous = std::mem::take(&mut self.current);
+        }
+        self.current.insert(key, value);
+    }
+}
+
+impl<V: Clone> GenerationalCache<V> {
+    /// 创建缓存，`generation_capacity` 为每一代的容量
+    pub fn new(generation_capacity: usize) -> Self {
+        Self {
+            generation_capacity: generation_capacity.max(1),
+            generations: Mutex::new(Generations {
+                current: HashMap::new(),
+                previous: HashMap::new(),
+            }),
+        }
+    }
+
+    /// 查询缓存，命中上一代时提升到当前代
+    pub fn get(&self, key: u64) -> Option<V> {
+        let mut generations = self.generations.lock();
+        if let Some(value) = generations.current.get(&key) {
+            return Some(value.clone());
+        }
+        let value = generations.previous.remove(&key)?;
+        generations.insert(self.generation_capacity, key, value.clone());
+        Some(value)
+    }
+
+    /// 写入缓存
+    pub fn insert(&self, key: u64, value: V) {
+        self.generations
+            .lock()
+            .insert(self.generation_capacity, key, value);
+    }
+
+    /// 查询缓存，未命中时调用 `compute` 计算并写入
+    ///
+    /// 计算过程在锁外进行
+    pub fn get_or_insert_with(&self, key: u64, compute: impl FnOnce() -> V) -> V {
+        if let Some(value) = self.get(key) {
+            return value;
+        }
+        let value = compute();
+        self.insert(key, value.clone());
+        value
+    }
+}
+
+/// 递归哈希 JSON 值
+///
+/// object 按迭代顺序哈希，同一份 JSON 文本反序列化得到的结果哈希相同
+pub fn hash_json_value<H: Hasher>(value: &serde_json::Value, state: &mut H) {
+    use serde_json::Value;
+
+    std::mem::discriminant(value).hash(state);
+    match value {
+        Value::Null => {}
+        Value::Bool(b) => b.hash(state),
+        Value::Number(n) => {
+            if let Some(u) = n.as_u64() {
+                u.hash(state);
+            } else if let Some(i) = n.as_i64() {
+                i.hash(state);
+            } else if let Some(f) = n.as_f64() {
+                f.to_bits().hash(state);
+            }
+        }
+        Value::String(s) => s.hash(state),
+        Value::Array(arr) => {
+            arr.len().hash(state);
+            for item in arr {
+                hash_json_value(item, state);
+            }
+        }
+        Value::Object(map) => {
+            map.len().hash(state);
+            for (k, v) in map {
+                k.hash(state);
+                hash_json_value(v, state);
+            }
+        }
+    }
+}
+
+/// 估算 JSON 值占用的内存（字节）
+///
+/// 字符串按长度计，每个节点另加固定开销，用于按内存预算淘汰缓存
+pub fn estimate_json_size(value: &serde_json::Value) -> usize {
+    use serde_json::Value;
+
+    const NODE_OVERHEAD: usize = 32;
+    NODE_OVERHEAD
+        + match value {
+            Value::String(s) => s.len(),
+            Value::Array(arr) => arr.iter().map(estimate_json_size).sum(),
+            Value::Object(map) => map
+                .iter()
+                .map(|(k, v)| k.len() + estimate_json_size(v))
+                .sum(),
+            _ => 0,
+        }
+}
+
+/// 面向长文本的快速哈希
+///
+/// 按 8 字节一组做乘法-旋转混合（FxHash 风格），`finish` 时再做一次雪崩混合，
+/// 对大段内容（如 base64 图片）比 `DefaultHasher`（SipHash）快数倍。
+/// 不抗刻意构造的碰撞，只用于校验同一客户端重发的内容是否变化
+#[derive(Debug, Clone, Default)]
+pub struct FastHasher {
+    hash: u64,
+}
+
+impl FastHasher {
+    const SEED: u64 = 0x517c_c1b7_2722_0a95;
+
+    #[inline]
+    fn add(&mut self, word: u64) {
+        self.hash = (self.hash.rotate_left(5) ^ word).wrapping_mul(Self::SEED);
+    }
+}
+
+impl Hasher for FastHasher {
+    fn write(&mut self, bytes: &[u8]) {
+        let mut chunks = bytes.chunks_exact(8);
+        for chunk in &mut chunks {
+            self.add(u64::from_le_bytes(chunk.try_into().unwrap()));
+        }
+        let rest = chunks.remainder();
+        if !rest.is_empty() {
+            let mut word = [0u8; 8];
+            word[..rest.len()].copy_from_slice(rest);
+            self.add(u64::from_le_bytes(word));
+        }
+        // 区分补零后相同的尾部（如 `a` 与 `a\0`）
+        self.add(bytes.len() as u64);
+    }
+
+    fn write_u64(&mut self, n: u64) {
+        self.add(n);
+    }
+
+    fn write_usize(&mut self, n: usize) {
+        self.add(n as u64);
+    }
+
+    fn finish(&self) -> u64 {
+        // MurmurHash3 fmix64
+        let mut h = self.hash;
+        h ^= h >> 33;
+        h = h.wrapping_mul(0xff51_afd7_ed55_8ccd);
+        h ^= h >> 33;
+        h = h.wrapping_mul(0xc4ce_b9fe_1a85_ec53);
+        h ^ (h >> 33)
+    }
+}
+
+/// 哈希 `HashMap<String, Value>`，结果与迭代顺序无关
+///
+/// `HashMap` 每个实例的迭代顺序不同，按条目分别哈希后累加
+pub fn hash_json_map<H: Hasher>(map: &HashMap<String, serde_json::Value>, state: &mut H) {
+    let combined = map.iter().fold(0u64, |acc, (k, v)| {
+        let mut entry_hasher = std::hash::DefaultHasher::new();
+        k.hash(&mut entry_hasher);
+        hash_json_value(v, &mut entry_hasher);
+        acc.wrapping_add(entry_hasher.finish())
+    });
+    map.len().hash(state);
+    combined.hash(state);
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+    use std::hash::DefaultHasher;
+
+    #[test]
+    fn test_generational_cache_promotes_previous_generation() {
+        let cache = GenerationalCache::new(4);
+        cache.insert(1, "one");
+        for key in 2..6 {
+            cache.insert(key, "other");
+        }
+
+        // key 1 已降为上一代，命中后被提升回当前代
+        assert_eq!(cache.get(1), Some("one"));
+        assert!(cache.generations.lock().current.contains_key(&1));
+        assert_eq!(cache.get_or_insert_with(1, || unreachable!()), "one");
+    }
+
+    #[test]
+    fn test_fast_hasher_detects_small_edits() {
+        let hash = |value: &serde_json::Value| {
+            let mut hasher = FastHasher::default();
+            hash_json_value(value, &mut hasher);
+            hasher.finish()
+        };
+
+        let text = "x".repeat(4096);
+        let original = serde_json::json!([{"type": "text", "text": text}]);
+        let mut edited_text = text.clone();
+        edited_text.replace_range(2048..2049, "y");
+        let edited = serde_json::json!([{"type": "text", "text": edited_text}]);
+
+        assert_eq!(hash(&original), hash(&original.clone()));
+        assert_ne!(hash(&original), hash(&edited));
+        assert_ne!(
+            hash(&serde_json::json!("a")),
+            hash(&serde_json::json!("a\0"))
+        );
+    }
+
+    #[test]
+    fn test_estimate_json_size_counts_string_bytes() {
+        let small = estimate_json_size(&serde_json::json!({"data": "a"}));
+        let large = estimate_json_size(&serde_json::json!({"data": "a".repeat(10_000)}));
+        assert_eq!(large - small, 9_999);
+    }
+
+    #[test]
+    fn test_hash_json_map_is_order_independent() {
+        let mut a = HashMap::new();
+        let mut b = HashMap::new();
+        for i in 0..32 {
+            a.insert(format!("k{}", i), serde_json::json!(i));
+        }
+        for i in (0..32).rev() {
+            b.insert(format!("k{}", i), serde_json::json!(i));
+        }
+
+        let mut ha = DefaultHasher::new();
+        let mut hb = DefaultHasher::new();
+        hash_json_map(&a, &mut ha);
+        hash_json_map(&b, &mut hb);
+        assert_eq!(ha.finish(), hb.finish());
+
+        b.insert("k0".to_string(), serde_json::json!("changed"));
+        let mut hc = DefaultHasher::new();
+        hash_json_map(&b, &mut hc);
+        assert_ne!(ha.finish(), hc.finish());
+    }
+}
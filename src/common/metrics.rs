@@ -0,0 +1,591 @@
+//! 运行时指标
+//!
+//! 基于原子变量的轻量指标注册表，按 Prometheus 文本格式导出：
+//! - `Counter` / `Gauge` / `MaxGauge`：单个原子变量，热路径上只有一次原子操作
+//! - `Histogram`：固定分桶，观测时只递增所在桶，导出时再累加
+//! - `HistogramVec`：按凭据 ID 区分的直方图，读锁查找子直方图
+//!
+//! 全局注册表通过 [`metrics`] 获取
+
+use std::collections::BTreeMap;
+use std::fmt::Write;
+use std::sync::atomic::{AtomicI64, AtomicU64, Ordering};
+use std::sync::{Arc, OnceLock};
+use std::time::Duration;
+
+use parking_lot::RwLock;
+
+/// 延迟类直方图分桶（秒）
+const LATENCY_BUCKETS: &[f64] = &[
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 21.0, 34.0, 60.0,
+];
+
+/// 锁等待时间分桶（秒）
+const LOCK_WAIT_BUCKETS: &[f64] = &[
+    0.000_001, 0.000_005, 0.000_01, 0.000_05, 0.000_1, 0.000_5, 0.001, 0.005, 0.01, 0.05,
+];
+
+/// 单次请求尝试次数分桶
+const ATTEMPT_BUCKETS: &[f64] = &[1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0];
+
+/// 直方图观测值之和的定点精度（百万分之一）
+const SUM_SCALE: f64 = 1_000_000.0;
+
+/// 单调递增计数器
+#[derive(Debug, Default)]
+pub struct Counter(AtomicU64);
+
+impl Counter {
+    pub fn inc(&self) {
+        self.add(1);
+    }
+
+    pub fn add(&self, value: u64) {
+        self.0.fetch_add(value, Ordering::Relaxed);
+    }
+
+    pub fn get(&self) -> u64 {
+        self.0.load(Ordering::Relaxed)
+    }
+}
+
+/// 可增可减的计量值
+#[derive(Debug, Default)]
+pub struct Gauge(AtomicI64);
+
+impl Gauge {
+    pub fn inc(&self) {
+        self.0.fetch_add(1, Ordering::Relaxed);
+    }
+
+    pub fn dec(&self) {
+        self.0.fetch_sub(1, Ordering::Relaxed);
+    }
+
+    pub fn get(&self) -> i64 {
+        self.0.load(Ordering::Relaxed)
+    }
+
+    /// 加一并返回守卫，守卫释放时减一
+    pub fn track(&'static self) -> GaugeGuard {
+        self.inc();
+        GaugeGuard(self)
+    }
+}
+
+/// `Gauge::track` 返回的守卫
+pub struct GaugeGuard(&'static Gauge);
+
+impl Drop for GaugeGuard {
+    fn drop(&mut self) {
+        self.0.dec();
+    }
+}
+
+/// 只记录最大值的计量值（高水位）
+#[derive(Debug, Default)]
+pub struct MaxGauge(AtomicU64);
+
+impl MaxGauge {
+    pub fn observe(&self, value: u64) {
+        self.0.fetch_max(value, Ordering::Relaxed);
+    }
+
+    pub fn get(&self) -> u64 {
+        self.0.load(Ordering::Relaxed)
+    }
+}
+
+/// 固定分桶直方图
+pub struct Histogram {
+    /// 各桶上界（升序）
+    bounds: &'static [f64],
+    /// 各桶计数（非累积），最后一个为 +Inf 桶
+    buckets: Box<[AtomicU64]>,
+    /// 观测值之和（乘以 `SUM_SCALE` 的定点数）
+    sum: AtomicU64,
+}
+
+impl Histogram {
+    pub fn new(bounds: &'static [f64]) -> Self {
+        Self {
+            bounds,
+            buckets: (0..=bounds.len()).map(|_| AtomicU64::new(0)).collect(),
+            sum: AtomicU64::new(0),
+        }
+    }
+
+    /// 记录一个观测值
+    pub fn observe(&self, value: f64) {
+        let index = self
+            .bounds
+            .iter()
+            .position(|bound| value <= *bound)
+            .unwrap_or(self.bounds.len());
+        self.buckets[index].fetch_add(1, Ordering::Relaxed);
+        self.sum
+            .fetch_add((value.max(0.0) * SUM_SCALE) as u64, Ordering::Relaxed);
+    }
+
+    /// 以秒为单位记录一个时长
+    pub fn observe_duration(&self, duration: Duration) {
+        self.observe(duration.as_secs_f64());
+    }
+
+    /// 观测次数
+    pub fn count(&self) -> u64 {
+        self.buckets.iter().map(|b| b.load(Ordering::Relaxed)).sum()
+    }
+
+    /// 输出直方图的样本行（不含 HELP/TYPE），`labels` 为额外标签，如 `credential="1"`
+    fn render_samples(&self, out: &mut String, name: &str, labels: &str) {
+        let separator = if labels.is_empty() { "" } else { "," };
+        let mut cumulative = 0;
+        for (bound, bucket) in self.bounds.iter().zip(self.buckets.iter()) {
+            cumulative += bucket.load(Ordering::Relaxed);
+            let _ = writeln!(
+                out,
+                "{name}_bucket{{{labels}{separator}le=\"{bound}\"}} {cumulative}"
+            );
+        }
+        cumulative += self.buckets[self.bounds.len()].load(Ordering::Relaxed);
+        let _ = writeln!(
+            out,
+            "{name}_bucket{{{labels}{separator}le=\"+Inf\"}} {cumulative}"
+        );
+
+        let sum = self.sum.load(Ordering::Relaxed) as f64 / SUM_SCALE;
+        let braced = if labels.is_empty() {
+            String::new()
+        } else {
+            format!("{{{labels}}}")
+        };
+        let _ = writeln!(out, "{name}_sum{braced} {sum}");
+        let _ = writeln!(out, "{name}_count{braced} {cumulative}");
+    }
+}
+
+/// 按凭据 ID 区分的直方图
+pub struct HistogramVec {
+    bounds: &'static [f64],
+    children: RwLock<BTreeMap<u64, Arc<Histogram>>>,
+}
+
+impl HistogramVec {
+    pub fn new(bounds: &'static [f64]) -> Self {
+        Self {
+            bounds,
+            children: RwLock::new(BTreeMap::new()),
+        }
+    }
+
+    /// 记录指定凭据的观测值
+    pub fn observe_duration(&self, id: u64, duration: Duration) {
+        let child = self.children.read().get(&id).cloned();
+        let child = child.unwrap_or_else(|| {
+            self.children
+                .write()
+                .entry(id)
+                .or_insert_with(|| Arc::new(Histogram::new(self.bounds)))
+                .clone()
+        });
+        child.observe_duration(duration);
+    }
+
+    /// 移除指定凭据的直方图（凭据删除时调用）
+    pub fn remove(&self, id: u64) {
+        self.children.write().remove(&id);
+    }
+
+    fn render_samples(&self, out: &mut String, name: &str) {
+        for (id, child) in self.children.read().iter() {
+            child.render_samples(out, name, &format!("credential=\"{id}\""));
+        }
+    }
+}
+
+/// 全局指标注册表
+pub struct Metrics {
+    // ===== 上游调用（provider） =====
+    /// API 调用（含重试）最终成功次数
+    pub api_requests_succeeded: Counter,
+    /// API 调用（含重试）最终失败次数
+    pub api_requests_failed: Counter,
+    /// 单次 API 调用的尝试次数
+    pub api_attempts_per_request: Histogram,
+    /// 上游 2xx 响应数
+    pub upstream_responses_2xx: Counter,
+    /// 上游 4xx 响应数
+    pub upstream_responses_4xx: Counter,
+    /// 上游 5xx 响应数
+    pub upstream_responses_5xx: Counter,
+    /// 上游请求发送失败（网络错误等）次数
+    pub upstream_send_errors: Counter,
+    /// 上游首字节延迟（成功响应）
+    pub upstream_ttfb: Histogram,
+    /// 按凭据区分的上游首字节延迟（成功响应）
+    pub credential_ttfb: HistogramVec,
+    /// 已发出的对冲请求数
+    pub hedged_requests: Counter,
+    /// 对冲请求胜出次数
+    pub hedge_wins: Counter,
+
+    // ===== Token 管理（token_manager） =====
+    /// Token 刷新耗时
+    pub token_refresh_duration: Histogram,
+    /// Token 刷新失败次数
+    pub token_refresh_failures: Counter,
+    /// 延迟熔断器摘除凭据次数
+    pub latency_ejections: Counter,
+    /// 获取凭据 entries 锁的等待时间
+    pub entries_lock_wait: Histogram,
+
+    // ===== 事件流解码（parser/decoder） =====
+    /// 已解码的帧数
+    pub decoder_frames_decoded: Counter,
+    /// 解码错误次数
+    pub decoder_errors: Counter,
+    /// 容错恢复时跳过的字节数
+    pub decoder_bytes_skipped: Counter,
+    /// 解码器因连续错误停止的次数
+    pub decoder_stopped: Counter,
+    /// 解码器缓冲区高水位（字节）
+    pub decoder_buffer_high_water: MaxGauge,
+
+    // ===== SSE 输出（anthropic handlers） =====
+    /// 已创建的 SSE 响应流数量
+    pub sse_streams: Counter,
+    /// 当前活跃的 SSE 响应流数量
+    pub sse_streams_active: Gauge,
+    /// SSE 写出次数
+    pub sse_writes: Counter,
+    /// SSE 写出字节数
+    pub sse_bytes: Counter,
+}
+
+impl Metrics {
+    fn new() -> Self {
+        Self {
+            api_requests_succeeded: Counter::default(),
+            api_requests_failed: Counter::default(),
+            api_attempts_per_request: Histogram::new(ATTEMPT_BUCKETS),
+            upstream_responses_2xx: Counter::default(),
+            upstream_responses_4xx: Counter::default(),
+            upstream_responses_5xx: Counter::default(),
+            upstream_send_errors: Counter::default(),
+            upstream_ttfb: Histogram::new(LATENCY_BUCKETS),
+            credential_ttfb: HistogramVec::new(LATENCY_BUCKETS),
+            hedged_requests: Counter::default(),
+            hedge_wins: Counter::default(),
+            token_refresh_duration: Histogram::new(LATENCY_BUCKETS),
+            token_refresh_failures: Counter::default(),
+            latency_ejections: Counter::default(),
+            entries_lock_wait: Histogram::new(LOCK_WAIT_BUCKETS),
+            decoder_frames_decoded: Counter::default(),
+            decoder_errors: Counter::default(),
+            decoder_bytes_skipped: Counter::default(),
+            decoder_stopped: Counter::default(),
+            decoder_buffer_high_water: MaxGauge::default(),
+            sse_streams: Counter::default(),
+            sse_streams_active: Gauge::default(),
+            sse_writes: Counter::default(),
+            sse_bytes: Counter::default(),
+        }
+    }
+
+    /// 按 Prometheus 文本格式（0.0.4）导出所有指标
+    pub fn render(&self) -> String {
+        let mut out = String::with_capacity(8 * 1024);
+
+        write_header(
+            &mut out,
+            "kiro_api_requests_total",
+            "counter",
+            "API 调用（含重试）最终结果",
+        );
+        write_sample(
+            &mut out,
+            "kiro_api_requests_total{result=\"success\"}",
+            self.api_requests_succeeded.get(),
+        );
+        write_sample(
+            &mut out,
+            "kiro_api_requests_total{result=\"failure\"}",
+            self.api_requests_failed.get(),
+        );
+
+        write_header(
+            &mut out,
+            "kiro_api_attempts_per_request",
+            "histogram",
+            "单次 API 调用的尝试次数",
+        );
+        self.api_attempts_per_request
+            .render_samples(&mut out, "kiro_api_attempts_per_request", "");
+
+        write_header(
+            &mut out,
+            "kiro_upstream_responses_total",
+            "counter",
+            "上游响应数（按状态码分类）",
+        );
+        write_sample(
+            &mut out,
+            "kiro_upstream_responses_total{class=\"2xx\"}",
+            self.upstream_responses_2xx.get(),
+        );
+        write_sample(
+            &mut out,
+            "kiro_upstream_responses_total{class=\"4xx\"}",
+            self.upstream_responses_4xx.get(),
+        );
+        write_sample(
+            &mut out,
+            "kiro_upstream_responses_total{class=\"5xx\"}",
+            self.upstream_responses_5xx.get(),
+        );
+        write_sample(
+            &mut out,
+            "kiro_upstream_responses_total{class=\"error\"}",
+            self.upstream_send_errors.get(),
+        );
+
+        write_header(
+            &mut out,
+            "kiro_upstream_ttfb_seconds",
+            "histogram",
+            "上游首字节延迟",
+        );
+        self.upstream_ttfb
+            .render_samples(&mut out, "kiro_upstream_ttfb_seconds", "");
+
+        write_header(
+            &mut out,
+            "kiro_credential_ttfb_seconds",
+            "histogram",
+            "按凭据区分的上游首字节延迟",
+        );
+        self.credential_ttfb
+            .render_samples(&mut out, "kiro_credential_ttfb_seconds");
+
+        write_header(
+            &mut out,
+            "kiro_hedged_requests_total",
+            "counter",
+            "已发出的对冲请求数",
+        );
+        write_sample(
+            &mut out,
+            "kiro_hedged_requests_total",
+            self.hedged_requests.get(),
+        );
+        write_header(
+            &mut out,
+            "kiro_hedge_wins_total",
+            "counter",
+            "对冲请求胜出次数",
+        );
+        write_sample(&mut out, "kiro_hedge_wins_total", self.hedge_wins.get());
+
+        write_header(
+            &mut out,
+            "kiro_token_refresh_duration_seconds",
+            "histogram",
+            "Token 刷新耗时",
+        );
+        self.token_refresh_duration.render_samples(
+            &mut out,
+            "kiro_token_refresh_duration_seconds",
+            "",
+        );
+        write_header(
+            &mut out,
+            "kiro_token_refresh_failures_total",
+            "counter",
+            "Token 刷新失败次数",
+        );
+        write_sample(
+            &mut out,
+            "kiro_token_refresh_failures_total",
+            self.token_refresh_failures.get(),
+        );
+        write_header(
+            &mut out,
+            "kiro_latency_ejections_total",
+            "counter",
+            "延迟熔断器摘除凭据次数",
+        );
+        write_sample(
+            &mut out,
+            "kiro_latency_ejections_total",
+            self.latency_ejections.get(),
+        );
+        write_header(
+            &mut out,
+            "kiro_entries_lock_wait_seconds",
+            "histogram",
+            "获取凭据 entries 锁的等待时间",
+        );
+        self.entries_lock_wait
+            .render_samples(&mut out, "kiro_entries_lock_wait_seconds", "");
+
+        write_header(
+            &mut out,
+            "kiro_decoder_frames_decoded_total",
+            "counter",
+            "已解码的事件流帧数",
+        );
+        write_sample(
+            &mut out,
+            "kiro_decoder_frames_decoded_total",
+            self.decoder_frames_decoded.get(),
+        );
+        write_header(
+            &mut out,
+            "kiro_decoder_errors_total",
+            "counter",
+            "事件流解码错误次数",
+        );
+        write_sample(
+            &mut out,
+            "kiro_decoder_errors_total",
+            self.decoder_errors.get(),
+        );
+        write_header(
+            &mut out,
+            "kiro_decoder_bytes_skipped_total",
+            "counter",
+            "容错恢复时跳过的字节数",
+        );
+        write_sample(
+            &mut out,
+            "kiro_decoder_bytes_skipped_total",
+            self.decoder_bytes_skipped.get(),
+        );
+        write_header(
+            &mut out,
+            "kiro_decoder_stopped_total",
+            "counter",
+            "解码器因连续错误停止的次数",
+        );
+        write_sample(
+            &mut out,
+            "kiro_decoder_stopped_total",
+            self.decoder_stopped.get(),
+        );
+        write_header(
+            &mut out,
+            "kiro_decoder_buffer_high_water_bytes",
+            "gauge",
+            "解码器缓冲区高水位",
+        );
+        write_sample(
+            &mut out,
+            "kiro_decoder_buffer_high_water_bytes",
+            self.decoder_buffer_high_water.get(),
+        );
+
+        write_header(
+            &mut out,
+            "kiro_sse_streams_total",
+            "counter",
+            "已创建的 SSE 响应流数量",
+        );
+        write_sample(&mut out, "kiro_sse_streams_total", self.sse_streams.get());
+        write_header(
+            &mut out,
+            "kiro_sse_streams_active",
+            "gauge",
+            "当前活跃的 SSE 响应流数量",
+        );
+        write_sample(
+            &mut out,
+            "kiro_sse_streams_active",
+            self.sse_streams_active.get(),
+        );
+        write_header(&mut out, "kiro_sse_writes_total", "counter", "SSE 写出次数");
+        write_sample(&mut out, "kiro_sse_writes_total", self.sse_writes.get());
+        write_header(
+            &mut out,
+            "kiro_sse_bytes_total",
+            "counter",
+            "SSE 写出字节数",
+        );
+        write_sample(&mut out, "kiro_sse_bytes_total", self.sse_bytes.get());
+
+        out
+    }
+}
+
+/// 写入指标的 HELP / TYPE 行
+pub fn write_header(out: &mut String, name: &str, kind: &str, help: &str) {
+    let _ = writeln!(out, "# HELP {name} {help}");
+    let _ = writeln!(out, "# TYPE {name} {kind}");
+}
+
+/// 写入一行样本，`series` 为指标名及可选标签
+pub fn write_sample(out: &mut String, series: &str, value: impl std::fmt::Display) {
+    let _ = writeln!(out, "{series} {value}");
+}
+
+static METRICS: OnceLock<Metrics> = OnceLock::new();
+
+/// 获取全局指标注册表
+pub fn metrics() -> &'static Metrics {
+    METRICS.get_or_init(Metrics::new)
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_histogram_renders_cumulative_buckets() {
+        let histogram = Histogram::new(&[1.0, 5.0]);
+        histogram.observe(0.5);
+        histogram.observe(1.0);
+        histogram.observe(3.0);
+        histogram.observe(10.0);
+        assert_eq!(histogram.count(), 4);
+
+        let mut out = String::new();
+        histogram.render_samples(&mut out, "test_seconds", "credential=\"1\"");
+        assert_eq!(
+            out,
+            "test_seconds_bucket{credential=\"1\",le=\"1\"} 2\n\
+             test_seconds_bucket{credential=\"1\",le=\"5\"} 3\n\
+             test_seconds_bucket{credential=\"1\",le=\"+Inf\"} 4\n\
+             test_seconds_sum{credential=\"1\"} 14.5\n\
+             test_seconds_count{credential=\"1\"} 4\n"
+        );
+    }
+
+    #[test]
+    fn test_render_contains_all_metric_families() {
+        let metrics = Metrics::new();
+        metrics.api_requests_succeeded.inc();
+        metrics
+            .credential_ttfb
+            .observe_duration(7, Duration::from_millis(300));
+        metrics.decoder_buffer_high_water.observe(4096);
+        metrics.decoder_buffer_high_water.observe(1024);
+
+        let out = metrics.render();
+        assert!(out.contains("kiro_api_requests_total{result=\"success\"} 1\n"));
+        assert!(
+            out.contains("kiro_credential_ttfb_seconds_bucket{credential=\"7\",le=\"0.5\"} 1\n")
+        );
+        assert!(out.contains("kiro_decoder_buffer_high_water_bytes 4096\n"));
+
+        // 每个 TYPE 行对应的指标都有样本行
+        for line in out.lines().filter(|l| l.starts_with("# TYPE ")) {
+            let name = line.split_whitespace().nth(2).unwrap();
+            assert!(
+                out.lines()
+                    .any(|l| !l.starts_with('#') && l.starts_with(name)),
+                "{} 缺少样本",
+                name
+            );
+        }
+    }
+}
@@ -1,3 +1,6 @@
 //! 公共工具模块
 
 pub mod auth;
+pub mod cache;
+pub mod metrics;
+pub mod persist;
@@ -0,0 +1,439 @@
+//! 异步落盘（write-behind）工具
+//!
+//! 凭据文件、统计数据、余额缓存等状态文件的写入由独立的后台线程完成：
+//! - 调用方只提交内容或生成内容的闭包，序列化与文件 IO 都不在请求路径上执行
+//! - 同一文件的多次提交会被合并，只生成并写入最新内容
+//! - 需要确认结果的调用方（如 Admin API）可等待指定提交落盘并获取写入错误
+//! - 通过临时文件 + rename 原子替换，避免崩溃时留下被截断的文件（保留原文件权限）
+//! - `Drop` 时会写完所有待写入内容再退出
+
+use std::collections::HashMap;
+use std::io::Write;
+use std::path::{Path, PathBuf};
+use std::sync::Arc;
+use std::sync::atomic::{AtomicU64, Ordering};
+use std::thread::JoinHandle;
+use std::time::{Duration, Instant};
+
+use parking_lot::{Condvar, Mutex};
+use serde::Serialize;
+
+/// 合并窗口：收到第一个写入请求后等待的时间，期间的后续提交会被合并
+const COALESCE_WINDOW: Duration = Duration::from_millis(100);
+
+/// 在落盘线程中生成待写入内容
+type Render = Box<dyn FnOnce() -> std::io::Result<Vec<u8>> + Send>;
+
+/// 原子写入文件
+///
+/// 先写入同目录下的临时文件并 fsync，再 rename 覆盖目标文件；
+/// 临时文件沿用目标文件的权限（如 `chmod 600` 的凭据文件）。
+///
+/// 目标文件无法被 rename 覆盖时（Docker 单文件 bind mount 返回 EBUSY，
+/// 跨文件系统返回 EXDEV），退回为原地写入
+pub fn write_atomic(path: &Path, contents: &[u8]) -> std::io::Result<()> {
+    let file_name = path
+        .file_name()
+        .ok_or_else(|| std::io::Error::new(std::io::ErrorKind::InvalidInput, "路径缺少文件名"))?;
+    let mut tmp_name = std::ffi::OsString::from(".");
+    tmp_name.push(file_name);
+    tmp_name.push(format!(".{}.tmp", std::process::id()));
+    let tmp_path = path.with_file_name(tmp_name);
+
+    let result = (|| {
+        let mut file = std::fs::File::create(&tmp_path)?;
+        // 写入内容前先收紧权限，避免敏感内容短暂出现在权限更宽的临时文件中
+        if let Ok(metadata) = std::fs::metadata(path) {
+            file.set_permissions(metadata.permissions())?;
+        }
+        file.write_all(contents)?;
+        file.sync_all()?;
+        std::fs::rename(&tmp_path, path)
+    })();
+
+    match result {
+        Ok(()) => Ok(()),
+        Err(e) => {
+            let _ = std::fs::remove_file(&tmp_path);
+            if matches!(
+                e.kind(),
+                std::io::ErrorKind::ResourceBusy | std::io::ErrorKind::CrossesDevices
+            ) {
+                tracing::debug!("无法替换 {:?}（{}），改为原地写入", path, e);
+                return write_in_place(path, contents);
+            }
+            Err(e)
+        }
+    }
+}
+
+/// 原地覆盖写入文件（保留原文件的 inode 与权限）
+fn write_in_place(path: &Path, contents: &[u8]) -> std::io::Result<()> {
+    let mut file = std::fs::OpenOptions::new()
+        .write(true)
+        .create(true)
+        .truncate(true)
+        .open(path)?;
+    file.write_all(contents)?;
+    file.sync_all()
+}
+
+/// 落盘统计快照
+#[derive(Debug, Clone, Serialize)]
+#[serde(rename_all = "camelCase")]
+pub struct PersistStats {
+    /// 成功写入次数
+    pub writes: u64,
+    /// 写入失败次数
+    pub failures: u64,
+    /// 被合并（未单独写入）的提交次数
+    pub coalesced: u64,
+    /// 最近一次写入耗时（微秒）
+    pub last_write_micros: u64,
+    /// 最大写入耗时（微秒）
+    pub max_write_micros: u64,
+    /// 平均写入耗时（微秒）
+    pub avg_write_micros: u64,
+}
+
+#[derive(Default)]
+struct Counters {
+    writes: AtomicU64,
+    failures: AtomicU64,
+    coalesced: AtomicU64,
+    last_write_micros: AtomicU64,
+    max_write_micros: AtomicU64,
+    total_write_micros: AtomicU64,
+}
+
+/// 尚未写入的提交
+struct Pending {
+    ticket: u64,
+    render: Render,
+}
+
+/// 某个路径最近一次写入的结果
+struct Completed {
+    /// 本次写入对应的提交序号（覆盖了所有不大于它的提交）
+    ticket: u64,
+    error: Option<String>,
+}
+
+#[derive(Default)]
+struct State {
+    /// 待写入内容（同一路径只保留最新一份）
+    pending: HashMap<PathBuf, Pending>,
+    /// 各路径最近一次写入的结果
+    completed: HashMap<PathBuf, Completed>,
+    /// 最近分配的提交序号
+    last_ticket: u64,
+    /// 有调用方在等待结果，跳过合并窗口
+    urgent: bool,
+    /// 后台线程是否正在写入
+    writing: bool,
+    /// 是否已请求退出
+    shutdown: bool,
+}
+
+#[derive(Default)]
+struct Shared {
+    state: Mutex<State>,
+    /// 有新的待写入内容或请求退出
+    wakeup: Condvar,
+    /// 一批写入已完成
+    written: Condvar,
+    counters: Counters,
+}
+
+/// 后台落盘写入器
+pub struct PersistWriter {
+    shared: Arc<Shared>,
+    handle: Option<JoinHandle<()>>,
+}
+
+impl PersistWriter {
+    /// 启动后台写入线程
+    pub fn spawn() -> Self {
+        let shared = Arc::new(Shared::default());
+        let worker = shared.clone();
+        let handle = std::thread::Builder::new()
+            .name("kiro-persist".to_string())
+            .spawn(move || run(worker))
+            .expect("创建落盘线程失败");
+
+        Self {
+            shared,
+            handle: Some(handle),
+        }
+    }
+
+    /// 提交待写入内容（不阻塞），返回提交序号
+    ///
+    /// 如果同一路径已有尚未写入的内容，则直接替换为最新内容
+    pub fn submit(&self, path: PathBuf, contents: Vec<u8>) -> u64 {
+        self.submit_with(path, move || Ok(contents))
+    }
+
+    /// 提交生成待写入内容的闭包（不阻塞），返回提交序号
+    ///
+    /// 闭包在落盘线程中执行，被后续提交替换的闭包不会执行
+    pub fn submit_with(
+        &self,
+        path: PathBuf,
+        render: impl FnOnce() -> std::io::Result<Vec<u8>> + Send + 'static,
+    ) -> u64 {
+        let mut state = self.shared.state.lock();
+        state.last_ticket += 1;
+        let ticket = state.last_ticket;
+        let pending = Pending {
+            ticket,
+            render: Box::new(render),
+        };
+        if state.pending.insert(path, pending).is_some() {
+            self.shared.counters.coalesced.fetch_add(1, Ordering::Relaxed);
+        }
+        self.shared.wakeup.notify_one();
+        ticket
+    }
+
+    /// 阻塞等待指定提交落盘，返回写入结果
+    ///
+    /// 提交被同一路径的后续提交合并时，返回合并后那次写入的结果；
+    /// 在 Tokio worker 上调用时应包在 `block_in_place` 中
+    pub fn wait(&self, path: &Path, ticket: u64) -> std::io::Result<()> {
+        let mut state = self.shared.state.lock();
+        loop {
+            if let Some(done) = state.completed.get(path).filter(|d| d.ticket >= ticket) {
+                return match &done.error {
+                    None => Ok(()),
+                    Some(e) => Err(std::io::Error::other(e.clone())),
+                };
+            }
+            state.urgent = true;
+            self.shared.wakeup.notify_one();
+            self.shared.written.wait(&mut state);
+        }
+    }
+
+    /// 阻塞等待所有已提交内容写入完成
+    pub fn flush(&self) {
+        let mut state = self.shared.state.lock();
+        while !state.pending.is_empty() || state.writing {
+            state.urgent = true;
+            self.shared.wakeup.notify_one();
+            self.shared.written.wait(&mut state);
+        }
+    }
+
+    /// 获取落盘统计
+    pub fn stats(&self) -> PersistStats {
+        let c = &self.shared.counters;
+        let writes = c.writes.load(Ordering::Relaxed);
+        let total = c.total_write_micros.load(Ordering::Relaxed);
+        PersistStats {
+            writes,
+            failures: c.failures.load(Ordering::Relaxed),
+            coalesced: c.coalesced.load(Ordering::Relaxed),
+            last_write_micros: c.last_write_micros.load(Ordering::Relaxed),
+            max_write_micros: c.max_write_micros.load(Ordering::Relaxed),
+            avg_write_micros: if writes > 0 { total / writes } else { 0 },
+        }
+    }
+}
+
+impl Drop for PersistWriter {
+    fn drop(&mut self) {
+        self.shared.state.lock().shutdown = true;
+        self.shared.wakeup.notify_one();
+        if let Some(handle) = self.handle.take() {
+            let _ = handle.join();
+        }
+    }
+}
+
+/// 后台写入线程主循环
+fn run(shared: Arc<Shared>) {
+    loop {
+        let batch = {
+            let mut state = shared.state.lock();
+            while state.pending.is_empty() && !state.shutdown {
+                shared.wakeup.wait(&mut state);
+            }
+            if state.pending.is_empty() {
+                // 已请求退出且没有待写入内容
+                shared.written.notify_all();
+                return;
+            }
+
+            // 等待合并窗口，让短时间内的连续提交合并为一次写入；有调用方等待结果时提前结束
+            shared
+                .wakeup
+                .wait_while_for(&mut state, |s| !s.urgent && !s.shutdown, COALESCE_WINDOW);
+
+            state.urgent = false;
+            state.writing = true;
+            std::mem::take(&mut state.pending)
+        };
+
+        let mut results = Vec::with_capacity(batch.len());
+        for (path, pending) in batch {
+            let started = Instant::now();
+            let result = (pending.render)().and_then(|contents| write_atomic(&path, &contents));
+            let error = match result {
+                Ok(()) => {
+                    let micros = started.elapsed().as_micros() as u64;
+                    let c = &shared.counters;
+                    c.writes.fetch_add(1, Ordering::Relaxed);
+                    c.last_write_micros.store(micros, Ordering::Relaxed);
+                    c.max_write_micros.fetch_max(micros, Ordering::Relaxed);
+                    c.total_write_micros.fetch_add(micros, Ordering::Relaxed);
+                    tracing::debug!("已写入 {:?}（{} μs）", path, micros);
+                    None
+                }
+                Err(e) => {
+                    shared.counters.failures.fetch_add(1, Ordering::Relaxed);
+                    tracing::warn!("写入文件失败 {:?}: {}", path, e);
+                    Some(e.to_string())
+                }
+            };
+            results.push((path, pending.ticket, error));
+        }
+
+        let mut state = shared.state.lock();
+        for (path, ticket, error) in results {
+            state.completed.insert(path, Completed { ticket, error });
+        }
+        state.writing = false;
+        shared.written.notify_all();
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    fn make_temp_dir() -> PathBuf {
+        let dir = std::env::temp_dir().join(format!("kiro-rs-persist-{}", uuid::Uuid::new_v4()));
+        std::fs::create_dir_all(&dir).expect("create temp dir");
+        dir
+    }
+
+    #[test]
+    fn test_write_atomic_replaces_file_without_leftover() {
+        let dir = make_temp_dir();
+        let path = dir.join("data.json");
+        std::fs::write(&path, "old").unwrap();
+
+        write_atomic(&path, b"new").unwrap();
+
+        assert_eq!(std::fs::read_to_string(&path).unwrap(), "new");
+        assert_eq!(std::fs::read_dir(&dir).unwrap().count(), 1);
+        let _ = std::fs::remove_dir_all(&dir);
+    }
+
+    #[cfg(unix)]
+    #[test]
+    fn test_write_atomic_preserves_permissions() {
+        use std::os::unix::fs::PermissionsExt;
+
+        let dir = make_temp_dir();
+        let path = dir.join("credentials.json");
+        std::fs::write(&path, "old").unwrap();
+        std::fs::set_permissions(&path, std::fs::Permissions::from_mode(0o600)).unwrap();
+
+        write_atomic(&path, b"new").unwrap();
+
+        let mode = std::fs::metadata(&path).unwrap().permissions().mode();
+        assert_eq!(mode & 0o777, 0o600);
+        assert_eq!(std::fs::read_to_string(&path).unwrap(), "new");
+        let _ = std::fs::remove_dir_all(&dir);
+    }
+
+    #[test]
+    fn test_write_in_place_overwrites_existing_file() {
+        let dir = make_temp_dir();
+        let path = dir.join("data.json");
+        std::fs::write(&path, "a much longer old content").unwrap();
+
+        write_in_place(&path, b"new").unwrap();
+
+        assert_eq!(std::fs::read_to_string(&path).unwrap(), "new");
+        let _ = std::fs::remove_dir_all(&dir);
+    }
+
+    #[test]
+    fn test_writer_coalesces_and_flushes() {
+        let dir = make_temp_dir();
+        let path = dir.join("data.json");
+
+        let writer = PersistWriter::spawn();
+        for i in 0..3 {
+            writer.submit(path.clone(), format!("v{}", i).into_bytes());
+        }
+        writer.flush();
+
+        assert_eq!(std::fs::read_to_string(&path).unwrap(), "v2");
+        let stats = writer.stats();
+        assert_eq!(stats.failures, 0);
+        // 每次提交要么被合并，要么被写入
+        assert_eq!(stats.writes + stats.coalesced, 3);
+        let _ = std::fs::remove_dir_all(&dir);
+    }
+
+    #[test]
+    fn test_writer_renders_latest_submission_only() {
+        let dir = make_temp_dir();
+        let path = dir.join("data.json");
+        let rendered = Arc::new(AtomicU64::new(0));
+
+        let writer = PersistWriter::spawn();
+        let mut ticket = 0;
+        for i in 0..3 {
+            let rendered = rendered.clone();
+            ticket = writer.submit_with(path.clone(), move || {
+                rendered.fetch_add(1, Ordering::Relaxed);
+                Ok(format!("v{}", i).into_bytes())
+            });
+        }
+        writer.wait(&path, ticket).unwrap();
+
+        assert_eq!(std::fs::read_to_string(&path).unwrap(), "v2");
+        // 被合并的提交不会生成内容
+        assert_eq!(
+            rendered.load(Ordering::Relaxed),
+            3 - writer.stats().coalesced
+        );
+        let _ = std::fs::remove_dir_all(&dir);
+    }
+
+    #[test]
+    fn test_wait_reports_write_error() {
+        let dir = make_temp_dir();
+        let path = dir.join("missing").join("data.json");
+
+        let writer = PersistWriter::spawn();
+        let ticket = writer.submit(path.clone(), b"data".to_vec());
+        assert!(writer.wait(&path, ticket).is_err());
+
+        // 后续成功写入会覆盖之前的错误
+        std::fs::create_dir_all(path.parent().unwrap()).unwrap();
+        let ticket = writer.submit(path.clone(), b"data".to_vec());
+        writer.wait(&path, ticket).unwrap();
+        assert_eq!(writer.stats().failures, 1);
+        let _ = std::fs::remove_dir_all(&dir);
+    }
+
+    #[test]
+    fn test_writer_flushes_on_drop() {
+        let dir = make_temp_dir();
+        let path = dir.join("data.json");
+
+        {
+            let writer = PersistWriter::spawn();
+            writer.submit(path.clone(), b"final".to_vec());
+        }
+
+        assert_eq!(std::fs::read_to_string(&path).unwrap(), "final");
+        let _ = std::fs::remove_dir_all(&dir);
+    }
+}
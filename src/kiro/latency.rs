@@ -0,0 +1,324 @@
+//! 上游延迟统计与延迟熔断
+//!
+//! 以首字节时间（TTFB，即收到上游响应头的耗时）衡量上游延迟：
+//! - 全局滑动窗口：估算近期 TTFB 的分位数，用于计算对冲请求的触发阈值
+//! - 凭据级 EWMA：平滑单个凭据的 TTFB，延迟持续劣化的凭据由熔断器暂时摘除，
+//!   冷却后放行单个探测请求（half-open），探测正常则恢复
+
+use std::collections::VecDeque;
+use std::time::{Duration, Instant};
+
+use parking_lot::Mutex;
+
+/// EWMA 平滑系数（新样本权重）
+const TTFB_EWMA_ALPHA: f64 = 0.2;
+/// 全局 TTFB 窗口容量
+const TTFB_WINDOW_CAPACITY: usize = 512;
+
+/// 对冲阈值使用的分位数
+const HEDGE_PERCENTILE: f64 = 0.95;
+/// 窗口样本不足时使用的对冲阈值
+const HEDGE_DEFAULT_DELAY: Duration = Duration::from_secs(3);
+/// 计算分位数所需的最少样本数
+const HEDGE_MIN_SAMPLES: usize = 20;
+/// 对冲阈值下限
+const HEDGE_MIN_DELAY: Duration = Duration::from_millis(500);
+/// 对冲阈值上限
+const HEDGE_MAX_DELAY: Duration = Duration::from_secs(10);
+
+/// 凭据参与熔断判断所需的最少样本数
+const BREAKER_MIN_SAMPLES: u32 = 5;
+/// 熔断阈值下限：EWMA 低于此值的凭据不会被摘除
+const BREAKER_MIN_THRESHOLD: Duration = Duration::from_secs(10);
+/// 熔断阈值相对全局 TTFB 中位数的倍数
+const BREAKER_MEDIAN_FACTOR: u32 = 3;
+/// 熔断冷却时间，到期后进入 half-open 放行探测请求
+const BREAKER_COOLDOWN: Duration = Duration::from_secs(60);
+/// 探测请求超时：超过该时间仍未回报结果时允许发起新的探测
+const BREAKER_PROBE_TIMEOUT: Duration = Duration::from_secs(60);
+
+/// 全局 TTFB 滑动窗口
+#[derive(Default)]
+pub(crate) struct TtfbWindow {
+    /// 最近的 TTFB 样本（微秒）
+    samples: Mutex<VecDeque<u64>>,
+}
+
+impl TtfbWindow {
+    /// 记录一个样本
+    pub(crate) fn record(&self, ttfb: Duration) {
+        let mut samples = self.samples.lock();
+        if samples.len() >= TTFB_WINDOW_CAPACITY {
+            samples.pop_front();
+        }
+        samples.push_back(ttfb.as_micros() as u64);
+    }
+
+    /// 计算分位数（`q` 取值 0.0 ~ 1.0），样本不足时返回 None
+    pub(crate) fn percentile(&self, q: f64, min_samples: usize) -> Option<Duration> {
+        let mut sorted: Vec<u64> = {
+            let samples = self.samples.lock();
+            if samples.len() < min_samples.max(1) {
+                return None;
+            }
+            samples.iter().copied().collect()
+        };
+        let rank = ((sorted.len() - 1) as f64 * q.clamp(0.0, 1.0)).round() as usize;
+        let (_, value, _) = sorted.select_nth_unstable(rank);
+        Some(Duration::from_micros(*value))
+    }
+
+    /// 对冲请求的触发阈值
+    ///
+    /// 取近期 TTFB 的 p95 并限制在 [`HEDGE_MIN_DELAY`, `HEDGE_MAX_DELAY`] 内，
+    /// 样本不足时使用 `HEDGE_DEFAULT_DELAY`
+    pub(crate) fn hedge_delay(&self) -> Duration {
+        self.percentile(HEDGE_PERCENTILE, HEDGE_MIN_SAMPLES)
+            .unwrap_or(HEDGE_DEFAULT_DELAY)
+            .clamp(HEDGE_MIN_DELAY, HEDGE_MAX_DELAY)
+    }
+
+    /// 延迟熔断阈值：全局 TTFB 中位数的若干倍，且不低于 `BREAKER_MIN_THRESHOLD`
+    pub(crate) fn breaker_threshold(&self) -> Duration {
+        self.percentile(0.5, HEDGE_MIN_SAMPLES)
+            .map(|median| median * BREAKER_MEDIAN_FACTOR)
+            .unwrap_or_default()
+            .max(BREAKER_MIN_THRESHOLD)
+    }
+}
+
+/// 延迟熔断器状态
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+enum BreakerState {
+    /// 正常
+    Closed,
+    /// 已摘除，冷却到期前不参与选择
+    Open { until: Instant },
+    /// 冷却结束，等待（或正在进行）探测请求
+    HalfOpen { probe_started: Option<Instant> },
+}
+
+/// 熔断器状态变化（用于日志）
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub(crate) enum BreakerTransition {
+    /// 延迟劣化，已摘除
+    Opened,
+    /// 探测请求仍然过慢，重新摘除
+    Reopened,
+    /// 探测请求正常，已恢复
+    Closed,
+}
+
+struct LatencyState {
+    /// TTFB 的 EWMA（微秒）
+    ewma_micros: f64,
+    /// 样本数（饱和计数）
+    samples: u32,
+    breaker: BreakerState,
+}
+
+/// 凭据级延迟统计与熔断器
+pub(crate) struct CredentialLatency {
+    state: Mutex<LatencyState>,
+}
+
+impl Default for CredentialLatency {
+    fn default() -> Self {
+        Self {
+            state: Mutex::new(LatencyState {
+                ewma_micros: 0.0,
+                samples: 0,
+                breaker: BreakerState::Closed,
+            }),
+        }
+    }
+}
+
+impl std::fmt::Debug for CredentialLatency {
+    fn fmt(&self, f: &mut std::fmt::Formatter<'_>) -> std::fmt::Result {
+        let state = self.state.lock();
+        f.debug_struct("CredentialLatency")
+            .field("ewma_micros", &state.ewma_micros)
+            .field("samples", &state.samples)
+            .field("breaker", &state.breaker)
+            .finish()
+    }
+}
+
+impl CredentialLatency {
+    /// TTFB 的 EWMA，尚无样本时返回 None
+    pub(crate) fn ewma(&self) -> Option<Duration> {
+        let state = self.state.lock();
+        (state.samples > 0).then(|| Duration::from_micros(state.ewma_micros as u64))
+    }
+
+    /// 当前是否可以参与凭据选择
+    pub(crate) fn is_selectable(&self, now: Instant) -> bool {
+        match self.state.lock().breaker {
+            BreakerState::Closed => true,
+            BreakerState::Open { until } => now >= until,
+            BreakerState::HalfOpen { probe_started } => {
+                probe_started.is_none_or(|t| now.duration_since(t) >= BREAKER_PROBE_TIMEOUT)
+            }
+        }
+    }
+
+    /// 凭据被选中时调用：冷却结束的凭据进入 half-open，本次请求作为探测请求
+    pub(crate) fn on_selected(&self, now: Instant) {
+        let mut state = self.state.lock();
+        let start_probe = match state.breaker {
+            BreakerState::Closed => false,
+            BreakerState::Open { until } => now >= until,
+            BreakerState::HalfOpen { probe_started } => {
+                probe_started.is_none_or(|t| now.duration_since(t) >= BREAKER_PROBE_TIMEOUT)
+            }
+        };
+        if start_probe {
+            state.breaker = BreakerState::HalfOpen {
+                probe_started: Some(now),
+            };
+        }
+    }
+
+    /// 让熔断冷却立即到期（仅测试用）
+    #[cfg(test)]
+    pub(crate) fn expire_cooldown(&self, now: Instant) {
+        let mut state = self.state.lock();
+        if let BreakerState::Open { until } = &mut state.breaker {
+            *until = now;
+        }
+    }
+
+    /// 记录一个 TTFB 样本并更新熔断器
+    ///
+    /// `threshold` 为当前的熔断阈值（见 [`TtfbWindow::breaker_threshold`]）
+    pub(crate) fn record(
+        &self,
+        ttfb: Duration,
+        threshold: Duration,
+        now: Instant,
+    ) -> Option<BreakerTransition> {
+        let mut state = self.state.lock();
+        let sample = ttfb.as_micros() as f64;
+        state.ewma_micros = if state.samples == 0 {
+            sample
+        } else {
+            TTFB_EWMA_ALPHA * sample + (1.0 - TTFB_EWMA_ALPHA) * state.ewma_micros
+        };
+        state.samples = state.samples.saturating_add(1);
+
+        let threshold_micros = threshold.as_micros() as f64;
+        match state.breaker {
+            BreakerState::Closed => {
+                if state.samples >= BREAKER_MIN_SAMPLES && state.ewma_micros > threshold_micros {
+                    state.breaker = BreakerState::Open {
+                        until: now + BREAKER_COOLDOWN,
+                    };
+                    return Some(BreakerTransition::Opened);
+                }
+                None
+            }
+            BreakerState::HalfOpen { .. } => {
+                if sample <= threshold_micros {
+                    // 探测正常：恢复并以本次样本重新开始平滑，避免历史慢样本立即再次触发
+                    state.ewma_micros = sample;
+                    state.samples = 1;
+                    state.breaker = BreakerState::Closed;
+                    Some(BreakerTransition::Closed)
+                } else {
+                    state.breaker = BreakerState::Open {
+                        until: now + BREAKER_COOLDOWN,
+                    };
+                    Some(BreakerTransition::Reopened)
+                }
+            }
+            // 摘除前发出的请求晚到的样本，只更新 EWMA
+            BreakerState::Open { .. } => None,
+        }
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    #[test]
+    fn test_ttfb_window_percentile_and_hedge_delay() {
+        let window = TtfbWindow::default();
+        assert_eq!(window.hedge_delay(), HEDGE_DEFAULT_DELAY);
+        assert_eq!(window.breaker_threshold(), BREAKER_MIN_THRESHOLD);
+
+        for ms in 1..=100 {
+            window.record(Duration::from_millis(ms * 20));
+        }
+        assert_eq!(window.percentile(0.5, 1), Some(Duration::from_millis(1020)));
+        assert_eq!(window.hedge_delay(), Duration::from_millis(1900));
+        assert_eq!(window.breaker_threshold(), Duration::from_secs(10));
+
+        // 窗口满后淘汰最早的样本
+        for _ in 0..TTFB_WINDOW_CAPACITY {
+            window.record(Duration::from_secs(60));
+        }
+        assert_eq!(window.hedge_delay(), HEDGE_MAX_DELAY);
+        assert_eq!(window.breaker_threshold(), Duration::from_secs(180));
+    }
+
+    #[test]
+    fn test_breaker_opens_on_slow_ewma_and_recovers_after_probe() {
+        let latency = CredentialLatency::default();
+        let threshold = Duration::from_secs(10);
+        let now = Instant::now();
+
+        // 样本不足时不会摘除
+        for _ in 0..BREAKER_MIN_SAMPLES - 1 {
+            assert_eq!(
+                latency.record(Duration::from_secs(30), threshold, now),
+                None
+            );
+        }
+        assert!(latency.is_selectable(now));
+        assert_eq!(
+            latency.record(Duration::from_secs(30), threshold, now),
+            Some(BreakerTransition::Opened)
+        );
+        assert!(!latency.is_selectable(now));
+
+        // 冷却结束后放行一个探测请求
+        let later = now + BREAKER_COOLDOWN;
+        assert!(latency.is_selectable(later));
+        latency.on_selected(later);
+        assert!(!latency.is_selectable(later));
+
+        // 探测仍然过慢：重新摘除
+        assert_eq!(
+            latency.record(Duration::from_secs(30), threshold, later),
+            Some(BreakerTransition::Reopened)
+        );
+        assert!(!latency.is_selectable(later));
+
+        // 再次探测正常：恢复
+        let much_later = later + BREAKER_COOLDOWN;
+        latency.on_selected(much_later);
+        assert_eq!(
+            latency.record(Duration::from_secs(1), threshold, much_later),
+            Some(BreakerTransition::Closed)
+        );
+        assert!(latency.is_selectable(much_later));
+        assert_eq!(latency.ewma(), Some(Duration::from_secs(1)));
+    }
+
+    #[test]
+    fn test_breaker_allows_new_probe_after_probe_timeout() {
+        let latency = CredentialLatency::default();
+        let now = Instant::now();
+        for _ in 0..BREAKER_MIN_SAMPLES {
+            latency.record(Duration::from_secs(30), Duration::from_secs(10), now);
+        }
+
+        let probe_at = now + BREAKER_COOLDOWN;
+        latency.on_selected(probe_at);
+        assert!(!latency.is_selectable(probe_at));
+        // 探测请求失败且未回报 TTFB 时，超时后允许新的探测
+        assert!(latency.is_selectable(probe_at + BREAKER_PROBE_TIMEOUT));
+    }
+}
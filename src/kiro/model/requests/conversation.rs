@@ -2,6 +2,8 @@
 //!
 //! 定义 Kiro API 中对话相关的类型，包括消息、历史记录等
 
+use std::sync::Arc;
+
 use serde::{Deserialize, Serialize};
 
 use super::tool::{Tool, ToolResult, ToolUseEntry};
@@ -26,8 +28,10 @@ pub struct ConversationState {
     /// 会话 ID
     pub conversation_id: String,
     /// 历史消息列表
+    ///
+    /// 与会话历史缓存共享同一份转换结果，序列化时直接读取，无需克隆
     #[serde(default, skip_serializing_if = "Vec::is_empty")]
-    pub history: Vec<Message>,
+    pub history: Vec<Arc<Message>>,
 }
 
 impl ConversationState {
@@ -68,7 +72,7 @@ impl ConversationState {
     }
 
     /// 添加历史消息
-    pub fn with_history(mut self, history: Vec<Message>) -> Self {
+    pub fn with_history(mut self, history: Vec<Arc<Message>>) -> Self {
         self.history = history;
         self
     }
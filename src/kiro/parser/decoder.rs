@@ -32,6 +32,7 @@
 
 use super::error::{ParseError, ParseResult};
 use super::frame::{Frame, PRELUDE_SIZE, parse_frame};
+use crate::common::metrics::metrics;
 use bytes::{Buf, BytesMut};
 
 /// 默认最大缓冲区大小 (16 MB)
@@ -84,6 +85,9 @@ pub enum DecoderState {
 ///     }
 /// }
 /// ```
+///
+/// 解码统计（帧数、错误数、跳过字节数、缓冲区高水位）在本地累计，
+/// 解码器重置或释放时一次性汇总到全局指标，避免每帧一次原子操作
 pub struct EventStreamDecoder {
     /// 内部缓冲区
     buffer: BytesMut,
@@ -99,6 +103,10 @@ pub struct EventStreamDecoder {
     max_buffer_size: usize,
     /// 跳过的字节数（用于调试）
     bytes_skipped: usize,
+    /// 累计解码错误数（不因成功解码而重置）
+    errors_total: usize,
+    /// 缓冲区高水位（字节）
+    buffer_high_water: usize,
 }
 
 impl Default for EventStreamDecoder {
@@ -123,6 +131,8 @@ impl EventStreamDecoder {
             max_errors: DEFAULT_MAX_ERRORS,
             max_buffer_size: DEFAULT_MAX_BUFFER_SIZE,
             bytes_skipped: 0,
+            errors_total: 0,
+            buffer_high_water: 0,
         }
     }
 
@@ -136,6 +146,8 @@ impl EventStreamDecoder {
             max_errors,
             max_buffer_size,
             bytes_skipped: 0,
+            errors_total: 0,
+            buffer_high_water: 0,
         }
     }
 
@@ -155,6 +167,7 @@ impl EventStreamDecoder {
         }
 
         self.buffer.extend_from_slice(data);
+        self.buffer_high_water = self.buffer_high_water.max(self.buffer.len());
 
         // 从 Recovering 状态恢复到 Ready
         if self.state == DecoderState::Recovering {
@@ -204,11 +217,13 @@ impl EventStreamDecoder {
             }
             Err(e) => {
                 self.error_count += 1;
+                self.errors_total += 1;
                 let error_msg = e.to_string();
 
                 // 检查是否超过最大错误数
                 if self.error_count >= self.max_errors {
                     self.state = DecoderState::Stopped;
+                    metrics().decoder_stopped.inc();
                     tracing::error!(
                         "解码器停止: 连续 {} 次错误，最后错误: {}",
                         self.error_count,
@@ -309,11 +324,24 @@ impl EventStreamDecoder {
     ///
     /// 清空缓冲区和所有计数器，恢复到 Ready 状态
     pub fn reset(&mut self) {
+        self.report_metrics();
         self.buffer.clear();
         self.state = DecoderState::Ready;
         self.frames_decoded = 0;
         self.error_count = 0;
         self.bytes_skipped = 0;
+        self.errors_total = 0;
+        self.buffer_high_water = 0;
+    }
+
+    /// 将本地累计的解码统计汇总到全局指标
+    fn report_metrics(&self) {
+        let m = metrics();
+        m.decoder_frames_decoded.add(self.frames_decoded as u64);
+        m.decoder_errors.add(self.errors_total as u64);
+        m.decoder_bytes_skipped.add(self.bytes_skipped as u64);
+        m.decoder_buffer_high_water
+            .observe(self.buffer_high_water as u64);
     }
 
     /// 获取当前状态
@@ -369,6 +397,12 @@ impl EventStreamDecoder {
     }
 }
 
+impl Drop for EventStreamDecoder {
+    fn drop(&mut self) {
+        self.report_metrics();
+    }
+}
+
 /// 解码迭代器
 pub struct DecodeIter<'a> {
     decoder: &'a mut EventStreamDecoder,
@@ -412,6 +446,33 @@ mod tests {
         assert_eq!(decoder.buffer_len(), 4);
     }
 
+    #[test]
+    fn test_decoder_reports_metrics_on_drop() {
+        let frames_before = metrics().decoder_frames_decoded.get();
+        let errors_before = metrics().decoder_errors.get();
+        {
+            let mut decoder = EventStreamDecoder::new();
+            // 一个最小的合法帧：prelude(12) + message_crc(4)，无 header、无 payload
+            let mut frame = Vec::new();
+            frame.extend_from_slice(&16u32.to_be_bytes());
+            frame.extend_from_slice(&0u32.to_be_bytes());
+            let prelude_crc = super::super::crc::crc32(&frame);
+            frame.extend_from_slice(&prelude_crc.to_be_bytes());
+            let message_crc = super::super::crc::crc32(&frame);
+            frame.extend_from_slice(&message_crc.to_be_bytes());
+
+            decoder.feed(&frame).unwrap();
+            decoder.feed(&[0xff; 16]).unwrap();
+            assert!(decoder.decode().unwrap().is_some());
+            assert!(decoder.decode().is_err());
+            assert_eq!(decoder.frames_decoded(), 1);
+        }
+        // 其他测试可能并发更新全局指标，只检查增量下限
+        assert!(metrics().decoder_frames_decoded.get() >= frames_before + 1);
+        assert!(metrics().decoder_errors.get() >= errors_before + 1);
+        assert!(metrics().decoder_buffer_high_water.get() >= 32);
+    }
+
     #[test]
     fn test_decoder_buffer_overflow() {
         let mut decoder = EventStreamDecoder::with_config(1024, 5, 100);
@@ -153,6 +153,37 @@ pub fn parse_frame(buffer: &[u8]) -> ParseResult<Option<(Frame, usize)>> {
     Ok(Some((Frame { headers, payload }, total_length)))
 }
 
+/// 编码一个消息帧（`parse_frame` 的逆过程）
+///
+/// 只支持字符串类型的头部，用于基准测试和本地 Mock 上游构造事件流
+pub fn encode_frame(headers: &[(&str, &str)], payload: &[u8]) -> Vec<u8> {
+    let header_length: usize = headers
+        .iter()
+        .map(|(name, value)| 1 + name.len() + 1 + 2 + value.len())
+        .sum();
+    let total_length = PRELUDE_SIZE + header_length + payload.len() + 4;
+
+    let mut buffer = Vec::with_capacity(total_length);
+    buffer.extend_from_slice(&(total_length as u32).to_be_bytes());
+    buffer.extend_from_slice(&(header_length as u32).to_be_bytes());
+    let prelude_crc = crc32(&buffer);
+    buffer.extend_from_slice(&prelude_crc.to_be_bytes());
+
+    for (name, value) in headers {
+        buffer.push(name.len() as u8);
+        buffer.extend_from_slice(name.as_bytes());
+        // 7 = String
+        buffer.push(7);
+        buffer.extend_from_slice(&(value.len() as u16).to_be_bytes());
+        buffer.extend_from_slice(value.as_bytes());
+    }
+    buffer.extend_from_slice(payload);
+
+    let message_crc = crc32(&buffer);
+    buffer.extend_from_slice(&message_crc.to_be_bytes());
+    buffer
+}
+
 #[cfg(test)]
 mod tests {
     use super::*;
@@ -175,4 +206,22 @@ mod tests {
         let result = parse_frame(&buffer);
         assert!(matches!(result, Err(ParseError::MessageTooSmall { .. })));
     }
+
+    #[test]
+    fn test_encode_frame_roundtrip() {
+        let payload = br#"{"content":"Hello"}"#;
+        let encoded = encode_frame(
+            &[
+                (":message-type", "event"),
+                (":event-type", "assistantResponseEvent"),
+            ],
+            payload,
+        );
+
+        let (frame, consumed) = parse_frame(&encoded).unwrap().unwrap();
+        assert_eq!(consumed, encoded.len());
+        assert_eq!(frame.message_type(), Some("event"));
+        assert_eq!(frame.event_type(), Some("assistantResponseEvent"));
+        assert_eq!(frame.payload, payload);
+    }
 }
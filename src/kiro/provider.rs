@@ -4,18 +4,23 @@
 //! 支持流式和非流式请求
 //! 支持多凭据故障转移和重试
 
+use bytes::Bytes;
+use futures::{Stream, StreamExt};
 use reqwest::Client;
 use reqwest::header::{AUTHORIZATION, CONNECTION, CONTENT_TYPE, HOST, HeaderMap, HeaderValue};
 use std::collections::HashMap;
+use std::pin::Pin;
 use std::sync::Arc;
-use std::time::Duration;
+use std::task::{Context, Poll, ready};
+use std::time::{Duration, Instant};
 use tokio::time::sleep;
 use uuid::Uuid;
 
+use crate::common::metrics::metrics;
 use crate::http_client::{ProxyConfig, build_client};
 use crate::kiro::machine_id;
 use crate::kiro::model::credentials::KiroCredentials;
-use crate::kiro::token_manager::{CallContext, MultiTokenManager};
+use crate::kiro::token_manager::{CallContext, InFlightGuard, MultiTokenManager};
 use crate::model::config::TlsBackend;
 use parking_lot::Mutex;
 
@@ -25,6 +30,81 @@ const MAX_RETRIES_PER_CREDENTIAL: usize = 3;
 /// 总重试次数硬上限（避免无限重试）
 const MAX_TOTAL_RETRIES: usize = 9;
 
+/// 上游失败响应的分类
+///
+/// 决定是否计入凭据失败，以及重试循环是重试、切换凭据还是直接返回
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+enum FailureKind {
+    /// 402 且额度用尽：禁用凭据并故障转移
+    QuotaExhausted,
+    /// 400：请求问题，重试/切换凭据无意义
+    BadRequest,
+    /// 401/403：更可能是凭据/权限问题，计入失败并允许故障转移
+    Credential,
+    /// 408/429/5xx：瞬态上游错误，重试但不禁用或切换凭据
+    Transient,
+    /// 其他 4xx：通常为请求/配置问题，直接返回，不计入凭据失败
+    Client,
+    /// 其他状态码：当作可重试的瞬态错误处理
+    Unknown,
+}
+
+/// Kiro API 成功响应
+///
+/// 持有所选凭据的在途请求计数，直到响应体读完、流结束或被丢弃（客户端断开）时才归还，
+/// 使 `least-in-flight` 模式按实际进行中的流式响应数量均衡，而不是按握手耗时
+pub struct ApiResponse {
+    response: reqwest::Response,
+    in_flight: Option<InFlightGuard>,
+}
+
+impl ApiResponse {
+    fn new(response: reqwest::Response, in_flight: Option<InFlightGuard>) -> Self {
+        Self {
+            response,
+            in_flight,
+        }
+    }
+
+    /// 读取完整响应体，读完后归还在途计数
+    pub async fn bytes(self) -> reqwest::Result<Bytes> {
+        let Self {
+            response,
+            in_flight,
+        } = self;
+        let result = response.bytes().await;
+        drop(in_flight);
+        result
+    }
+
+    /// 转换为字节流，流结束或被丢弃时归还在途计数
+    pub fn bytes_stream(self) -> impl Stream<Item = reqwest::Result<Bytes>> + Send + Unpin {
+        InFlightStream {
+            body: Box::pin(self.response.bytes_stream()),
+            in_flight: self.in_flight,
+        }
+    }
+}
+
+/// 携带在途计数守卫的响应体字节流
+struct InFlightStream<S> {
+    body: S,
+    in_flight: Option<InFlightGuard>,
+}
+
+impl<S: Stream + Unpin> Stream for InFlightStream<S> {
+    type Item = S::Item;
+
+    fn poll_next(mut self: Pin<&mut Self>, cx: &mut Context<'_>) -> Poll<Option<Self::Item>> {
+        let item = ready!(self.body.poll_next_unpin(cx));
+        if item.is_none() {
+            // 上游流已结束，无需等到下游丢弃流再归还
+            self.in_flight = None;
+        }
+        Poll::Ready(item)
+    }
+}
+
 /// Kiro API Provider
 ///
 /// 核心组件，负责与 Kiro API 通信
@@ -82,18 +162,16 @@ impl KiroProvider {
 
     /// 获取 API 基础 URL（使用 config 级 api_region）
     pub fn base_url(&self) -> String {
-        format!(
-            "https://q.{}.amazonaws.com/generateAssistantResponse",
-            self.token_manager.config().effective_api_region()
-        )
+        self.token_manager
+            .config()
+            .upstream_url(&self.base_domain(), "/generateAssistantResponse")
     }
 
     /// 获取 MCP API URL（使用 config 级 api_region）
     pub fn mcp_url(&self) -> String {
-        format!(
-            "https://q.{}.amazonaws.com/mcp",
-            self.token_manager.config().effective_api_region()
-        )
+        self.token_manager
+            .config()
+            .upstream_url(&self.base_domain(), "/mcp")
     }
 
     /// 获取 API 基础域名（使用 config 级 api_region）
@@ -103,18 +181,17 @@ impl KiroProvider {
 
     /// 获取凭据级 API 基础 URL
     fn base_url_for(&self, credentials: &KiroCredentials) -> String {
-        format!(
-            "https://q.{}.amazonaws.com/generateAssistantResponse",
-            credentials.effective_api_region(self.token_manager.config())
+        self.token_manager.config().upstream_url(
+            &self.base_domain_for(credentials),
+            "/generateAssistantResponse",
         )
     }
 
     /// 获取凭据级 MCP API URL
     fn mcp_url_for(&self, credentials: &KiroCredentials) -> String {
-        format!(
-            "https://q.{}.amazonaws.com/mcp",
-            credentials.effective_api_region(self.token_manager.config())
-        )
+        self.token_manager
+            .config()
+            .upstream_url(&self.base_domain_for(credentials), "/mcp")
     }
 
     /// 获取凭据级 API 基础域名
@@ -254,8 +331,8 @@ impl KiroProvider {
     /// * `request_body` - JSON 格式的请求体字符串
     ///
     /// # Returns
-    /// 返回原始的 HTTP Response，不做解析
-    pub async fn call_api(&self, request_body: &str) -> anyhow::Result<reqwest::Response> {
+    /// 返回成功的 HTTP 响应，不做解析
+    pub async fn call_api(&self, request_body: &str) -> anyhow::Result<ApiResponse> {
         self.call_api_with_retry(request_body, false).await
     }
 
@@ -271,8 +348,8 @@ impl KiroProvider {
     /// * `request_body` - JSON 格式的请求体字符串
     ///
     /// # Returns
-    /// 返回原始的 HTTP Response，调用方负责处理流式数据
-    pub async fn call_api_stream(&self, request_body: &str) -> anyhow::Result<reqwest::Response> {
+    /// 返回成功的 HTTP 响应，调用方负责处理流式数据
+    pub async fn call_api_stream(&self, request_body: &str) -> anyhow::Result<ApiResponse> {
         self.call_api_with_retry(request_body, true).await
     }
 
@@ -415,11 +492,34 @@ impl KiroProvider {
     /// - 每个凭据最多重试 MAX_RETRIES_PER_CREDENTIAL 次
     /// - 总重试次数 = min(凭据数量 × 每凭据重试次数, MAX_TOTAL_RETRIES)
     /// - 硬上限 9 次，避免无限重试
+    /// - 启用对冲时，每次尝试最多额外发起一个对冲请求（见 `send_with_hedge`），不计入重试次数
     async fn call_api_with_retry(
         &self,
         request_body: &str,
         is_stream: bool,
-    ) -> anyhow::Result<reqwest::Response> {
+    ) -> anyhow::Result<ApiResponse> {
+        let mut attempts = 0;
+        let result = self
+            .call_api_attempts(request_body, is_stream, &mut attempts)
+            .await;
+
+        let m = metrics();
+        m.api_attempts_per_request.observe(attempts as f64);
+        if result.is_ok() {
+            m.api_requests_succeeded.inc();
+        } else {
+            m.api_requests_failed.inc();
+        }
+        result
+    }
+
+    /// `call_api_with_retry` 的重试循环，`attempts` 记录实际尝试次数
+    async fn call_api_attempts(
+        &self,
+        request_body: &str,
+        is_stream: bool,
+        attempts: &mut usize,
+    ) -> anyhow::Result<ApiResponse> {
         let total_credentials = self.token_manager.total_count();
         let max_retries = (total_credentials * MAX_RETRIES_PER_CREDENTIAL).min(MAX_TOTAL_RETRIES);
         let mut last_error: Option<anyhow::Error> = None;
@@ -429,6 +529,8 @@ impl KiroProvider {
         let model = Self::extract_model_from_request(request_body);
 
         for attempt in 0..max_retries {
+            *attempts = attempt + 1;
+
             // 获取调用上下文（绑定 index、credentials、token）
             let ctx = match self.token_manager.acquire_context(model.as_deref()).await {
                 Ok(c) => c,
@@ -438,7 +540,6 @@ impl KiroProvider {
                 }
             };
 
-            let url = self.base_url_for(&ctx.credentials);
             let headers = match self.build_headers(&ctx) {
                 Ok(h) => h,
                 Err(e) => {
@@ -447,15 +548,11 @@ impl KiroProvider {
                 }
             };
 
-            // 发送请求
-            let response = match self
-                .client_for(&ctx.credentials)?
-                .post(&url)
-                .headers(headers)
-                .body(request_body.to_string())
-                .send()
-                .await
-            {
+            // 发送请求（启用对冲时，ctx 为最终采用的响应所对应的上下文）
+            let (ctx, result) = self
+                .send_with_hedge(ctx, headers, request_body, model.as_deref())
+                .await;
+            let response = match result {
                 Ok(resp) => resp,
                 Err(e) => {
                     tracing::warn!(
@@ -466,7 +563,7 @@ impl KiroProvider {
                     );
                     // 网络错误通常是上游/链路瞬态问题，不应导致"禁用凭据"或"切换凭据"
                     // （否则一段时间网络抖动会把所有凭据都误禁用，需要重启才能恢复）
-                    last_error = Some(e.into());
+                    last_error = Some(e);
                     if attempt + 1 < max_retries {
                         sleep(Self::retry_delay(attempt)).await;
                     }
@@ -476,121 +573,100 @@ impl KiroProvider {
 
             let status = response.status();
 
-            // 成功响应
+            // 成功响应：在途计数随响应体一起交给调用方
             if status.is_success() {
                 self.token_manager.report_success(ctx.id);
-                return Ok(response);
+                return Ok(ApiResponse::new(response, ctx.in_flight));
             }
 
             // 失败响应：读取 body 用于日志/错误信息
             let body = response.text().await.unwrap_or_default();
 
-            // 402 Payment Required 且额度用尽：禁用凭据并故障转移
-            if status.as_u16() == 402 && Self::is_monthly_request_limit(&body) {
-                tracing::warn!(
-                    "API 请求失败（额度已用尽，禁用凭据并切换，尝试 {}/{}）: {} {}",
-                    attempt + 1,
-                    max_retries,
-                    status,
-                    body
-                );
-
-                let has_available = self.token_manager.report_quota_exhausted(ctx.id);
-                if !has_available {
-                    anyhow::bail!(
-                        "{} API 请求失败（所有凭据已用尽）: {} {}",
-                        api_type,
+            let kind = Self::classify_failure(status, &body);
+            match kind {
+                // 402 Payment Required 且额度用尽：禁用凭据并故障转移
+                FailureKind::QuotaExhausted => {
+                    tracing::warn!(
+                        "API 请求失败（额度已用尽，禁用凭据并切换，尝试 {}/{}）: {} {}",
+                        attempt + 1,
+                        max_retries,
                         status,
                         body
                     );
-                }
-
-                last_error = Some(anyhow::anyhow!(
-                    "{} API 请求失败: {} {}",
-                    api_type,
-                    status,
-                    body
-                ));
-                continue;
-            }
-
-            // 400 Bad Request - 请求问题，重试/切换凭据无意义
-            if status.as_u16() == 400 {
-                anyhow::bail!("{} API 请求失败: {} {}", api_type, status, body);
-            }
 
-            // 401/403 - 更可能是凭据/权限问题：计入失败并允许故障转移
-            if matches!(status.as_u16(), 401 | 403) {
-                tracing::warn!(
-                    "API 请求失败（可能为凭据错误，尝试 {}/{}）: {} {}",
-                    attempt + 1,
-                    max_retries,
-                    status,
-                    body
-                );
+                    let has_available = self.token_manager.report_quota_exhausted(ctx.id);
+                    if !has_available {
+                        anyhow::bail!(
+                            "{} API 请求失败（所有凭据已用尽）: {} {}",
+                            api_type,
+                            status,
+                            body
+                        );
+                    }
 
-                let has_available = self.token_manager.report_failure(ctx.id);
-                if !has_available {
-                    anyhow::bail!(
-                        "{} API 请求失败（所有凭据已用尽）: {} {}",
+                    last_error = Some(anyhow::anyhow!(
+                        "{} API 请求失败: {} {}",
                         api_type,
                         status,
                         body
-                    );
+                    ));
                 }
-
-                last_error = Some(anyhow::anyhow!(
-                    "{} API 请求失败: {} {}",
-                    api_type,
-                    status,
-                    body
-                ));
-                continue;
-            }
-
-            // 429/408/5xx - 瞬态上游错误：重试但不禁用或切换凭据
-            // （避免 429 high traffic / 502 high load 等瞬态错误把所有凭据锁死）
-            if matches!(status.as_u16(), 408 | 429) || status.is_server_error() {
-                tracing::warn!(
-                    "API 请求失败（上游瞬态错误，尝试 {}/{}）: {} {}",
-                    attempt + 1,
-                    max_retries,
-                    status,
-                    body
-                );
-                last_error = Some(anyhow::anyhow!(
-                    "{} API 请求失败: {} {}",
-                    api_type,
-                    status,
-                    body
-                ));
-                if attempt + 1 < max_retries {
-                    sleep(Self::retry_delay(attempt)).await;
+                // 400 及其他 4xx：请求/配置问题，重试/切换凭据无意义，不计入凭据失败
+                FailureKind::BadRequest | FailureKind::Client => {
+                    anyhow::bail!("{} API 请求失败: {} {}", api_type, status, body);
                 }
-                continue;
-            }
+                // 401/403：计入失败并允许故障转移
+                FailureKind::Credential => {
+                    tracing::warn!(
+                        "API 请求失败（可能为凭据错误，尝试 {}/{}）: {} {}",
+                        attempt + 1,
+                        max_retries,
+                        status,
+                        body
+                    );
 
-            // 其他 4xx - 通常为请求/配置问题：直接返回，不计入凭据失败
-            if status.is_client_error() {
-                anyhow::bail!("{} API 请求失败: {} {}", api_type, status, body);
-            }
+                    let has_available = self.token_manager.report_failure(ctx.id);
+                    if !has_available {
+                        anyhow::bail!(
+                            "{} API 请求失败（所有凭据已用尽）: {} {}",
+                            api_type,
+                            status,
+                            body
+                        );
+                    }
 
-            // 兜底：当作可重试的瞬态错误处理（不切换凭据）
-            tracing::warn!(
-                "API 请求失败（未知错误，尝试 {}/{}）: {} {}",
-                attempt + 1,
-                max_retries,
-                status,
-                body
-            );
-            last_error = Some(anyhow::anyhow!(
-                "{} API 请求失败: {} {}",
-                api_type,
-                status,
-                body
-            ));
-            if attempt + 1 < max_retries {
-                sleep(Self::retry_delay(attempt)).await;
+                    last_error = Some(anyhow::anyhow!(
+                        "{} API 请求失败: {} {}",
+                        api_type,
+                        status,
+                        body
+                    ));
+                }
+                // 避免 429 high traffic / 502 high load 等瞬态错误把所有凭据锁死
+                FailureKind::Transient | FailureKind::Unknown => {
+                    let reason = if kind == FailureKind::Transient {
+                        "上游瞬态错误"
+                    } else {
+                        "未知错误"
+                    };
+                    tracing::warn!(
+                        "API 请求失败（{}，尝试 {}/{}）: {} {}",
+                        reason,
+                        attempt + 1,
+                        max_retries,
+                        status,
+                        body
+                    );
+                    last_error = Some(anyhow::anyhow!(
+                        "{} API 请求失败: {} {}",
+                        api_type,
+                        status,
+                        body
+                    ));
+                    if attempt + 1 < max_retries {
+                        sleep(Self::retry_delay(attempt)).await;
+                    }
+                }
             }
         }
 
@@ -604,6 +680,187 @@ impl KiroProvider {
         }))
     }
 
+    /// 发送单个 API 请求，收到成功响应头时记录首字节延迟
+    ///
+    /// 同时按状态码分类计数上游响应，发送失败计入 `upstream_send_errors`
+    async fn send_api_request(
+        &self,
+        id: u64,
+        credentials: Arc<KiroCredentials>,
+        headers: HeaderMap,
+        request_body: &str,
+    ) -> anyhow::Result<reqwest::Response> {
+        let client = self.client_for(&credentials)?;
+        let started = Instant::now();
+        let response = client
+            .post(self.base_url_for(&credentials))
+            .headers(headers)
+            .body(request_body.to_string())
+            .send()
+            .await
+            .inspect_err(|_| metrics().upstream_send_errors.inc())?;
+
+        let m = metrics();
+        let status = response.status();
+        if status.is_success() {
+            let ttfb = started.elapsed();
+            m.upstream_responses_2xx.inc();
+            m.upstream_ttfb.observe_duration(ttfb);
+            m.credential_ttfb.observe_duration(id, ttfb);
+            self.token_manager.report_ttfb(id, ttfb);
+        } else if status.is_client_error() {
+            m.upstream_responses_4xx.inc();
+        } else if status.is_server_error() {
+            m.upstream_responses_5xx.inc();
+        }
+        Ok(response)
+    }
+
+    /// 发送 API 请求，启用对冲时在首字节超时后通过其他凭据发起对冲请求
+    ///
+    /// - 未启用对冲，或主请求在对冲阈值（近期首字节延迟 p95）内返回：直接使用主请求结果
+    /// - 超过阈值：通过另一个凭据发起对冲请求，先返回成功响应的一方胜出，
+    ///   另一方被取消（drop 即中断连接）；被取消的主请求以已等待时长计入延迟统计
+    /// - 两个请求都失败：返回主请求的结果，交由调用方的重试逻辑处理；
+    ///   对冲请求的失败响应按与主请求相同的分类计入其凭据状态（额度用尽、凭据错误）
+    /// - 主请求失败而对冲请求成功：主请求的失败响应同样计入主凭据状态
+    ///
+    /// 返回最终采用的调用上下文及其响应
+    async fn send_with_hedge(
+        &self,
+        ctx: CallContext,
+        headers: HeaderMap,
+        request_body: &str,
+        model: Option<&str>,
+    ) -> (CallContext, anyhow::Result<reqwest::Response>) {
+        let primary_id = ctx.id;
+        let primary =
+            self.send_api_request(primary_id, ctx.credentials.clone(), headers, request_body);
+        if !self.token_manager.config().hedge_requests {
+            let result = primary.await;
+            return (ctx, result);
+        }
+
+        let hedge_delay = self.token_manager.hedge_delay();
+        let started = Instant::now();
+        tokio::pin!(primary);
+        tokio::select! {
+            result = &mut primary => return (ctx, result),
+            _ = sleep(hedge_delay) => {}
+        }
+
+        // 外层错误表示未能发起对冲请求（如没有其他可用凭据）
+        let hedge = async {
+            let hedge_ctx = self
+                .token_manager
+                .acquire_hedge_context(model, primary_id)
+                .await?;
+            let headers = self.build_headers(&hedge_ctx)?;
+            tracing::info!(
+                "凭据 #{} 首字节超过 {:?}，通过凭据 #{} 发起对冲请求",
+                primary_id,
+                hedge_delay,
+                hedge_ctx.id
+            );
+            metrics().hedged_requests.inc();
+            let result = match self
+                .send_api_request(
+                    hedge_ctx.id,
+                    hedge_ctx.credentials.clone(),
+                    headers,
+                    request_body,
+                )
+                .await
+            {
+                Ok(response) if !response.status().is_success() => {
+                    Err(self.report_failed_response(hedge_ctx.id, response).await)
+                }
+                result => result,
+            };
+            anyhow::Ok((hedge_ctx, result))
+        };
+        tokio::pin!(hedge);
+
+        let mut primary_result = None;
+        let mut hedge_done = false;
+        loop {
+            tokio::select! {
+                result = &mut primary, if primary_result.is_none() => {
+                    if hedge_done || Self::is_success(&result) {
+                        return (ctx, result);
+                    }
+                    // 主请求失败：暂存响应，等待对冲请求的结果
+                    primary_result = Some(result);
+                }
+                hedged = &mut hedge, if !hedge_done => {
+                    hedge_done = true;
+                    match hedged {
+                        // 对冲请求只返回成功响应，失败响应已在 report_failed_response 中计入凭据状态
+                        Ok((hedge_ctx, Ok(response))) => {
+                            metrics().hedge_wins.inc();
+                            match primary_result.take() {
+                                None => {
+                                    tracing::info!("对冲请求（凭据 #{}）先于主请求返回，取消主请求", hedge_ctx.id);
+                                    self.token_manager.report_ttfb(primary_id, started.elapsed());
+                                }
+                                // 主请求的失败响应不会再交给重试循环，在此计入主凭据状态
+                                Some(Ok(failed)) => {
+                                    let error = self.report_failed_response(primary_id, failed).await;
+                                    tracing::warn!("主请求（凭据 #{}）失败，已由对冲请求（凭据 #{}）接替: {}", primary_id, hedge_ctx.id, error);
+                                }
+                                // 发送失败与重试循环一致，不计入凭据状态
+                                Some(Err(_)) => {}
+                            }
+                            return (hedge_ctx, Ok(response));
+                        }
+                        Ok((hedge_ctx, Err(e))) => {
+                            tracing::warn!("对冲请求（凭据 #{}）失败: {}", hedge_ctx.id, e);
+                        }
+                        Err(e) => tracing::debug!("未发起对冲请求: {}", e),
+                    }
+                    if let Some(result) = primary_result.take() {
+                        return (ctx, result);
+                    }
+                }
+            }
+        }
+    }
+
+    /// 不经过重试循环的失败响应（对冲请求，或被对冲请求接替的主请求）：
+    /// 按与重试循环相同的分类计入凭据状态，返回用于日志的错误
+    async fn report_failed_response(&self, id: u64, response: reqwest::Response) -> anyhow::Error {
+        let status = response.status();
+        let body = response.text().await.unwrap_or_default();
+        // 是否重试由最终采用的结果决定，这里只更新该凭据的状态
+        match Self::classify_failure(status, &body) {
+            FailureKind::QuotaExhausted => {
+                self.token_manager.report_quota_exhausted(id);
+            }
+            FailureKind::Credential => {
+                self.token_manager.report_failure(id);
+            }
+            _ => {}
+        }
+        anyhow::anyhow!("{} {}", status, body)
+    }
+
+    /// 对上游失败响应分类
+    fn classify_failure(status: reqwest::StatusCode, body: &str) -> FailureKind {
+        match status.as_u16() {
+            402 if Self::is_monthly_request_limit(body) => FailureKind::QuotaExhausted,
+            400 => FailureKind::BadRequest,
+            401 | 403 => FailureKind::Credential,
+            408 | 429 => FailureKind::Transient,
+            _ if status.is_server_error() => FailureKind::Transient,
+            _ if status.is_client_error() => FailureKind::Client,
+            _ => FailureKind::Unknown,
+        }
+    }
+
+    fn is_success(result: &anyhow::Result<reqwest::Response>) -> bool {
+        matches!(result, Ok(resp) if resp.status().is_success())
+    }
+
     fn retry_delay(attempt: usize) -> Duration {
         // 指数退避 + 少量抖动，避免上游抖动时放大故障
         const BASE_MS: u64 = 200;
@@ -681,8 +938,9 @@ mod tests {
         let provider = create_test_provider(config, credentials.clone());
         let ctx = CallContext {
             id: 1,
-            credentials,
+            credentials: Arc::new(credentials),
             token: "test_token".to_string(),
+            in_flight: None,
         };
         let headers = provider.build_headers(&ctx).unwrap();
 
@@ -700,6 +958,99 @@ mod tests {
         assert_eq!(headers.get(CONNECTION).unwrap(), "close");
     }
 
+    #[tokio::test]
+    async fn test_api_response_holds_in_flight_until_stream_ends() {
+        let mut credentials = KiroCredentials::default();
+        credentials.access_token = Some("token".to_string());
+        credentials.expires_at =
+            Some((chrono::Utc::now() + chrono::Duration::hours(1)).to_rfc3339());
+        let provider = create_test_provider(Config::default(), credentials);
+        let in_flight = || provider.token_manager.snapshot().entries[0].in_flight;
+
+        let ctx = provider.token_manager.acquire_context(None).await.unwrap();
+        let response = ApiResponse::new(
+            reqwest::Response::from(http::Response::new("chunk")),
+            ctx.in_flight,
+        );
+        assert_eq!(in_flight(), 1);
+
+        // 响应头已返回，但响应体未读完前仍计入在途
+        let mut stream = response.bytes_stream();
+        assert_eq!(in_flight(), 1);
+        while stream.next().await.is_some() {}
+        assert_eq!(in_flight(), 0);
+    }
+
+    fn hedge_test_credential(token: &str) -> KiroCredentials {
+        let mut credentials = KiroCredentials::default();
+        credentials.access_token = Some(token.to_string());
+        credentials.refresh_token = Some(format!("{}{}", token, "r".repeat(150)));
+        credentials.expires_at =
+            Some((chrono::Utc::now() + chrono::Duration::hours(1)).to_rfc3339());
+        credentials
+    }
+
+    /// 启动本地 Mock 上游：按 Bearer Token 返回预设的延迟、状态码和响应体
+    async fn spawn_upstream(routes: Vec<(&'static str, Duration, u16, &'static str)>) -> String {
+        let routes = Arc::new(routes);
+        let app = axum::Router::new().route(
+            "/generateAssistantResponse",
+            axum::routing::post(move |headers: HeaderMap| async move {
+                let auth = headers.get(AUTHORIZATION).unwrap().to_str().unwrap();
+                let &(_, delay, status, body) = routes
+                    .iter()
+                    .find(|(token, ..)| auth == format!("Bearer {}", token))
+                    .unwrap();
+                sleep(delay).await;
+                (reqwest::StatusCode::from_u16(status).unwrap(), body)
+            }),
+        );
+        let listener = tokio::net::TcpListener::bind("127.0.0.1:0").await.unwrap();
+        let addr = listener.local_addr().unwrap();
+        tokio::spawn(async move { axum::serve(listener, app).await.unwrap() });
+        format!("http://{}", addr)
+    }
+
+    #[tokio::test]
+    async fn test_hedge_win_reports_primary_failure() {
+        // 主请求在对冲请求发出后返回 403，对冲请求随后成功
+        let upstream = spawn_upstream(vec![
+            ("primary", Duration::from_millis(700), 403, "forbidden"),
+            ("hedge", Duration::from_millis(400), 200, ""),
+        ])
+        .await;
+        let mut config = Config::default();
+        config.upstream_base_url = Some(upstream);
+        config.hedge_requests = true;
+        let mut hedge = hedge_test_credential("hedge");
+        hedge.priority = 1;
+        let tm = MultiTokenManager::new(
+            config,
+            vec![hedge_test_credential("primary"), hedge],
+            None,
+            None,
+            false,
+        )
+        .unwrap();
+        let provider = KiroProvider::new(Arc::new(tm));
+        let entry = |p: u32| {
+            let entries = provider.token_manager.snapshot().entries;
+            entries.into_iter().find(|e| e.priority == p).unwrap()
+        };
+
+        // 填充延迟窗口，使对冲阈值降到下限
+        let primary_id = entry(0).id;
+        for _ in 0..20 {
+            provider
+                .token_manager
+                .report_ttfb(primary_id, Duration::from_millis(10));
+        }
+
+        provider.call_api("{}").await.unwrap();
+        assert_eq!(entry(0).failure_count, 1);
+        assert_eq!(entry(1).failure_count, 0);
+    }
+
     #[test]
     fn test_is_monthly_request_limit_detects_reason() {
         let body = r#"{"message":"You have reached the limit.","reason":"MONTHLY_REQUEST_COUNT"}"#;
@@ -712,6 +1063,24 @@ mod tests {
         assert!(KiroProvider::is_monthly_request_limit(body));
     }
 
+    #[test]
+    fn test_classify_failure() {
+        let quota = r#"{"reason":"MONTHLY_REQUEST_COUNT"}"#;
+        let classify = |status: u16, body: &str| {
+            KiroProvider::classify_failure(reqwest::StatusCode::from_u16(status).unwrap(), body)
+        };
+        assert_eq!(classify(402, quota), FailureKind::QuotaExhausted);
+        assert_eq!(classify(402, "{}"), FailureKind::Client);
+        assert_eq!(classify(400, quota), FailureKind::BadRequest);
+        assert_eq!(classify(401, ""), FailureKind::Credential);
+        assert_eq!(classify(403, ""), FailureKind::Credential);
+        assert_eq!(classify(408, ""), FailureKind::Transient);
+        assert_eq!(classify(429, ""), FailureKind::Transient);
+        assert_eq!(classify(502, ""), FailureKind::Transient);
+        assert_eq!(classify(404, ""), FailureKind::Client);
+        assert_eq!(classify(304, ""), FailureKind::Unknown);
+    }
+
     #[test]
     fn test_is_monthly_request_limit_false() {
         let body = r#"{"message":"nope","reason":"DAILY_REQUEST_COUNT"}"#;
@@ -5,17 +5,21 @@
 
 use anyhow::bail;
 use chrono::{DateTime, Duration, Utc};
-use parking_lot::Mutex;
+use parking_lot::{Mutex, MutexGuard, RwLock};
 use serde::{Deserialize, Serialize};
 use sha2::{Digest, Sha256};
 use tokio::sync::Mutex as TokioMutex;
 
 use std::collections::HashMap;
 use std::path::PathBuf;
-use std::sync::atomic::{AtomicBool, Ordering};
+use std::sync::Arc;
+use std::sync::atomic::{AtomicBool, AtomicU8, AtomicU64, AtomicUsize, Ordering};
 use std::time::{Duration as StdDuration, Instant};
 
+use crate::common::metrics::{metrics, write_header, write_sample};
+use crate::common::persist::{PersistStats, PersistWriter};
 use crate::http_client::{ProxyConfig, build_client};
+use crate::kiro::latency::{BreakerTransition, CredentialLatency, TtfbWindow};
 use crate::kiro::machine_id;
 use crate::kiro::model::credentials::KiroCredentials;
 use crate::kiro::model::token_refresh::{
@@ -24,7 +28,8 @@ use crate::kiro::model::token_refresh::{
 use crate::kiro::model::usage_limits::UsageLimitsResponse;
 use crate::model::config::Config;
 
-pub(crate) fn aws_sso_cache_dir() -> PathBuf {
+/// AWS SSO cache 目录（`AWS_SSO_CACHE_DIR` > `~/.aws/sso/cache`）
+pub fn aws_sso_cache_dir() -> PathBuf {
     if let Ok(dir) = std::env::var("AWS_SSO_CACHE_DIR") {
         let dir = dir.trim();
         if !dir.is_empty() {
@@ -165,11 +170,16 @@ pub(crate) fn is_token_expiring_within(
     credentials: &KiroCredentials,
     minutes: i64,
 ) -> Option<bool> {
+    is_token_expiring_in(credentials, Duration::minutes(minutes))
+}
+
+/// 检查 Token 是否在指定时长内过期，无法解析过期时间时返回 None
+fn is_token_expiring_in(credentials: &KiroCredentials, lead: Duration) -> Option<bool> {
     credentials
         .expires_at
         .as_ref()
         .and_then(|expires_at| DateTime::parse_from_rfc3339(expires_at).ok())
-        .map(|expires| expires <= Utc::now() + Duration::minutes(minutes))
+        .map(|expires| expires <= Utc::now() + lead)
 }
 
 /// 检查 Token 是否已过期（提前 5 分钟判断）
@@ -182,6 +192,26 @@ pub(crate) fn is_token_expiring_soon(credentials: &KiroCredentials) -> bool {
     is_token_expiring_within(credentials, 10).unwrap_or(false)
 }
 
+/// 检查 Token 是否进入后台提前刷新窗口（提前量 + 最大抖动）
+fn is_within_proactive_window(credentials: &KiroCredentials) -> bool {
+    let lead = Duration::minutes(PROACTIVE_REFRESH_LEAD_MINUTES)
+        + Duration::seconds(PROACTIVE_REFRESH_JITTER_SECS);
+    is_token_expiring_in(credentials, lead).unwrap_or(true)
+}
+
+/// 凭据的后台提前刷新抖动（秒，`0..=PROACTIVE_REFRESH_JITTER_SECS`）
+///
+/// 由凭据 ID 与当前 Token 的过期时间哈希得出：同一个 Token 在每次巡检中的抖动保持不变，
+/// 同一时刻到期的凭据均匀分布在整个抖动区间内；Token 刷新后随新的过期时间重新取值
+fn proactive_refresh_jitter_secs(id: u64, credentials: &KiroCredentials) -> i64 {
+    use std::hash::{Hash, Hasher};
+
+    let mut hasher = std::collections::hash_map::DefaultHasher::new();
+    id.hash(&mut hasher);
+    credentials.expires_at.hash(&mut hasher);
+    (hasher.finish() % (PROACTIVE_REFRESH_JITTER_SECS as u64 + 1)) as i64
+}
+
 fn sha256_hex(input: &str) -> String {
     let mut hasher = Sha256::new();
     hasher.update(input.as_bytes());
@@ -252,8 +282,8 @@ async fn refresh_social_token(
     // 优先级：凭据.auth_region > 凭据.region > config.auth_region > config.region
     let region = credentials.effective_auth_region(config);
 
-    let refresh_url = format!("https://prod.{}.auth.desktop.kiro.dev/refreshToken", region);
     let refresh_domain = format!("prod.{}.auth.desktop.kiro.dev", region);
+    let refresh_url = config.upstream_url(&refresh_domain, "/refreshToken");
     let machine_id = machine_id::generate_from_credentials(credentials, config)
         .ok_or_else(|| anyhow::anyhow!("无法生成 machineId"))?;
     let kiro_version = &config.kiro_version;
@@ -328,7 +358,8 @@ async fn refresh_idc_token(
 
     // 优先级：凭据.auth_region > 凭据.region > config.auth_region > config.region
     let region = credentials.effective_auth_region(config);
-    let refresh_url = format!("https://oidc.{}.amazonaws.com/token", region);
+    let refresh_host = format!("oidc.{}.amazonaws.com", region);
+    let refresh_url = config.upstream_url(&refresh_host, "/token");
 
     let client = build_client(proxy, 60, config.tls_backend)?;
     let body = IdcRefreshRequest {
@@ -341,7 +372,7 @@ async fn refresh_idc_token(
     let response = client
         .post(&refresh_url)
         .header("Content-Type", "application/json")
-        .header("Host", format!("oidc.{}.amazonaws.com", region))
+        .header("Host", &refresh_host)
         .header("Connection", "keep-alive")
         .header("x-amz-user-agent", IDC_AMZ_USER_AGENT)
         .header("Accept", "*/*")
@@ -403,9 +434,9 @@ pub(crate) async fn get_usage_limits(
     let kiro_version = &config.kiro_version;
 
     // 构建 URL
-    let mut url = format!(
-        "https://{}/getUsageLimits?origin=AI_EDITOR&resourceType=AGENTIC_REQUEST",
-        host
+    let mut url = config.upstream_url(
+        &host,
+        "/getUsageLimits?origin=AI_EDITOR&resourceType=AGENTIC_REQUEST",
     );
 
     // profileArn 是可选的
@@ -463,20 +494,169 @@ pub(crate) async fn get_usage_limits(
 struct CredentialEntry {
     /// 凭据唯一 ID
     id: u64,
-    /// 凭据信息
-    credentials: KiroCredentials,
+    /// 凭据信息（与选择索引共享，变更时整体替换）
+    credentials: Arc<KiroCredentials>,
     /// API 调用连续失败次数
     failure_count: u32,
     /// 是否已禁用
     disabled: bool,
     /// 禁用原因（用于区分手动禁用 vs 自动禁用，便于自愈）
     disabled_reason: Option<DisabledReason>,
-    /// API 调用成功次数
-    success_count: u64,
+    /// 运行时负载统计（与选择索引共享，无需持有 entries 锁即可更新）
+    load: Arc<CredentialLoad>,
     /// 最后一次 API 调用时间（RFC3339 格式）
     last_used_at: Option<String>,
 }
 
+/// 凭据运行时负载统计
+#[derive(Debug, Default)]
+struct CredentialLoad {
+    /// API 调用成功次数
+    success_count: AtomicU64,
+    /// 在途请求数（已获取上下文、响应体尚未读完的调用）
+    in_flight: AtomicUsize,
+    /// 首字节延迟统计与延迟熔断器
+    latency: CredentialLatency,
+}
+
+impl CredentialLoad {
+    fn success_count(&self) -> u64 {
+        self.success_count.load(Ordering::Relaxed)
+    }
+
+    fn in_flight(&self) -> usize {
+        self.in_flight.load(Ordering::Relaxed)
+    }
+}
+
+/// 在途请求计数守卫
+///
+/// 创建时增加对应凭据的在途请求数，释放时减少
+pub(crate) struct InFlightGuard(Arc<CredentialLoad>);
+
+impl InFlightGuard {
+    fn new(load: Arc<CredentialLoad>) -> Self {
+        load.in_flight.fetch_add(1, Ordering::Relaxed);
+        Self(load)
+    }
+}
+
+impl Clone for InFlightGuard {
+    fn clone(&self) -> Self {
+        Self::new(self.0.clone())
+    }
+}
+
+impl Drop for InFlightGuard {
+    fn drop(&mut self) {
+        self.0.in_flight.fetch_sub(1, Ordering::Relaxed);
+    }
+}
+
+/// 负载均衡模式
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+#[repr(u8)]
+enum LoadBalancingMode {
+    /// 固定优先级 + 故障转移
+    Priority = 0,
+    /// 选择累计成功次数最少的凭据（Least-Used）
+    Balanced = 1,
+    /// 选择在途请求数最少的凭据（Least-In-Flight）
+    LeastInFlight = 2,
+}
+
+impl LoadBalancingMode {
+    fn parse(mode: &str) -> Option<Self> {
+        match mode {
+            "priority" => Some(Self::Priority),
+            "balanced" => Some(Self::Balanced),
+            "least-in-flight" => Some(Self::LeastInFlight),
+            _ => None,
+        }
+    }
+
+    fn from_u8(value: u8) -> Self {
+        match value {
+            1 => Self::Balanced,
+            2 => Self::LeastInFlight,
+            _ => Self::Priority,
+        }
+    }
+
+    fn as_str(self) -> &'static str {
+        match self {
+            Self::Priority => "priority",
+            Self::Balanced => "balanced",
+            Self::LeastInFlight => "least-in-flight",
+        }
+    }
+}
+
+/// 选择索引中的凭据条目
+#[derive(Clone)]
+struct IndexedCredential {
+    id: u64,
+    priority: u32,
+    credentials: Arc<KiroCredentials>,
+    load: Arc<CredentialLoad>,
+}
+
+/// 预计算的凭据选择索引
+///
+/// 按模型等级（opus / 非 opus）预先过滤可用凭据并按优先级排序。
+/// 凭据状态变更时整体重建并原子替换，请求路径只需克隆一个 `Arc`，
+/// 无需持有 entries 锁，也无需逐个过滤、深拷贝凭据
+#[derive(Default)]
+struct SelectionIndex {
+    /// 所有可用凭据（按优先级升序）
+    any: Vec<IndexedCredential>,
+    /// 支持 Opus 模型的可用凭据（按优先级升序）
+    opus: Vec<IndexedCredential>,
+}
+
+impl SelectionIndex {
+    fn build(entries: &[CredentialEntry]) -> Self {
+        let mut any: Vec<IndexedCredential> = entries
+            .iter()
+            .filter(|e| !e.disabled)
+            .map(|e| IndexedCredential {
+                id: e.id,
+                priority: e.credentials.priority,
+                credentials: e.credentials.clone(),
+                load: e.load.clone(),
+            })
+            .collect();
+        // 稳定排序：同优先级保持配置文件中的顺序
+        any.sort_by_key(|c| c.priority);
+
+        let opus = any
+            .iter()
+            .filter(|c| c.credentials.supports_opus())
+            .cloned()
+            .collect();
+
+        Self { any, opus }
+    }
+
+    /// 获取指定模型等级的候选凭据
+    fn candidates(&self, is_opus: bool) -> &[IndexedCredential] {
+        if is_opus { &self.opus } else { &self.any }
+    }
+
+    /// 按 ID 查找可用凭据
+    fn get(&self, id: u64) -> Option<&IndexedCredential> {
+        self.any.iter().find(|c| c.id == id)
+    }
+}
+
+/// 判断是否为 Opus 模型（ASCII 大小写不敏感，不分配内存）
+fn is_opus_model(model: &str) -> bool {
+    model
+        .as_bytes()
+        .windows(4)
+        .any(|w| w.eq_ignore_ascii_case(b"opus"))
+}
+
 /// 禁用原因
 #[derive(Debug, Clone, Copy, PartialEq, Eq)]
 enum DisabledReason {
@@ -525,6 +705,8 @@ pub struct CredentialEntrySnapshot {
     pub success_count: u64,
     /// 最后一次 API 调用时间（RFC3339 格式）
     pub last_used_at: Option<String>,
+    /// 当前在途请求数
+    pub in_flight: usize,
     /// 是否配置了凭据级代理
     pub has_proxy: bool,
     /// 代理 URL（用于前端展示）
@@ -555,26 +737,43 @@ pub struct MultiTokenManager {
     proxy: Option<ProxyConfig>,
     /// 凭据条目列表
     entries: Mutex<Vec<CredentialEntry>>,
+    /// 凭据选择索引（entries 变更时重建，读路径只克隆 Arc）
+    selection_index: RwLock<Arc<SelectionIndex>>,
     /// 当前活动凭据 ID
     current_id: Mutex<u64>,
-    /// Token 刷新锁，确保同一时间只有一个刷新操作
-    refresh_lock: TokioMutex<()>,
+    /// 凭据级 Token 刷新锁（single-flight），同一凭据同一时间只有一个刷新操作，
+    /// 不同凭据的刷新互不阻塞
+    refresh_locks: Mutex<HashMap<u64, Arc<TokioMutex<()>>>>,
     /// 凭据文件路径（用于回写）
     credentials_path: Option<PathBuf>,
     /// 是否为多凭据格式（数组格式才回写）
     is_multiple_format: bool,
-    /// 负载均衡模式（运行时可修改）
-    load_balancing_mode: Mutex<String>,
+    /// 负载均衡模式（运行时可修改，存储 `LoadBalancingMode` 的判别值）
+    load_balancing_mode: AtomicU8,
     /// 最近一次统计持久化时间（用于 debounce）
     last_stats_save_at: Mutex<Option<Instant>>,
     /// 统计数据是否有未落盘更新
     stats_dirty: AtomicBool,
+    /// 后台落盘写入器（凭据文件、统计数据、余额缓存共用）
+    persist_writer: PersistWriter,
+    /// 全局首字节延迟窗口（用于对冲阈值与延迟熔断阈值）
+    ttfb_window: TtfbWindow,
 }
 
 /// 每个凭据最大 API 调用失败次数
 const MAX_FAILURES_PER_CREDENTIAL: u32 = 3;
 /// 统计数据持久化防抖间隔
 const STATS_SAVE_DEBOUNCE: StdDuration = StdDuration::from_secs(30);
+/// 后台刷新调度器巡检间隔
+const REFRESH_SCHEDULER_INTERVAL: StdDuration = StdDuration::from_secs(30);
+/// 后台提前刷新窗口（分钟），需大于 `is_token_expiring_soon` 的 10 分钟阈值
+const PROACTIVE_REFRESH_LEAD_MINUTES: i64 = 15;
+/// 提前刷新窗口的抖动上限（秒），打散同一时刻到期的凭据
+const PROACTIVE_REFRESH_JITTER_SECS: i64 = 5 * 60;
+/// 后台刷新最大并发数
+const PROACTIVE_REFRESH_CONCURRENCY: usize = 4;
+/// 后台刷新失败后的重试退避
+const PROACTIVE_REFRESH_RETRY_BACKOFF: StdDuration = StdDuration::from_secs(120);
 
 /// API 调用上下文
 ///
@@ -585,9 +784,13 @@ pub struct CallContext {
     /// 凭据 ID（用于 report_success/report_failure）
     pub id: u64,
     /// 凭据信息（用于构建请求头）
-    pub credentials: KiroCredentials,
+    pub credentials: Arc<KiroCredentials>,
     /// 访问 Token
     pub token: String,
+    /// 在途请求计数守卫，上下文释放时自动归还
+    ///
+    /// 请求成功时转交给 `ApiResponse`，随响应体一起释放
+    pub(crate) in_flight: Option<InFlightGuard>,
 }
 
 impl MultiTokenManager {
@@ -632,17 +835,18 @@ impl MultiTokenManager {
                         has_new_machine_ids = true;
                     }
                 }
+                let disabled = cred.disabled; // 从配置文件读取 disabled 状态
                 CredentialEntry {
                     id,
-                    credentials: cred.clone(),
+                    credentials: Arc::new(cred),
                     failure_count: 0,
-                    disabled: cred.disabled, // 从配置文件读取 disabled 状态
-                    disabled_reason: if cred.disabled {
+                    disabled,
+                    disabled_reason: if disabled {
                         Some(DisabledReason::Manual)
                     } else {
                         None
                     },
-                    success_count: 0,
+                    load: Arc::new(CredentialLoad::default()),
                     last_used_at: None,
                 }
             })
@@ -667,23 +871,34 @@ impl MultiTokenManager {
             .map(|e| e.id)
             .unwrap_or(0);
 
-        let load_balancing_mode = config.load_balancing_mode.clone();
+        let load_balancing_mode = LoadBalancingMode::parse(&config.load_balancing_mode)
+            .unwrap_or_else(|| {
+                tracing::warn!(
+                    "未知的负载均衡模式 {:?}，回退到 priority",
+                    config.load_balancing_mode
+                );
+                LoadBalancingMode::Priority
+            });
+        let selection_index = SelectionIndex::build(&entries);
         let manager = Self {
             config,
             proxy,
             entries: Mutex::new(entries),
+            selection_index: RwLock::new(Arc::new(selection_index)),
             current_id: Mutex::new(initial_id),
-            refresh_lock: TokioMutex::new(()),
+            refresh_locks: Mutex::new(HashMap::new()),
             credentials_path,
             is_multiple_format,
-            load_balancing_mode: Mutex::new(load_balancing_mode),
+            load_balancing_mode: AtomicU8::new(load_balancing_mode as u8),
             last_stats_save_at: Mutex::new(None),
             stats_dirty: AtomicBool::new(false),
+            persist_writer: PersistWriter::spawn(),
+            ttfb_window: TtfbWindow::default(),
         };
 
         // 如果有新分配的 ID 或新生成的 machineId，立即持久化到配置文件
         if has_new_ids || has_new_machine_ids {
-            if let Err(e) = manager.persist_credentials() {
+            if let Err(e) = manager.persist_credentials_and_wait() {
                 tracing::warn!("补全凭据 ID/machineId 后持久化失败: {}", e);
             } else {
                 tracing::info!("已补全凭据 ID/machineId 并写回配置文件");
@@ -703,77 +918,84 @@ impl MultiTokenManager {
 
     /// 获取当前活动凭据的克隆
     pub fn credentials(&self) -> KiroCredentials {
-        let entries = self.entries.lock();
+        let entries = self.lock_entries();
         let current_id = *self.current_id.lock();
         entries
             .iter()
             .find(|e| e.id == current_id)
-            .map(|e| e.credentials.clone())
+            .map(|e| (*e.credentials).clone())
             .unwrap_or_default()
     }
 
     /// 获取凭据总数
     pub fn total_count(&self) -> usize {
-        self.entries.lock().len()
+        self.lock_entries().len()
     }
 
     /// 获取可用凭据数量
     pub fn available_count(&self) -> usize {
-        self.entries.lock().iter().filter(|e| !e.disabled).count()
+        self.lock_entries().iter().filter(|e| !e.disabled).count()
+    }
+
+    /// 获取当前的凭据选择索引
+    fn selection_index(&self) -> Arc<SelectionIndex> {
+        self.selection_index.read().clone()
+    }
+
+    /// 根据 entries 重建并替换凭据选择索引
+    ///
+    /// 调用方需持有 entries 锁，保证索引与 entries 一致
+    fn rebuild_selection_index(&self, entries: &[CredentialEntry]) {
+        *self.selection_index.write() = Arc::new(SelectionIndex::build(entries));
+    }
+
+    /// 获取当前负载均衡模式
+    fn load_balancing_mode(&self) -> LoadBalancingMode {
+        LoadBalancingMode::from_u8(self.load_balancing_mode.load(Ordering::Relaxed))
     }
 
     /// 根据负载均衡模式选择下一个凭据
     ///
     /// - priority 模式：选择优先级最高（priority 最小）的可用凭据
-    /// - balanced 模式：轮询选择可用凭据
+    /// - balanced 模式：选择成功次数最少的可用凭据
+    /// - least-in-flight 模式：选择在途请求数最少的可用凭据
+    ///
+    /// 被延迟熔断器摘除的凭据不参与选择；如果所有候选凭据都被摘除，则忽略熔断状态
     ///
     /// # 参数
     /// - `model`: 可选的模型名称，用于过滤支持该模型的凭据（如 opus 模型需要付费订阅）
-    fn select_next_credential(&self, model: Option<&str>) -> Option<(u64, KiroCredentials)> {
-        let entries = self.entries.lock();
-
-        // 检查是否是 opus 模型
-        let is_opus = model
-            .map(|m| m.to_lowercase().contains("opus"))
-            .unwrap_or(false);
-
-        // 过滤可用凭据
-        let available: Vec<_> = entries
-            .iter()
-            .filter(|e| {
-                if e.disabled {
-                    return false;
-                }
-                // 如果是 opus 模型，需要检查订阅等级
-                if is_opus && !e.credentials.supports_opus() {
-                    return false;
-                }
-                true
-            })
-            .collect();
-
-        if available.is_empty() {
-            return None;
-        }
-
-        let mode = self.load_balancing_mode.lock().clone();
-        let mode = mode.as_str();
-
-        match mode {
-            "balanced" => {
-                // Least-Used 策略：选择成功次数最少的凭据
-                // 平局时按优先级排序（数字越小优先级越高）
-                let entry = available
+    fn select_next_credential(&self, model: Option<&str>) -> Option<IndexedCredential> {
+        let index = self.selection_index();
+        let candidates = index.candidates(model.is_some_and(is_opus_model));
+        let now = Instant::now();
+
+        let selected = self
+            .pick_credential(
+                candidates
                     .iter()
-                    .min_by_key(|e| (e.success_count, e.credentials.priority))?;
+                    .filter(|c| c.load.latency.is_selectable(now)),
+            )
+            .or_else(|| self.pick_credential(candidates.iter()))?;
+        selected.load.latency.on_selected(now);
+        Some(selected.clone())
+    }
 
-                Some((entry.id, entry.credentials.clone()))
-            }
-            _ => {
-                // priority 模式（默认）：选择优先级最高的
-                let entry = available.iter().min_by_key(|e| e.credentials.priority)?;
-                Some((entry.id, entry.credentials.clone()))
+    /// 按负载均衡模式从候选凭据中选择一个
+    ///
+    /// 候选列表已按优先级升序排列，min_by_key 平局时返回第一个，即优先级最高者
+    fn pick_credential<'a>(
+        &self,
+        mut candidates: impl Iterator<Item = &'a IndexedCredential>,
+    ) -> Option<&'a IndexedCredential> {
+        match self.load_balancing_mode() {
+            // Least-Used 策略：选择成功次数最少的凭据
+            LoadBalancingMode::Balanced => candidates.min_by_key(|c| c.load.success_count()),
+            // Least-In-Flight 策略：选择在途请求最少的凭据，平局时按成功次数分摊
+            LoadBalancingMode::LeastInFlight => {
+                candidates.min_by_key(|c| (c.load.in_flight(), c.load.success_count()))
             }
+            // priority 模式（默认）：选择优先级最高的
+            LoadBalancingMode::Priority => candidates.next(),
         }
     }
 
@@ -782,7 +1004,7 @@ impl MultiTokenManager {
     /// 返回绑定了 id、credentials 和 token 的调用上下文
     /// 确保整个 API 调用过程中使用一致的凭据信息
     ///
-    /// 如果 Token 过期或即将过期，会自动刷新
+    /// 如果 Token 已过期，会自动刷新
     /// Token 刷新失败时会尝试下一个可用凭据（不计入失败次数）
     ///
     /// # 参数
@@ -800,31 +1022,33 @@ impl MultiTokenManager {
                 );
             }
 
-            let (id, credentials) = {
-                let is_balanced = self.load_balancing_mode.lock().as_str() == "balanced";
-
-                // balanced 模式：每次请求都轮询选择，不固定 current_id
+            let selected = {
+                // balanced / least-in-flight 模式：每次请求都重新选择，不固定 current_id
                 // priority 模式：优先使用 current_id 指向的凭据
-                let current_hit = if is_balanced {
-                    None
-                } else {
-                    let entries = self.entries.lock();
+                // 当前凭据被延迟熔断器摘除时重新选择；冷却结束的当前凭据同样需要进入 half-open
+                let current_hit = if self.load_balancing_mode() == LoadBalancingMode::Priority {
                     let current_id = *self.current_id.lock();
-                    entries
-                        .iter()
-                        .find(|e| e.id == current_id && !e.disabled)
-                        .map(|e| (e.id, e.credentials.clone()))
+                    let now = Instant::now();
+                    self.selection_index()
+                        .get(current_id)
+                        .filter(|c| c.load.latency.is_selectable(now))
+                        .map(|c| {
+                            c.load.latency.on_selected(now);
+                            c.clone()
+                        })
+                } else {
+                    None
                 };
 
                 if let Some(hit) = current_hit {
                     hit
                 } else {
-                    // 当前凭据不可用或 balanced 模式，根据负载均衡策略选择
+                    // 当前凭据不可用或非 priority 模式，根据负载均衡策略选择
                     let mut best = self.select_next_credential(model);
 
                     // 没有可用凭据：如果是"自动禁用导致全灭"，做一次类似重启的自愈
                     if best.is_none() {
-                        let mut entries = self.entries.lock();
+                        let mut entries = self.lock_entries();
                         if entries.iter().any(|e| {
                             e.disabled && e.disabled_reason == Some(DisabledReason::TooManyFailures)
                         }) {
@@ -838,18 +1062,18 @@ impl MultiTokenManager {
                                     e.failure_count = 0;
                                 }
                             }
+                            self.rebuild_selection_index(&entries);
                             drop(entries);
                             best = self.select_next_credential(model);
                         }
                     }
 
-                    if let Some((new_id, new_creds)) = best {
+                    if let Some(selected) = best {
                         // 更新 current_id
-                        let mut current_id = self.current_id.lock();
-                        *current_id = new_id;
-                        (new_id, new_creds)
+                        *self.current_id.lock() = selected.id;
+                        selected
                     } else {
-                        let entries = self.entries.lock();
+                        let entries = self.lock_entries();
                         // 注意：必须在 bail! 之前计算 available_count，
                         // 因为 available_count() 会尝试获取 entries 锁，
                         // 而此时我们已经持有该锁，会导致死锁
@@ -860,12 +1084,16 @@ impl MultiTokenManager {
             };
 
             // 尝试获取/刷新 Token
-            match self.try_ensure_token(id, &credentials).await {
+            match self.try_ensure_token(&selected).await {
                 Ok(ctx) => {
                     return Ok(ctx);
                 }
                 Err(e) => {
-                    tracing::warn!("凭据 #{} Token 刷新失败，尝试下一个凭据: {}", id, e);
+                    tracing::warn!(
+                        "凭据 #{} Token 刷新失败，尝试下一个凭据: {}",
+                        selected.id,
+                        e
+                    );
 
                     // Token 刷新失败，切换到下一个优先级的凭据（不计入失败次数）
                     self.switch_to_next_by_priority();
@@ -875,9 +1103,95 @@ impl MultiTokenManager {
         }
     }
 
+    /// 获取对冲请求的调用上下文
+    ///
+    /// 从支持该模型的可用凭据中按负载均衡模式选择一个与 `exclude_id` 不同、
+    /// 且未被延迟熔断器摘除的凭据；不修改 current_id，Token 刷新失败时直接返回错误
+    pub async fn acquire_hedge_context(
+        &self,
+        model: Option<&str>,
+        exclude_id: u64,
+    ) -> anyhow::Result<CallContext> {
+        let selected = {
+            let index = self.selection_index();
+            let now = Instant::now();
+            let selected = self
+                .pick_credential(
+                    index
+                        .candidates(model.is_some_and(is_opus_model))
+                        .iter()
+                        .filter(|c| c.id != exclude_id && c.load.latency.is_selectable(now)),
+                )
+                .ok_or_else(|| anyhow::anyhow!("没有可用于对冲请求的其他凭据"))?;
+            selected.load.latency.on_selected(now);
+            selected.clone()
+        };
+
+        self.try_ensure_token(&selected).await
+    }
+
+    /// 获取凭据条目锁
+    ///
+    /// 无竞争时直接获取；发生竞争时记录等待时间到 `kiro_entries_lock_wait_seconds`，
+    /// 用于观察 entries 锁是否成为热点
+    fn lock_entries(&self) -> MutexGuard<'_, Vec<CredentialEntry>> {
+        if let Some(entries) = self.entries.try_lock() {
+            return entries;
+        }
+        let started = Instant::now();
+        let entries = self.entries.lock();
+        metrics()
+            .entries_lock_wait
+            .observe_duration(started.elapsed());
+        entries
+    }
+
+    /// 报告指定凭据的首字节延迟（收到上游响应头的耗时）
+    ///
+    /// 更新全局延迟窗口和凭据级 EWMA；延迟持续劣化的凭据会被熔断器暂时摘除，
+    /// 冷却后放行一个探测请求，探测正常则恢复
+    pub fn report_ttfb(&self, id: u64, ttfb: StdDuration) {
+        let Some(selected) = self.selection_index().get(id).cloned() else {
+            return;
+        };
+
+        self.ttfb_window.record(ttfb);
+        let threshold = self.ttfb_window.breaker_threshold();
+        let latency = &selected.load.latency;
+        match latency.record(ttfb, threshold, Instant::now()) {
+            Some(BreakerTransition::Opened) => {
+                metrics().latency_ejections.inc();
+                tracing::warn!(
+                    "凭据 #{} 首字节延迟劣化（EWMA {:?}，阈值 {:?}），暂时摘除",
+                    id,
+                    latency.ewma().unwrap_or_default(),
+                    threshold
+                )
+            }
+            Some(BreakerTransition::Reopened) => {
+                metrics().latency_ejections.inc();
+                tracing::warn!(
+                    "凭据 #{} 探测请求首字节延迟 {:?} 超过阈值 {:?}，继续摘除",
+                    id,
+                    ttfb,
+                    threshold
+                )
+            }
+            Some(BreakerTransition::Closed) => {
+                tracing::info!("凭据 #{} 探测请求首字节延迟 {:?}，已恢复", id, ttfb)
+            }
+            None => {}
+        }
+    }
+
+    /// 对冲请求的触发阈值（近期首字节延迟的 p95，限制在合理范围内）
+    pub fn hedge_delay(&self) -> StdDuration {
+        self.ttfb_window.hedge_delay()
+    }
+
     /// 切换到下一个优先级最高的可用凭据（内部方法）
     fn switch_to_next_by_priority(&self) {
-        let entries = self.entries.lock();
+        let entries = self.lock_entries();
         let mut current_id = self.current_id.lock();
 
         // 选择优先级最高的未禁用凭据（排除当前凭据）
@@ -900,7 +1214,7 @@ impl MultiTokenManager {
     /// 与 `switch_to_next_by_priority` 不同，此方法不排除当前凭据，
     /// 纯粹按优先级选择，用于优先级变更后立即生效
     fn select_highest_priority(&self) {
-        let entries = self.entries.lock();
+        let entries = self.lock_entries();
         let mut current_id = self.current_id.lock();
 
         // 选择优先级最高的未禁用凭据（不排除当前凭据）
@@ -923,64 +1237,17 @@ impl MultiTokenManager {
 
     /// 尝试使用指定凭据获取有效 Token
     ///
-    /// 使用双重检查锁定模式，确保同一时间只有一个刷新操作
+    /// 请求路径只在 Token 已过期时才同步刷新；即将过期的 Token 由后台调度器
+    /// （`spawn_refresh_scheduler`）提前续期，避免请求排队等待网络刷新
     ///
     /// # Arguments
-    /// * `id` - 凭据 ID，用于更新正确的条目
-    /// * `credentials` - 凭据信息
-    async fn try_ensure_token(
-        &self,
-        id: u64,
-        credentials: &KiroCredentials,
-    ) -> anyhow::Result<CallContext> {
-        // 第一次检查（无锁）：快速判断是否需要刷新
-        let needs_refresh = is_token_expired(credentials) || is_token_expiring_soon(credentials);
-
-        let creds = if needs_refresh {
-            // 获取刷新锁，确保同一时间只有一个刷新操作
-            let _guard = self.refresh_lock.lock().await;
-
-            // 第二次检查：获取锁后重新读取凭据，因为其他请求可能已经完成刷新
-            let current_creds = {
-                let entries = self.entries.lock();
-                entries
-                    .iter()
-                    .find(|e| e.id == id)
-                    .map(|e| e.credentials.clone())
-                    .ok_or_else(|| anyhow::anyhow!("凭据 #{} 不存在", id))?
-            };
-
-            if is_token_expired(&current_creds) || is_token_expiring_soon(&current_creds) {
-                // 确实需要刷新
-                let effective_proxy = current_creds.effective_proxy(self.proxy.as_ref());
-                let new_creds =
-                    refresh_token(&current_creds, &self.config, effective_proxy.as_ref()).await?;
-
-                if is_token_expired(&new_creds) {
-                    anyhow::bail!("刷新后的 Token 仍然无效或已过期");
-                }
-
-                // 更新凭据
-                {
-                    let mut entries = self.entries.lock();
-                    if let Some(entry) = entries.iter_mut().find(|e| e.id == id) {
-                        entry.credentials = new_creds.clone();
-                    }
-                }
-
-                // 回写凭据到文件（仅多凭据格式），失败只记录警告
-                if let Err(e) = self.persist_credentials() {
-                    tracing::warn!("Token 刷新后持久化失败（不影响本次请求）: {}", e);
-                }
-
-                new_creds
-            } else {
-                // 其他请求已经完成刷新，直接使用新凭据
-                tracing::debug!("Token 已被其他请求刷新，跳过刷新");
-                current_creds
-            }
+    /// * `selected` - 选择索引中的凭据条目
+    async fn try_ensure_token(&self, selected: &IndexedCredential) -> anyhow::Result<CallContext> {
+        let id = selected.id;
+        let creds = if is_token_expired(&selected.credentials) {
+            self.refresh_credential_if(id, is_token_expired).await?
         } else {
-            credentials.clone()
+            selected.credentials.clone()
         };
 
         let token = creds
@@ -992,60 +1259,228 @@ impl MultiTokenManager {
             id,
             credentials: creds,
             token,
+            in_flight: Some(InFlightGuard::new(selected.load.clone())),
         })
     }
 
-    /// 将凭据列表回写到源文件
+    /// 获取指定凭据的刷新锁（不存在时创建）
+    fn refresh_lock_for(&self, id: u64) -> Arc<TokioMutex<()>> {
+        self.refresh_locks
+            .lock()
+            .entry(id)
+            .or_insert_with(|| Arc::new(TokioMutex::new(())))
+            .clone()
+    }
+
+    /// 按 ID 读取凭据（共享引用）
+    fn credentials_by_id(&self, id: u64) -> anyhow::Result<Arc<KiroCredentials>> {
+        let entries = self.lock_entries();
+        entries
+            .iter()
+            .find(|e| e.id == id)
+            .map(|e| e.credentials.clone())
+            .ok_or_else(|| anyhow::anyhow!("凭据 #{} 不存在", id))
+    }
+
+    /// 在凭据级刷新锁保护下按需刷新 Token
+    ///
+    /// 使用双重检查锁定：获取锁后重新读取凭据并用 `needs_refresh` 再次判断，
+    /// 如果其他请求或后台调度器已经完成刷新，则直接返回最新凭据
+    async fn refresh_credential_if(
+        &self,
+        id: u64,
+        needs_refresh: fn(&KiroCredentials) -> bool,
+    ) -> anyhow::Result<Arc<KiroCredentials>> {
+        let lock = self.refresh_lock_for(id);
+        let _guard = lock.lock().await;
+
+        let current_creds = self.credentials_by_id(id)?;
+        if !needs_refresh(&current_creds) {
+            tracing::debug!("凭据 #{} Token 已被其他任务刷新，跳过刷新", id);
+            return Ok(current_creds);
+        }
+
+        let effective_proxy = current_creds.effective_proxy(self.proxy.as_ref());
+        let started = Instant::now();
+        let refreshed = refresh_token(&current_creds, &self.config, effective_proxy.as_ref()).await;
+        metrics()
+            .token_refresh_duration
+            .observe_duration(started.elapsed());
+        let new_creds = refreshed.inspect_err(|_| metrics().token_refresh_failures.inc())?;
+
+        if is_token_expired(&new_creds) {
+            anyhow::bail!("刷新后的 Token 仍然无效或已过期");
+        }
+        let new_creds = Arc::new(new_creds);
+
+        // 更新凭据并重建选择索引，使请求路径立即看到新 Token
+        {
+            let mut entries = self.lock_entries();
+            if let Some(entry) = entries.iter_mut().find(|e| e.id == id) {
+                entry.credentials = new_creds.clone();
+            }
+            self.rebuild_selection_index(&entries);
+        }
+
+        // 回写凭据到文件（仅多凭据格式），失败由落盘线程记录警告，不影响本次请求
+        self.persist_credentials();
+
+        Ok(new_creds)
+    }
+
+    /// 收集需要后台提前刷新的凭据 ID
+    ///
+    /// 每个凭据的提前量在 `PROACTIVE_REFRESH_LEAD_MINUTES` 基础上叠加固定抖动
+    /// （见 [`proactive_refresh_jitter_secs`]），避免同一批到期的凭据在同一时刻集中刷新
+    fn credentials_due_for_refresh(&self, retry_after: &HashMap<u64, Instant>) -> Vec<u64> {
+        let entries = self.lock_entries();
+        entries
+            .iter()
+            .filter(|e| {
+                !e.disabled
+                    && e.credentials.refresh_token.is_some()
+                    && !retry_after.contains_key(&e.id)
+            })
+            .filter(|e| {
+                let lead = Duration::minutes(PROACTIVE_REFRESH_LEAD_MINUTES)
+                    + Duration::seconds(proactive_refresh_jitter_secs(e.id, &e.credentials));
+                is_token_expiring_in(&e.credentials, lead).unwrap_or(true)
+            })
+            .map(|e| e.id)
+            .collect()
+    }
+
+    /// 启动后台 Token 刷新调度器
+    ///
+    /// 定期巡检所有启用的凭据，在 `is_token_expiring_soon` 触发之前提前续期，
+    /// 刷新并发数受 `PROACTIVE_REFRESH_CONCURRENCY` 限制，失败的凭据按
+    /// `PROACTIVE_REFRESH_RETRY_BACKOFF` 退避后再试（请求路径仍可在过期时兜底刷新）。
+    ///
+    /// 调度器只持有弱引用，管理器被释放后自动退出
+    pub fn spawn_refresh_scheduler(self: &Arc<Self>) -> tokio::task::JoinHandle<()> {
+        use futures::StreamExt;
+
+        let manager = Arc::downgrade(self);
+        tokio::spawn(async move {
+            let mut retry_after: HashMap<u64, Instant> = HashMap::new();
+            let mut ticker = tokio::time::interval(REFRESH_SCHEDULER_INTERVAL);
+            ticker.set_missed_tick_behavior(tokio::time::MissedTickBehavior::Delay);
+
+            loop {
+                ticker.tick().await;
+                let Some(manager) = manager.upgrade() else {
+                    break;
+                };
+
+                let now = Instant::now();
+                retry_after.retain(|_, until| *until > now);
+
+                let due = manager.credentials_due_for_refresh(&retry_after);
+                if due.is_empty() {
+                    continue;
+                }
+                tracing::debug!("后台刷新调度器：{} 个凭据即将过期，开始提前刷新", due.len());
+
+                let results: Vec<(u64, anyhow::Result<Arc<KiroCredentials>>)> =
+                    futures::stream::iter(due)
+                        .map(|id| {
+                            let manager = manager.clone();
+                            async move {
+                                let result = manager
+                                    .refresh_credential_if(id, is_within_proactive_window)
+                                    .await;
+                                (id, result)
+                            }
+                        })
+                        .buffer_unordered(PROACTIVE_REFRESH_CONCURRENCY)
+                        .collect()
+                        .await;
+
+                for (id, result) in results {
+                    match result {
+                        Ok(_) => tracing::debug!("凭据 #{} 后台提前刷新完成", id),
+                        Err(e) => {
+                            tracing::warn!(
+                                "凭据 #{} 后台提前刷新失败，{} 秒后重试: {}",
+                                id,
+                                PROACTIVE_REFRESH_RETRY_BACKOFF.as_secs(),
+                                e
+                            );
+                            retry_after.insert(id, Instant::now() + PROACTIVE_REFRESH_RETRY_BACKOFF);
+                        }
+                    }
+                }
+            }
+        })
+    }
+
+    /// 将凭据列表回写到源文件（不等待写入结果）
+    ///
+    /// 写入失败由落盘线程记录日志并计入 `persist_stats`
+    fn persist_credentials(&self) {
+        self.submit_credentials();
+    }
+
+    /// 将凭据列表回写到源文件，并等待写入完成（Admin API 使用）
+    ///
+    /// 非多凭据格式或未配置路径时直接返回 `Ok(())`
+    fn persist_credentials_and_wait(&self) -> anyhow::Result<()> {
+        let Some((path, ticket)) = self.submit_credentials() else {
+            return Ok(());
+        };
+
+        // 在 Tokio runtime 内使用 block_in_place 等待，避免慢盘阻塞 worker
+        // （current_thread runtime 不支持 block_in_place，直接等待）
+        let wait = || self.persist_writer.wait(&path, ticket);
+        let result = match tokio::runtime::Handle::try_current() {
+            Ok(handle) if handle.runtime_flavor() == tokio::runtime::RuntimeFlavor::MultiThread => {
+                tokio::task::block_in_place(wait)
+            }
+            _ => wait(),
+        };
+        result.map_err(|e| anyhow::anyhow!("写入凭据文件失败 {:?}: {}", path, e))
+    }
+
+    /// 向落盘线程提交凭据回写
     ///
     /// 仅在以下条件满足时回写：
     /// - 源文件是多凭据格式（数组）
     /// - credentials_path 已设置
     ///
-    /// # Returns
-    /// - `Ok(true)` - 成功写入文件
-    /// - `Ok(false)` - 跳过写入（非多凭据格式或无路径配置）
-    /// - `Err(_)` - 写入失败
-    fn persist_credentials(&self) -> anyhow::Result<bool> {
-        use anyhow::Context;
-
+    /// 持有 entries 锁时只收集各凭据的 `Arc` 与禁用状态并提交，保证提交顺序与
+    /// 状态变更顺序一致；克隆、规范化与 JSON 序列化都在落盘线程中完成，
+    /// 合并窗口内被后续提交替换的快照不会被序列化
+    ///
+    /// 返回凭据文件路径与提交序号，跳过写入时返回 None
+    fn submit_credentials(&self) -> Option<(PathBuf, u64)> {
         // 仅多凭据格式才回写
         if !self.is_multiple_format {
-            return Ok(false);
+            return None;
         }
+        let path = self.credentials_path.clone()?;
 
-        let path = match &self.credentials_path {
-            Some(p) => p,
-            None => return Ok(false),
-        };
-
-        // 收集所有凭据
-        let credentials: Vec<KiroCredentials> = {
-            let entries = self.entries.lock();
-            entries
-                .iter()
-                .map(|e| {
-                    let mut cred = e.credentials.clone();
+        let entries = self.lock_entries();
+        let snapshot: Vec<(Arc<KiroCredentials>, bool)> = entries
+            .iter()
+            .map(|e| (e.credentials.clone(), e.disabled))
+            .collect();
+        let ticket = self.persist_writer.submit_with(path.clone(), move || {
+            let credentials: Vec<KiroCredentials> = snapshot
+                .into_iter()
+                .map(|(cred, disabled)| {
+                    let mut cred = Arc::unwrap_or_clone(cred);
                     cred.canonicalize_auth_method();
                     // 同步 disabled 状态到凭据对象
-                    cred.disabled = e.disabled;
+                    cred.disabled = disabled;
                     cred
                 })
-                .collect()
-        };
-
-        // 序列化为 pretty JSON
-        let json = serde_json::to_string_pretty(&credentials).context("序列化凭据失败")?;
-
-        // 写入文件（在 Tokio runtime 内使用 block_in_place 避免阻塞 worker）
-        if tokio::runtime::Handle::try_current().is_ok() {
-            tokio::task::block_in_place(|| std::fs::write(path, &json))
-                .with_context(|| format!("回写凭据文件失败: {:?}", path))?;
-        } else {
-            std::fs::write(path, &json).with_context(|| format!("回写凭据文件失败: {:?}", path))?;
-        }
+                .collect();
+            Ok(serde_json::to_vec_pretty(&credentials)?)
+        });
+        drop(entries);
 
-        tracing::debug!("已回写凭据到文件: {:?}", path);
-        Ok(true)
+        tracing::debug!("已提交凭据回写: {:?}", path);
+        Some((path, ticket))
     }
 
     /// 获取缓存目录（凭据文件所在目录）
@@ -1080,10 +1515,13 @@ impl MultiTokenManager {
             }
         };
 
-        let mut entries = self.entries.lock();
+        let mut entries = self.lock_entries();
         for entry in entries.iter_mut() {
             if let Some(s) = stats.get(&entry.id.to_string()) {
-                entry.success_count = s.success_count;
+                entry
+                    .load
+                    .success_count
+                    .store(s.success_count, Ordering::Relaxed);
                 entry.last_used_at = s.last_used_at.clone();
             }
         }
@@ -1100,14 +1538,14 @@ impl MultiTokenManager {
         };
 
         let stats: HashMap<String, StatsEntry> = {
-            let entries = self.entries.lock();
+            let entries = self.lock_entries();
             entries
                 .iter()
                 .map(|e| {
                     (
                         e.id.to_string(),
                         StatsEntry {
-                            success_count: e.success_count,
+                            success_count: e.load.success_count(),
                             last_used_at: e.last_used_at.clone(),
                         },
                     )
@@ -1117,17 +1555,32 @@ impl MultiTokenManager {
 
         match serde_json::to_string_pretty(&stats) {
             Ok(json) => {
-                if let Err(e) = std::fs::write(&path, json) {
-                    tracing::warn!("保存统计缓存失败: {}", e);
-                } else {
-                    *self.last_stats_save_at.lock() = Some(Instant::now());
-                    self.stats_dirty.store(false, Ordering::Relaxed);
-                }
+                self.persist_writer.submit(path, json.into_bytes());
+                *self.last_stats_save_at.lock() = Some(Instant::now());
+                self.stats_dirty.store(false, Ordering::Relaxed);
             }
             Err(e) => tracing::warn!("序列化统计数据失败: {}", e),
         }
     }
 
+    /// 获取后台落盘写入器（供 Admin 余额缓存等共用）
+    pub fn persist_writer(&self) -> &PersistWriter {
+        &self.persist_writer
+    }
+
+    /// 获取落盘统计（写入次数、耗时等）
+    pub fn persist_stats(&self) -> PersistStats {
+        self.persist_writer.stats()
+    }
+
+    /// 落盘所有未保存的状态并等待写入完成（用于进程退出前）
+    pub fn flush_persistence(&self) {
+        if self.stats_dirty.load(Ordering::Relaxed) {
+            self.save_stats();
+        }
+        self.persist_writer.flush();
+    }
+
     /// 标记统计数据已更新，并按 debounce 策略决定是否立即落盘
     fn save_stats_debounced(&self) {
         self.stats_dirty.store(true, Ordering::Relaxed);
@@ -1153,16 +1606,12 @@ impl MultiTokenManager {
     /// * `id` - 凭据 ID（来自 CallContext）
     pub fn report_success(&self, id: u64) {
         {
-            let mut entries = self.entries.lock();
+            let mut entries = self.lock_entries();
             if let Some(entry) = entries.iter_mut().find(|e| e.id == id) {
                 entry.failure_count = 0;
-                entry.success_count += 1;
+                let success_count = entry.load.success_count.fetch_add(1, Ordering::Relaxed) + 1;
                 entry.last_used_at = Some(Utc::now().to_rfc3339());
-                tracing::debug!(
-                    "凭据 #{} API 调用成功（累计 {} 次）",
-                    id,
-                    entry.success_count
-                );
+                tracing::debug!("凭据 #{} API 调用成功（累计 {} 次）", id, success_count);
             }
         }
         self.save_stats_debounced();
@@ -1177,7 +1626,7 @@ impl MultiTokenManager {
     /// * `id` - 凭据 ID（来自 CallContext）
     pub fn report_failure(&self, id: u64) -> bool {
         let result = {
-            let mut entries = self.entries.lock();
+            let mut entries = self.lock_entries();
             let mut current_id = self.current_id.lock();
 
             let entry = match entries.iter_mut().find(|e| e.id == id) {
@@ -1200,6 +1649,7 @@ impl MultiTokenManager {
                 entry.disabled = true;
                 entry.disabled_reason = Some(DisabledReason::TooManyFailures);
                 tracing::error!("凭据 #{} 已连续失败 {} 次，已被禁用", id, failure_count);
+                self.rebuild_selection_index(&entries);
 
                 // 切换到优先级最高的可用凭据
                 if let Some(next) = entries
@@ -1232,7 +1682,7 @@ impl MultiTokenManager {
     /// - 返回是否还有可用凭据
     pub fn report_quota_exhausted(&self, id: u64) -> bool {
         let result = {
-            let mut entries = self.entries.lock();
+            let mut entries = self.lock_entries();
             let mut current_id = self.current_id.lock();
 
             let entry = match entries.iter_mut().find(|e| e.id == id) {
@@ -1251,6 +1701,7 @@ impl MultiTokenManager {
             entry.failure_count = MAX_FAILURES_PER_CREDENTIAL;
 
             tracing::error!("凭据 #{} 额度已用尽（MONTHLY_REQUEST_COUNT），已被禁用", id);
+            self.rebuild_selection_index(&entries);
 
             // 切换到优先级最高的可用凭据
             if let Some(next) = entries
@@ -1278,7 +1729,7 @@ impl MultiTokenManager {
     ///
     /// 返回是否成功切换
     pub fn switch_to_next(&self) -> bool {
-        let entries = self.entries.lock();
+        let entries = self.lock_entries();
         let mut current_id = self.current_id.lock();
 
         // 选择优先级最高的未禁用凭据（排除当前凭据）
@@ -1319,7 +1770,7 @@ impl MultiTokenManager {
 
     /// 获取管理器状态快照（用于 Admin API）
     pub fn snapshot(&self) -> ManagerSnapshot {
-        let entries = self.entries.lock();
+        let entries = self.lock_entries();
         let current_id = *self.current_id.lock();
         let available = entries.iter().filter(|e| !e.disabled).count();
 
@@ -1342,8 +1793,9 @@ impl MultiTokenManager {
                     expires_at: e.credentials.expires_at.clone(),
                     refresh_token_hash: e.credentials.refresh_token.as_deref().map(sha256_hex),
                     email: e.credentials.email.clone(),
-                    success_count: e.success_count,
+                    success_count: e.load.success_count(),
                     last_used_at: e.last_used_at.clone(),
+                    in_flight: e.load.in_flight(),
                     has_proxy: e.credentials.proxy_url.is_some(),
                     proxy_url: e.credentials.proxy_url.clone(),
                 })
@@ -1354,10 +1806,107 @@ impl MultiTokenManager {
         }
     }
 
+    /// 按 Prometheus 文本格式追加凭据级指标（在途请求、成功次数、连续失败次数、
+    /// 禁用状态、首字节延迟 EWMA）
+    pub fn render_metrics(&self, out: &mut String) {
+        struct Row {
+            id: u64,
+            in_flight: usize,
+            success_count: u64,
+            failure_count: u32,
+            disabled: bool,
+            ttfb_ewma: Option<StdDuration>,
+        }
+
+        let rows: Vec<Row> = self
+            .lock_entries()
+            .iter()
+            .map(|e| Row {
+                id: e.id,
+                in_flight: e.load.in_flight(),
+                success_count: e.load.success_count(),
+                failure_count: e.failure_count,
+                disabled: e.disabled,
+                ttfb_ewma: e.load.latency.ewma(),
+            })
+            .collect();
+
+        write_header(
+            out,
+            "kiro_credential_in_flight",
+            "gauge",
+            "凭据当前在途请求数",
+        );
+        for row in &rows {
+            write_sample(
+                out,
+                &format!("kiro_credential_in_flight{{credential=\"{}\"}}", row.id),
+                row.in_flight,
+            );
+        }
+        write_header(
+            out,
+            "kiro_credential_success_total",
+            "counter",
+            "凭据 API 调用成功次数",
+        );
+        for row in &rows {
+            write_sample(
+                out,
+                &format!("kiro_credential_success_total{{credential=\"{}\"}}", row.id),
+                row.success_count,
+            );
+        }
+        write_header(
+            out,
+            "kiro_credential_failure_count",
+            "gauge",
+            "凭据 API 调用连续失败次数",
+        );
+        for row in &rows {
+            write_sample(
+                out,
+                &format!("kiro_credential_failure_count{{credential=\"{}\"}}", row.id),
+                row.failure_count,
+            );
+        }
+        write_header(
+            out,
+            "kiro_credential_disabled",
+            "gauge",
+            "凭据是否已禁用（1 为禁用）",
+        );
+        for row in &rows {
+            write_sample(
+                out,
+                &format!("kiro_credential_disabled{{credential=\"{}\"}}", row.id),
+                u8::from(row.disabled),
+            );
+        }
+        write_header(
+            out,
+            "kiro_credential_ttfb_ewma_seconds",
+            "gauge",
+            "凭据首字节延迟 EWMA",
+        );
+        for row in &rows {
+            if let Some(ewma) = row.ttfb_ewma {
+                write_sample(
+                    out,
+                    &format!(
+                        "kiro_credential_ttfb_ewma_seconds{{credential=\"{}\"}}",
+                        row.id
+                    ),
+                    ewma.as_secs_f64(),
+                );
+            }
+        }
+    }
+
     /// 设置凭据禁用状态（Admin API）
     pub fn set_disabled(&self, id: u64, disabled: bool) -> anyhow::Result<()> {
         {
-            let mut entries = self.entries.lock();
+            let mut entries = self.lock_entries();
             let entry = entries
                 .iter_mut()
                 .find(|e| e.id == id)
@@ -1370,9 +1919,10 @@ impl MultiTokenManager {
             } else {
                 entry.disabled_reason = Some(DisabledReason::Manual);
             }
+            self.rebuild_selection_index(&entries);
         }
         // 持久化更改
-        self.persist_credentials()?;
+        self.persist_credentials_and_wait()?;
         Ok(())
     }
 
@@ -1382,24 +1932,25 @@ impl MultiTokenManager {
     /// 即使持久化失败，内存中的优先级和当前凭据选择也会生效。
     pub fn set_priority(&self, id: u64, priority: u32) -> anyhow::Result<()> {
         {
-            let mut entries = self.entries.lock();
+            let mut entries = self.lock_entries();
             let entry = entries
                 .iter_mut()
                 .find(|e| e.id == id)
                 .ok_or_else(|| anyhow::anyhow!("凭据不存在: {}", id))?;
-            entry.credentials.priority = priority;
+            Arc::make_mut(&mut entry.credentials).priority = priority;
+            self.rebuild_selection_index(&entries);
         }
         // 立即按新优先级重新选择当前凭据（无论持久化是否成功）
         self.select_highest_priority();
         // 持久化更改
-        self.persist_credentials()?;
+        self.persist_credentials_and_wait()?;
         Ok(())
     }
 
     /// 重置凭据失败计数并重新启用（Admin API）
     pub fn reset_and_enable(&self, id: u64) -> anyhow::Result<()> {
         {
-            let mut entries = self.entries.lock();
+            let mut entries = self.lock_entries();
             let entry = entries
                 .iter_mut()
                 .find(|e| e.id == id)
@@ -1407,16 +1958,17 @@ impl MultiTokenManager {
             entry.failure_count = 0;
             entry.disabled = false;
             entry.disabled_reason = None;
+            self.rebuild_selection_index(&entries);
         }
         // 持久化更改
-        self.persist_credentials()?;
+        self.persist_credentials_and_wait()?;
         Ok(())
     }
 
     /// 获取指定凭据的使用额度（Admin API）
     pub async fn get_usage_limits_for(&self, id: u64) -> anyhow::Result<UsageLimitsResponse> {
         let credentials = {
-            let entries = self.entries.lock();
+            let entries = self.lock_entries();
             entries
                 .iter()
                 .find(|e| e.id == id)
@@ -1428,46 +1980,22 @@ impl MultiTokenManager {
         let needs_refresh = is_token_expired(&credentials) || is_token_expiring_soon(&credentials);
 
         let token = if needs_refresh {
-            let _guard = self.refresh_lock.lock().await;
-            let current_creds = {
-                let entries = self.entries.lock();
-                entries
-                    .iter()
-                    .find(|e| e.id == id)
-                    .map(|e| e.credentials.clone())
-                    .ok_or_else(|| anyhow::anyhow!("凭据不存在: {}", id))?
-            };
-
-            if is_token_expired(&current_creds) || is_token_expiring_soon(&current_creds) {
-                let effective_proxy = current_creds.effective_proxy(self.proxy.as_ref());
-                let new_creds =
-                    refresh_token(&current_creds, &self.config, effective_proxy.as_ref()).await?;
-                {
-                    let mut entries = self.entries.lock();
-                    if let Some(entry) = entries.iter_mut().find(|e| e.id == id) {
-                        entry.credentials = new_creds.clone();
-                    }
-                }
-                // 持久化失败只记录警告，不影响本次请求
-                if let Err(e) = self.persist_credentials() {
-                    tracing::warn!("Token 刷新后持久化失败（不影响本次请求）: {}", e);
-                }
-                new_creds
-                    .access_token
-                    .ok_or_else(|| anyhow::anyhow!("刷新后无 access_token"))?
-            } else {
-                current_creds
-                    .access_token
-                    .ok_or_else(|| anyhow::anyhow!("凭据无 access_token"))?
-            }
+            self.refresh_credential_if(id, |c: &KiroCredentials| {
+                is_token_expired(c) || is_token_expiring_soon(c)
+            })
+            .await?
+            .access_token
+            .clone()
+            .ok_or_else(|| anyhow::anyhow!("刷新后无 access_token"))?
         } else {
             credentials
                 .access_token
+                .clone()
                 .ok_or_else(|| anyhow::anyhow!("凭据无 access_token"))?
         };
 
         let credentials = {
-            let entries = self.entries.lock();
+            let entries = self.lock_entries();
             entries
                 .iter()
                 .find(|e| e.id == id)
@@ -1481,11 +2009,11 @@ impl MultiTokenManager {
         // 更新订阅等级到凭据（仅在发生变化时持久化）
         if let Some(subscription_title) = usage_limits.subscription_title() {
             let changed = {
-                let mut entries = self.entries.lock();
+                let mut entries = self.lock_entries();
                 if let Some(entry) = entries.iter_mut().find(|e| e.id == id) {
                     let old_title = entry.credentials.subscription_title.clone();
                     if old_title.as_deref() != Some(subscription_title) {
-                        entry.credentials.subscription_title =
+                        Arc::make_mut(&mut entry.credentials).subscription_title =
                             Some(subscription_title.to_string());
                         tracing::info!(
                             "凭据 #{} 订阅等级已更新: {:?} -> {}",
@@ -1493,6 +2021,8 @@ impl MultiTokenManager {
                             old_title,
                             subscription_title
                         );
+                        // 订阅等级影响 opus 候选列表
+                        self.rebuild_selection_index(&entries);
                         true
                     } else {
                         false
@@ -1503,9 +2033,7 @@ impl MultiTokenManager {
             };
 
             if changed {
-                if let Err(e) = self.persist_credentials() {
-                    tracing::warn!("订阅等级更新后持久化失败（不影响本次请求）: {}", e);
-                }
+                self.persist_credentials();
             }
         }
 
@@ -1536,7 +2064,7 @@ impl MultiTokenManager {
             .ok_or_else(|| anyhow::anyhow!("缺少 refreshToken"))?;
         let new_refresh_token_hash = sha256_hex(new_refresh_token);
         let duplicate_exists = {
-            let entries = self.entries.lock();
+            let entries = self.lock_entries();
             entries.iter().any(|entry| {
                 entry
                     .credentials
@@ -1558,7 +2086,7 @@ impl MultiTokenManager {
 
         // 4. 分配新 ID
         let new_id = {
-            let entries = self.entries.lock();
+            let entries = self.lock_entries();
             entries.iter().map(|e| e.id).max().unwrap_or(0) + 1
         };
 
@@ -1584,20 +2112,21 @@ impl MultiTokenManager {
         validated_cred.proxy_password = new_cred.proxy_password;
 
         {
-            let mut entries = self.entries.lock();
+            let mut entries = self.lock_entries();
             entries.push(CredentialEntry {
                 id: new_id,
-                credentials: validated_cred,
+                credentials: Arc::new(validated_cred),
                 failure_count: 0,
                 disabled: false,
                 disabled_reason: None,
-                success_count: 0,
+                load: Arc::new(CredentialLoad::default()),
                 last_used_at: None,
             });
+            self.rebuild_selection_index(&entries);
         }
 
         // 6. 持久化
-        self.persist_credentials()?;
+        self.persist_credentials_and_wait()?;
 
         tracing::info!("成功添加凭据 #{}", new_id);
         Ok(new_id)
@@ -1621,7 +2150,7 @@ impl MultiTokenManager {
     /// - `Err(_)` - 凭据不存在、未禁用或持久化失败
     pub fn delete_credential(&self, id: u64) -> anyhow::Result<()> {
         let was_current = {
-            let mut entries = self.entries.lock();
+            let mut entries = self.lock_entries();
 
             // 查找凭据
             let entry = entries
@@ -1640,9 +2169,12 @@ impl MultiTokenManager {
 
             // 删除凭据
             entries.retain(|e| e.id != id);
+            self.rebuild_selection_index(&entries);
 
             was_current
         };
+        self.refresh_locks.lock().remove(&id);
+        metrics().credential_ttfb.remove(id);
 
         // 如果删除的是当前凭据，切换到优先级最高的可用凭据
         if was_current {
@@ -1651,7 +2183,7 @@ impl MultiTokenManager {
 
         // 如果删除后没有任何凭据，将 current_id 重置为 0（与初始化行为保持一致）
         {
-            let entries = self.entries.lock();
+            let entries = self.lock_entries();
             if entries.is_empty() {
                 let mut current_id = self.current_id.lock();
                 *current_id = 0;
@@ -1660,7 +2192,7 @@ impl MultiTokenManager {
         }
 
         // 持久化更改
-        self.persist_credentials()?;
+        self.persist_credentials_and_wait()?;
 
         // 立即回写统计数据，清除已删除凭据的残留条目
         self.save_stats();
@@ -1671,7 +2203,12 @@ impl MultiTokenManager {
 
     /// 获取负载均衡模式（Admin API）
     pub fn get_load_balancing_mode(&self) -> String {
-        self.load_balancing_mode.lock().clone()
+        self.load_balancing_mode().as_str().to_string()
+    }
+
+    /// 判断负载均衡模式名称是否有效
+    pub fn is_valid_load_balancing_mode(mode: &str) -> bool {
+        LoadBalancingMode::parse(mode).is_some()
     }
 
     fn persist_load_balancing_mode(&self, mode: &str) -> anyhow::Result<()> {
@@ -1698,19 +2235,20 @@ impl MultiTokenManager {
     /// 设置负载均衡模式（Admin API）
     pub fn set_load_balancing_mode(&self, mode: String) -> anyhow::Result<()> {
         // 验证模式值
-        if mode != "priority" && mode != "balanced" {
-            anyhow::bail!("无效的负载均衡模式: {}", mode);
-        }
+        let new_mode = LoadBalancingMode::parse(&mode)
+            .ok_or_else(|| anyhow::anyhow!("无效的负载均衡模式: {}", mode))?;
 
-        let previous_mode = self.get_load_balancing_mode();
-        if previous_mode == mode {
+        let previous_mode = self.load_balancing_mode();
+        if previous_mode == new_mode {
             return Ok(());
         }
 
-        *self.load_balancing_mode.lock() = mode.clone();
+        self.load_balancing_mode
+            .store(new_mode as u8, Ordering::Relaxed);
 
         if let Err(err) = self.persist_load_balancing_mode(&mode) {
-            *self.load_balancing_mode.lock() = previous_mode;
+            self.load_balancing_mode
+                .store(previous_mode as u8, Ordering::Relaxed);
             return Err(err);
         }
 
@@ -2065,6 +2603,386 @@ mod tests {
         assert_eq!(manager.available_count(), 2);
     }
 
+    #[tokio::test]
+    async fn test_acquire_context_does_not_refresh_expiring_soon_token() {
+        let config = Config::default();
+        let mut cred = KiroCredentials::default();
+        cred.access_token = Some("soon".to_string());
+        // 8 分钟后过期：已进入 expiring_soon 窗口但尚未过期，且无 refreshToken
+        // 若请求路径尝试同步刷新会失败
+        cred.expires_at = Some((Utc::now() + Duration::minutes(8)).to_rfc3339());
+
+        let manager = MultiTokenManager::new(config, vec![cred], None, None, false).unwrap();
+
+        let ctx = manager.acquire_context(None).await.unwrap();
+        assert_eq!(ctx.token, "soon");
+    }
+
+    #[test]
+    fn test_refresh_lock_is_per_credential() {
+        let config = Config::default();
+        let manager = MultiTokenManager::new(
+            config,
+            vec![KiroCredentials::default(), KiroCredentials::default()],
+            None,
+            None,
+            false,
+        )
+        .unwrap();
+
+        let lock1 = manager.refresh_lock_for(1);
+        assert!(Arc::ptr_eq(&lock1, &manager.refresh_lock_for(1)));
+        assert!(!Arc::ptr_eq(&lock1, &manager.refresh_lock_for(2)));
+
+        // 凭据 1 刷新期间，凭据 2 的刷新锁仍可获取
+        let _guard = lock1.try_lock().unwrap();
+        assert!(manager.refresh_lock_for(2).try_lock().is_ok());
+    }
+
+    #[test]
+    fn test_credentials_due_for_refresh() {
+        let config = Config::default();
+
+        let mut fresh = KiroCredentials::default();
+        fresh.refresh_token = Some("a".repeat(150));
+        fresh.expires_at = Some((Utc::now() + Duration::hours(1)).to_rfc3339());
+
+        let mut expiring = KiroCredentials::default();
+        expiring.refresh_token = Some("b".repeat(150));
+        expiring.expires_at = Some((Utc::now() + Duration::minutes(12)).to_rfc3339());
+
+        let mut no_refresh_token = KiroCredentials::default();
+        no_refresh_token.expires_at = Some((Utc::now() + Duration::minutes(12)).to_rfc3339());
+
+        let manager = MultiTokenManager::new(
+            config,
+            vec![fresh, expiring, no_refresh_token],
+            None,
+            None,
+            false,
+        )
+        .unwrap();
+
+        let mut retry_after = HashMap::new();
+        assert_eq!(manager.credentials_due_for_refresh(&retry_after), vec![2]);
+
+        // 处于失败退避中的凭据会被跳过
+        retry_after.insert(2, Instant::now() + StdDuration::from_secs(60));
+        assert!(manager.credentials_due_for_refresh(&retry_after).is_empty());
+    }
+
+    #[test]
+    fn test_proactive_refresh_jitter_is_stable_and_spread() {
+        let mut credentials = KiroCredentials::default();
+        credentials.expires_at = Some((Utc::now() + Duration::hours(1)).to_rfc3339());
+
+        let jitters: Vec<i64> = (1..=200)
+            .map(|id| proactive_refresh_jitter_secs(id, &credentials))
+            .collect();
+        // 同一个 Token 的抖动在各次巡检间保持不变
+        for (id, jitter) in (1..=200).zip(&jitters) {
+            assert_eq!(proactive_refresh_jitter_secs(id, &credentials), *jitter);
+        }
+        // 同一时刻到期的凭据分布在整个抖动区间内
+        assert!(
+            jitters
+                .iter()
+                .all(|j| (0..=PROACTIVE_REFRESH_JITTER_SECS).contains(j))
+        );
+        let early = jitters.iter().filter(|j| **j < 60).count();
+        let late = jitters.iter().filter(|j| **j > 240).count();
+        assert!(early > 10 && late > 10, "early={} late={}", early, late);
+
+        // Token 刷新后重新取值
+        let mut refreshed = credentials.clone();
+        refreshed.expires_at = Some((Utc::now() + Duration::hours(2)).to_rfc3339());
+        assert!(
+            (1..=200).any(|id| proactive_refresh_jitter_secs(id, &refreshed) != jitters[id as usize - 1])
+        );
+    }
+
+    fn valid_credential(token: &str) -> KiroCredentials {
+        let mut cred = KiroCredentials::default();
+        cred.access_token = Some(token.to_string());
+        cred.expires_at = Some((Utc::now() + Duration::hours(1)).to_rfc3339());
+        cred
+    }
+
+    #[test]
+    fn test_is_opus_model() {
+        assert!(is_opus_model("claude-opus-4-5"));
+        assert!(is_opus_model("Claude-OPUS-4"));
+        assert!(!is_opus_model("claude-sonnet-4-5"));
+        assert!(!is_opus_model("opu"));
+    }
+
+    #[tokio::test]
+    async fn test_acquire_context_filters_opus_by_subscription() {
+        let config = Config::default();
+        let mut free = valid_credential("free");
+        free.subscription_title = Some("KIRO FREE".to_string());
+        let mut pro = valid_credential("pro");
+        pro.priority = 1;
+        pro.subscription_title = Some("KIRO PRO+".to_string());
+
+        let manager = MultiTokenManager::new(config, vec![free, pro], None, None, false).unwrap();
+        manager
+            .set_load_balancing_mode("balanced".to_string())
+            .unwrap();
+
+        let ctx = manager.acquire_context(Some("claude-opus-4-5")).await.unwrap();
+        assert_eq!(ctx.token, "pro");
+        let ctx = manager.acquire_context(Some("claude-sonnet-4-5")).await.unwrap();
+        assert_eq!(ctx.token, "free");
+    }
+
+    #[tokio::test]
+    async fn test_least_in_flight_mode_spreads_concurrent_requests() {
+        let config = Config::default();
+        let manager = MultiTokenManager::new(
+            config,
+            vec![valid_credential("t1"), valid_credential("t2")],
+            None,
+            None,
+            false,
+        )
+        .unwrap();
+        manager
+            .set_load_balancing_mode("least-in-flight".to_string())
+            .unwrap();
+        assert_eq!(manager.get_load_balancing_mode(), "least-in-flight");
+
+        let ctx1 = manager.acquire_context(None).await.unwrap();
+        let ctx2 = manager.acquire_context(None).await.unwrap();
+        assert_ne!(ctx1.id, ctx2.id);
+        assert!(manager.snapshot().entries.iter().all(|e| e.in_flight == 1));
+
+        // 释放 ctx1 后，其凭据在途数最少，应被再次选中
+        let released_id = ctx1.id;
+        drop(ctx1);
+        let ctx3 = manager.acquire_context(None).await.unwrap();
+        assert_eq!(ctx3.id, released_id);
+    }
+
+    #[tokio::test]
+    async fn test_slow_credential_is_ejected_and_hedge_uses_other() {
+        let config = Config::default();
+        let mut fast = valid_credential("fast");
+        fast.priority = 1;
+        let manager = MultiTokenManager::new(
+            config,
+            vec![valid_credential("slow"), fast],
+            None,
+            None,
+            false,
+        )
+        .unwrap();
+
+        let ctx = manager.acquire_context(None).await.unwrap();
+        assert_eq!(ctx.token, "slow");
+        let slow_id = ctx.id;
+
+        // 对冲请求只会选择其他凭据
+        let hedge = manager.acquire_hedge_context(None, slow_id).await.unwrap();
+        assert_eq!(hedge.token, "fast");
+        let fast_id = hedge.id;
+
+        for _ in 0..10 {
+            manager.report_ttfb(slow_id, StdDuration::from_secs(60));
+        }
+        let ctx = manager.acquire_context(None).await.unwrap();
+        assert_eq!(ctx.id, fast_id);
+
+        // 已摘除的凭据不参与对冲
+        assert!(manager.acquire_hedge_context(None, fast_id).await.is_err());
+
+        // 其他凭据不可用时忽略熔断状态，避免无凭据可用
+        manager.set_disabled(fast_id, true).unwrap();
+        let ctx = manager.acquire_context(None).await.unwrap();
+        assert_eq!(ctx.id, slow_id);
+    }
+
+    #[tokio::test]
+    async fn test_priority_current_credential_probes_after_cooldown() {
+        let config = Config::default();
+        let mut backup = valid_credential("backup");
+        backup.priority = 1;
+        let manager = MultiTokenManager::new(
+            config,
+            vec![valid_credential("primary"), backup],
+            None,
+            None,
+            false,
+        )
+        .unwrap();
+
+        let ctx = manager.acquire_context(None).await.unwrap();
+        assert_eq!(ctx.token, "primary");
+        let primary_id = ctx.id;
+        let load = || {
+            manager
+                .selection_index()
+                .get(primary_id)
+                .unwrap()
+                .load
+                .clone()
+        };
+
+        for _ in 0..5 {
+            manager.report_ttfb(primary_id, StdDuration::from_secs(60));
+        }
+        assert!(!load().latency.is_selectable(Instant::now()));
+
+        // 冷却结束后，priority 模式命中 current_id 时也必须进入 half-open 发起探测
+        load().latency.expire_cooldown(Instant::now());
+        let ctx = manager.acquire_context(None).await.unwrap();
+        assert_eq!(ctx.id, primary_id);
+        assert!(!load().latency.is_selectable(Instant::now()));
+
+        // 探测仍然过慢：重新摘除，改用其他凭据
+        manager.report_ttfb(primary_id, StdDuration::from_secs(60));
+        assert!(!load().latency.is_selectable(Instant::now()));
+        let ctx = manager.acquire_context(None).await.unwrap();
+        assert_eq!(ctx.token, "backup");
+
+        // 再次探测正常：恢复
+        load().latency.expire_cooldown(Instant::now());
+        *manager.current_id.lock() = primary_id;
+        let ctx = manager.acquire_context(None).await.unwrap();
+        assert_eq!(ctx.id, primary_id);
+        manager.report_ttfb(primary_id, StdDuration::from_secs(1));
+        assert!(load().latency.is_selectable(Instant::now()));
+    }
+
+    #[tokio::test]
+    async fn test_render_metrics_reports_per_credential_gauges() {
+        let config = Config::default();
+        let manager =
+            MultiTokenManager::new(config, vec![valid_credential("a")], None, None, false).unwrap();
+
+        let ctx = manager.acquire_context(None).await.unwrap();
+        manager.report_ttfb(ctx.id, StdDuration::from_millis(1500));
+
+        let mut out = String::new();
+        manager.render_metrics(&mut out);
+        let series = |name: &str| format!("{}{{credential=\"{}\"}}", name, ctx.id);
+        assert!(out.contains(&format!("{} 1\n", series("kiro_credential_in_flight"))));
+        assert!(out.contains(&format!("{} 0\n", series("kiro_credential_disabled"))));
+        assert!(out.contains(&format!(
+            "{} 1.5\n",
+            series("kiro_credential_ttfb_ewma_seconds")
+        )));
+
+        drop(ctx);
+        out.clear();
+        manager.render_metrics(&mut out);
+        assert!(out.contains(&format!("{} 0\n", series("kiro_credential_in_flight"))));
+    }
+
+    #[test]
+    fn test_set_load_balancing_mode_rejects_unknown_mode() {
+        let config = Config::default();
+        let manager =
+            MultiTokenManager::new(config, vec![KiroCredentials::default()], None, None, false)
+                .unwrap();
+
+        assert!(manager.set_load_balancing_mode("random".to_string()).is_err());
+        assert_eq!(manager.get_load_balancing_mode(), "priority");
+    }
+
+    #[test]
+    fn test_selection_index_rebuilt_on_disable() {
+        let config = Config::default();
+        let manager = MultiTokenManager::new(
+            config,
+            vec![KiroCredentials::default(), KiroCredentials::default()],
+            None,
+            None,
+            false,
+        )
+        .unwrap();
+        assert_eq!(manager.selection_index().any.len(), 2);
+
+        manager.set_disabled(1, true).unwrap();
+        let index = manager.selection_index();
+        assert_eq!(index.any.len(), 1);
+        assert!(index.get(1).is_none());
+        assert!(index.get(2).is_some());
+    }
+
+    #[test]
+    fn test_persist_credentials_is_written_behind() {
+        let dir = std::env::temp_dir().join(format!("kiro-rs-persist-{}", uuid::Uuid::new_v4()));
+        std::fs::create_dir_all(&dir).unwrap();
+        let path = dir.join("credentials.json");
+
+        let config = Config::default();
+        let manager = MultiTokenManager::new(
+            config,
+            vec![KiroCredentials::default()],
+            None,
+            Some(path.clone()),
+            true,
+        )
+        .unwrap();
+
+        manager.set_priority(1, 7).unwrap();
+        manager.flush_persistence();
+
+        let persisted: Vec<KiroCredentials> =
+            serde_json::from_str(&std::fs::read_to_string(&path).unwrap()).unwrap();
+        assert_eq!(persisted[0].priority, 7);
+        assert_eq!(manager.persist_stats().failures, 0);
+        assert!(manager.persist_stats().writes >= 1);
+
+        let _ = std::fs::remove_dir_all(&dir);
+    }
+
+    #[test]
+    fn test_admin_update_reports_persist_failure() {
+        let dir = std::env::temp_dir().join(format!("kiro-rs-persist-{}", uuid::Uuid::new_v4()));
+        // 目录不存在，写入必然失败
+        let path = dir.join("credentials.json");
+
+        let manager = MultiTokenManager::new(
+            Config::default(),
+            vec![KiroCredentials::default()],
+            None,
+            Some(path),
+            true,
+        )
+        .unwrap();
+
+        let err = manager.set_priority(1, 7).unwrap_err().to_string();
+        assert!(err.contains("写入凭据文件失败"), "实际: {}", err);
+        // 内存中的修改仍然生效
+        assert_eq!(manager.snapshot().entries[0].priority, 7);
+        assert!(manager.persist_stats().failures >= 1);
+    }
+
+    #[tokio::test(flavor = "multi_thread")]
+    async fn test_admin_update_waits_for_persist_inside_runtime() {
+        let dir = std::env::temp_dir().join(format!("kiro-rs-persist-{}", uuid::Uuid::new_v4()));
+        std::fs::create_dir_all(&dir).unwrap();
+        let path = dir.join("credentials.json");
+
+        let manager = MultiTokenManager::new(
+            Config::default(),
+            vec![KiroCredentials::default()],
+            None,
+            Some(path.clone()),
+            true,
+        )
+        .unwrap();
+
+        manager.set_priority(1, 7).unwrap();
+        let written: Vec<KiroCredentials> =
+            serde_json::from_slice(&std::fs::read(&path).unwrap()).unwrap();
+        assert_eq!(written[0].priority, 7);
+
+        let _ = std::fs::remove_dir_all(&dir);
+    }
+
     #[test]
     fn test_multi_token_manager_report_quota_exhausted() {
         let config = Config::default();
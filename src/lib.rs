@@ -0,0 +1,13 @@
+//! kiro-rs：Anthropic Claude API 兼容的 Kiro 代理
+//!
+//! 服务入口见 `main.rs`；模块以库的形式导出，供基准测试（`benches/`）
+//! 和本地压测工具（`examples/`）复用
+
+pub mod admin;
+pub mod admin_ui;
+pub mod anthropic;
+pub mod common;
+pub mod http_client;
+pub mod kiro;
+pub mod model;
+pub mod token;
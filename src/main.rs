@@ -1,22 +1,14 @@
-mod admin;
-mod admin_ui;
-mod anthropic;
-mod common;
-mod http_client;
-mod kiro;
-mod model;
-pub mod token;
-
 use std::fs;
 use std::path::Path;
 use std::sync::Arc;
 
 use clap::Parser;
-use kiro::model::credentials::{CredentialsConfig, KiroCredentials};
-use kiro::provider::KiroProvider;
-use kiro::token_manager::MultiTokenManager;
-use model::arg::Args;
-use model::config::Config;
+use kiro_rs::kiro::model::credentials::{CredentialsConfig, KiroCredentials};
+use kiro_rs::kiro::provider::KiroProvider;
+use kiro_rs::kiro::token_manager::MultiTokenManager;
+use kiro_rs::model::arg::Args;
+use kiro_rs::model::config::Config;
+use kiro_rs::{admin, admin_ui, anthropic, http_client, kiro, token};
 
 fn env_truthy(key: &str) -> bool {
     match std::env::var(key) {
@@ -179,6 +171,8 @@ async fn main() {
         std::process::exit(1);
     });
     let token_manager = Arc::new(token_manager);
+    // 启动后台 Token 刷新调度器，在请求路径之外提前续期即将过期的凭据
+    token_manager.spawn_refresh_scheduler();
     let kiro_provider = KiroProvider::with_proxy(token_manager.clone(), proxy_config.clone());
 
     // 初始化 count_tokens 配置
@@ -195,6 +189,10 @@ async fn main() {
         &api_key,
         Some(kiro_provider),
         first_credentials.profile_arn.clone(),
+        anthropic::SseCoalesceConfig {
+            window: std::time::Duration::from_millis(config.sse_coalesce_window_ms),
+            max_bytes: config.sse_coalesce_max_bytes,
+        },
     );
 
     // 构建 Admin API 路由（如果配置了非空的 admin_api_key）
@@ -247,5 +245,44 @@ async fn main() {
     }
 
     let listener = tokio::net::TcpListener::bind(&addr).await.unwrap();
-    axum::serve(listener, app).await.unwrap();
+    axum::serve(listener, app)
+        .with_graceful_shutdown(shutdown_signal())
+        .await
+        .unwrap();
+
+    // 退出前落盘所有未保存的凭据/统计数据
+    token_manager.flush_persistence();
+    tracing::info!("服务已停止");
+}
+
+/// 等待退出信号（Ctrl+C / SIGTERM）
+async fn shutdown_signal() {
+    let ctrl_c = async {
+        if let Err(e) = tokio::signal::ctrl_c().await {
+            tracing::error!("监听 Ctrl+C 信号失败: {}", e);
+            std::future::pending::<()>().await;
+        }
+    };
+
+    #[cfg(unix)]
+    let terminate = async {
+        match tokio::signal::unix::signal(tokio::signal::unix::SignalKind::terminate()) {
+            Ok(mut signal) => {
+                signal.recv().await;
+            }
+            Err(e) => {
+                tracing::error!("监听 SIGTERM 信号失败: {}", e);
+                std::future::pending::<()>().await;
+            }
+        }
+    };
+
+    #[cfg(not(unix))]
+    let terminate = std::future::pending::<()>();
+
+    tokio::select! {
+        _ = ctrl_c => {},
+        _ = terminate => {},
+    }
+    tracing::info!("收到退出信号，正在停止服务...");
 }
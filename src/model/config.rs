@@ -3,6 +3,8 @@ use serde::{Deserialize, Serialize};
 use std::fs;
 use std::path::{Path, PathBuf};
 
+use crate::common::persist::write_atomic;
+
 #[derive(Debug, Clone, Copy, Serialize, Deserialize, PartialEq, Eq)]
 #[serde(rename_all = "kebab-case")]
 pub enum TlsBackend {
@@ -86,10 +88,35 @@ pub struct Config {
     #[serde(default)]
     pub admin_api_key: Option<String>,
 
-    /// 负载均衡模式（"priority" 或 "balanced"）
+    /// 负载均衡模式（"priority"、"balanced" 或 "least-in-flight"）
     #[serde(default = "default_load_balancing_mode")]
     pub load_balancing_mode: String,
 
+    /// SSE 增量合并窗口（毫秒），为 0 时不合并
+    ///
+    /// 启用后同一内容块上连续的 text_delta / thinking_delta 会在窗口内合并为一次写出
+    #[serde(default)]
+    pub sse_coalesce_window_ms: u64,
+
+    /// SSE 合并缓冲字节上限，达到后立即写出
+    #[serde(default = "default_sse_coalesce_max_bytes")]
+    pub sse_coalesce_max_bytes: usize,
+
+    /// 是否启用对冲请求
+    ///
+    /// 启用后，上游首字节延迟超过近期 p95 时，通过另一个凭据发起对冲请求，
+    /// 采用先成功返回的响应并取消另一个
+    #[serde(default)]
+    pub hedge_requests: bool,
+
+    /// 上游地址覆盖（可选，仅用于本地压测）
+    ///
+    /// 配置后 API、MCP、Token 刷新和额度查询请求都发往该地址（保留原路径），
+    /// 配合 `examples/mock_upstream.rs` 在无 AWS 环境下压测完整链路
+    #[serde(default)]
+    #[serde(skip_serializing_if = "Option::is_none")]
+    pub upstream_base_url: Option<String>,
+
     /// 配置文件路径（运行时元数据，不写入 JSON）
     #[serde(skip)]
     config_path: Option<PathBuf>,
@@ -132,6 +159,10 @@ fn default_load_balancing_mode() -> String {
     "priority".to_string()
 }
 
+fn default_sse_coalesce_max_bytes() -> usize {
+    16 * 1024
+}
+
 impl Default for Config {
     fn default() -> Self {
         Self {
@@ -154,6 +185,10 @@ impl Default for Config {
             proxy_password: None,
             admin_api_key: None,
             load_balancing_mode: default_load_balancing_mode(),
+            sse_coalesce_window_ms: 0,
+            sse_coalesce_max_bytes: default_sse_coalesce_max_bytes(),
+            hedge_requests: false,
+            upstream_base_url: None,
             config_path: None,
         }
     }
@@ -177,6 +212,17 @@ impl Config {
         self.api_region.as_deref().unwrap_or(&self.region)
     }
 
+    /// 构造上游请求 URL
+    ///
+    /// `host` 为真实上游域名，`path` 以 `/` 开头（可带查询参数）；
+    /// 配置了 `upstream_base_url` 时改为发往该地址
+    pub fn upstream_url(&self, host: &str, path: &str) -> String {
+        match self.upstream_base_url.as_deref() {
+            Some(base) => format!("{}{}", base.trim_end_matches('/'), path),
+            None => format!("https://{}{}", host, path),
+        }
+    }
+
     /// 从文件加载配置
     pub fn load<P: AsRef<Path>>(path: P) -> anyhow::Result<Self> {
         let path = path.as_ref();
@@ -212,7 +258,8 @@ impl Config {
             .ok_or_else(|| anyhow::anyhow!("配置文件路径未知，无法保存配置"))?;
 
         let content = serde_json::to_string_pretty(self).context("序列化配置失败")?;
-        fs::write(path, content).with_context(|| format!("写入配置文件失败: {}", path.display()))?;
+        write_atomic(path, content.as_bytes())
+            .with_context(|| format!("写入配置文件失败: {}", path.display()))?;
         Ok(())
     }
 }
@@ -221,6 +268,21 @@ impl Config {
 mod tests {
     use super::*;
 
+    #[test]
+    fn test_upstream_url_override() {
+        let mut config = Config::default();
+        assert_eq!(
+            config.upstream_url("q.us-east-1.amazonaws.com", "/mcp"),
+            "https://q.us-east-1.amazonaws.com/mcp"
+        );
+
+        config.upstream_base_url = Some("http://127.0.0.1:9000/".to_string());
+        assert_eq!(
+            config.upstream_url("q.us-east-1.amazonaws.com", "/mcp"),
+            "http://127.0.0.1:9000/mcp"
+        );
+    }
+
     #[test]
     fn test_load_config_path_is_directory() {
         let dir = std::env::temp_dir().join(format!("kiro-rs-config-dir-{}", fastrand::u64(..)));
@@ -6,13 +6,20 @@
 //! - 非西文字符：每个计 4.5 个字符单位
 //! - 西文字符：每个计 1 个字符单位
 //! - 4 个字符单位 = 1 token（四舍五入）
+//!
+//! 本地计数结果按 system 块、消息、工具定义分别缓存，
+//! 远程 count_tokens API 带有超时与熔断保护。
 
-use crate::anthropic::types::{
-    CountTokensRequest, CountTokensResponse, Message, SystemMessage, Tool,
-};
+use crate::anthropic::types::{CountTokensResponse, Message, SystemMessage, Tool};
+use crate::common::cache::{GenerationalCache, hash_json_map};
 use crate::http_client::{ProxyConfig, build_client};
 use crate::model::config::TlsBackend;
+use parking_lot::Mutex;
+use serde::Serialize;
+use std::hash::{DefaultHasher, Hash, Hasher};
 use std::sync::OnceLock;
+use std::sync::atomic::{AtomicU32, Ordering};
+use std::time::{Duration, Instant};
 
 /// Count Tokens API 配置
 #[derive(Clone, Default)]
@@ -69,22 +76,62 @@ fn is_non_western_char(c: char) -> bool {
     )
 }
 
+/// 计算文本的字符单位数
+///
+/// ASCII 段按 8 字节一组批量判断，只有遇到非 ASCII 字节时才逐字符解码
+fn char_units(text: &str) -> u64 {
+    let bytes = text.as_bytes();
+    let mut units = 0u64;
+    let mut i = 0;
+
+    while i < bytes.len() {
+        let run = ascii_run_len(&bytes[i..]);
+        units += run as u64;
+        i += run;
+
+        // 逐字符处理紧随其后的非 ASCII 段，直到再次遇到 ASCII 字符
+        for c in text[i..].chars() {
+            if c.is_ascii() {
+                break;
+            }
+            units += if is_non_western_char(c) { 4 } else { 1 };
+            i += c.len_utf8();
+        }
+    }
+
+    units
+}
+
+/// 返回切片开头连续 ASCII 字节的长度
+fn ascii_run_len(bytes: &[u8]) -> usize {
+    const HIGH_BITS: u64 = 0x8080_8080_8080_8080;
+
+    let mut len = 0;
+    let mut chunks = bytes.chunks_exact(8);
+    for chunk in &mut chunks {
+        let word = u64::from_le_bytes(chunk.try_into().unwrap());
+        let high = word & HIGH_BITS;
+        if high != 0 {
+            return len + (high.trailing_zeros() / 8) as usize;
+        }
+        len += 8;
+    }
+
+    len + chunks
+        .remainder()
+        .iter()
+        .take_while(|b| b.is_ascii())
+        .count()
+}
+
 /// 计算文本的 token 数量
 ///
 /// # 计算规则
 /// - 非西文字符：每个计 4.5 个字符单位
 /// - 西文字符：每个计 1 个字符单位
 /// - 4 个字符单位 = 1 token（四舍五入）
-/// ```
 pub fn count_tokens(text: &str) -> u64 {
-    // println!("text: {}", text);
-
-    let char_units: f64 = text
-        .chars()
-        .map(|c| if is_non_western_char(c) { 4.0 } else { 1.0 })
-        .sum();
-
-    let tokens = char_units / 4.0;
+    let tokens = char_units(text) as f64 / 4.0;
 
     let acc_token = if tokens < 100.0 {
         tokens * 1.5
@@ -98,37 +145,217 @@ pub fn count_tokens(text: &str) -> u64 {
         tokens * 1.0
     } as u64;
 
-    // println!("tokens: {}, acc_tokens: {}", tokens, acc_token);
     acc_token
 }
 
+// === 本地计数缓存 ===
+
+/// 本地计数缓存每一代的容量（总容量为两倍）
+const LOCAL_COUNT_CACHE_CAPACITY: usize = 4096;
+
+/// 全局本地计数缓存
+///
+/// 以内容哈希为 key 缓存每个 system 块、消息和工具定义的 token 数。
+/// Agent 场景下每轮都会重发相同的 system prompt 和工具列表，
+/// 命中缓存后只需计算对话新增的尾部消息。
+static LOCAL_COUNT_CACHE: OnceLock<GenerationalCache<u64>> = OnceLock::new();
+
+fn local_count_cache() -> &'static GenerationalCache<u64> {
+    LOCAL_COUNT_CACHE.get_or_init(|| GenerationalCache::new(LOCAL_COUNT_CACHE_CAPACITY))
+}
+
+/// 缓存 key 的类别标记，避免不同类别的内容哈希相互冲突
+#[derive(Hash)]
+enum CacheKind {
+    System,
+    Message,
+    Tool,
+}
+
+fn new_hasher(kind: CacheKind) -> DefaultHasher {
+    let mut hasher = DefaultHasher::new();
+    kind.hash(&mut hasher);
+    hasher
+}
+
+/// 消息中参与计数的文本片段
+fn message_texts(msg: &Message) -> impl Iterator<Item = &str> {
+    let (single, items) = match &msg.content {
+        serde_json::Value::String(s) => (Some(s.as_str()), None),
+        serde_json::Value::Array(arr) => (None, Some(arr.iter())),
+        _ => (None, None),
+    };
+    single.into_iter().chain(
+        items
+            .into_iter()
+            .flatten()
+            .filter_map(|item| item.get("text").and_then(|v| v.as_str())),
+    )
+}
+
+fn count_system_tokens(msg: &SystemMessage) -> u64 {
+    let mut hasher = new_hasher(CacheKind::System);
+    msg.text.hash(&mut hasher);
+    local_count_cache().get_or_insert_with(hasher.finish(), || count_tokens(&msg.text))
+}
+
+fn count_message_tokens(msg: &Message) -> u64 {
+    // 只哈希参与计数的文本，图片等内容不影响计数结果
+    let mut hasher = new_hasher(CacheKind::Message);
+    for text in message_texts(msg) {
+        text.hash(&mut hasher);
+    }
+    local_count_cache().get_or_insert_with(hasher.finish(), || {
+        message_texts(msg).map(count_tokens).sum()
+    })
+}
+
+fn count_tool_tokens(tool: &Tool) -> u64 {
+    let mut hasher = new_hasher(CacheKind::Tool);
+    tool.name.hash(&mut hasher);
+    tool.description.hash(&mut hasher);
+    hash_json_map(&tool.input_schema, &mut hasher);
+
+    local_count_cache().get_or_insert_with(hasher.finish(), || {
+        let input_schema_json = serde_json::to_string(&tool.input_schema).unwrap_or_default();
+        count_tokens(&tool.name)
+            + count_tokens(&tool.description)
+            + count_tokens(&input_schema_json)
+    })
+}
+
+// === 远程 API ===
+
+/// 远程 count_tokens API 单次调用超时
+const REMOTE_TIMEOUT: Duration = Duration::from_secs(10);
+
+/// 连续失败多少次后打开熔断
+const BREAKER_FAILURE_THRESHOLD: u32 = 3;
+
+/// 熔断打开后的冷却时间，冷却结束后放行一次探测请求
+const BREAKER_COOLDOWN: Duration = Duration::from_secs(30);
+
+/// 远程 API 熔断器
+///
+/// - 连续失败达到阈值后打开，冷却期内直接使用本地计算
+/// - 冷却结束后只放行一个探测请求（半开），成功则关闭，失败则重新冷却
+struct CircuitBreaker {
+    consecutive_failures: AtomicU32,
+    open_until: Mutex<Option<Instant>>,
+}
+
+impl CircuitBreaker {
+    const fn new() -> Self {
+        Self {
+            consecutive_failures: AtomicU32::new(0),
+            open_until: Mutex::new(None),
+        }
+    }
+
+    /// 是否允许发起远程调用
+    fn allow(&self) -> bool {
+        let mut open_until = self.open_until.lock();
+        match *open_until {
+            None => true,
+            Some(until) => {
+                let now = Instant::now();
+                if now < until {
+                    return false;
+                }
+                // 半开：放行当前请求作为探测，其余请求继续等待探测结果
+                *open_until = Some(now + BREAKER_COOLDOWN);
+                true
+            }
+        }
+    }
+
+    fn record_success(&self) {
+        self.consecutive_failures.store(0, Ordering::Relaxed);
+        *self.open_until.lock() = None;
+    }
+
+    fn record_failure(&self) {
+        let failures = self.consecutive_failures.fetch_add(1, Ordering::Relaxed) + 1;
+        if failures >= BREAKER_FAILURE_THRESHOLD {
+            *self.open_until.lock() = Some(Instant::now() + BREAKER_COOLDOWN);
+            if failures == BREAKER_FAILURE_THRESHOLD {
+                tracing::warn!(
+                    "远程 count_tokens API 连续失败 {} 次，{} 秒内改用本地计算",
+                    failures,
+                    BREAKER_COOLDOWN.as_secs()
+                );
+            }
+        }
+    }
+}
+
+static REMOTE_BREAKER: CircuitBreaker = CircuitBreaker::new();
+
+/// 复用的远程 API HTTP 客户端
+static REMOTE_CLIENT: OnceLock<reqwest::Client> = OnceLock::new();
+
+fn remote_client(config: &CountTokensConfig) -> anyhow::Result<&'static reqwest::Client> {
+    if let Some(client) = REMOTE_CLIENT.get() {
+        return Ok(client);
+    }
+    let client = build_client(
+        config.proxy.as_ref(),
+        REMOTE_TIMEOUT.as_secs(),
+        config.tls_backend,
+    )?;
+    Ok(REMOTE_CLIENT.get_or_init(|| client))
+}
+
+/// 远程 count_tokens 请求体（借用请求数据，避免深拷贝）
+#[derive(Serialize)]
+struct CountTokensRequestRef<'a> {
+    model: &'a str,
+    messages: &'a [Message],
+    #[serde(skip_serializing_if = "Option::is_none")]
+    system: Option<&'a [SystemMessage]>,
+    #[serde(skip_serializing_if = "Option::is_none")]
+    tools: Option<&'a [Tool]>,
+}
+
 /// 估算请求的输入 tokens
 ///
-/// 优先调用远程 API，失败时回退到本地计算
-pub(crate) fn count_all_tokens(
-    model: String,
-    system: Option<Vec<SystemMessage>>,
-    messages: Vec<Message>,
-    tools: Option<Vec<Tool>>,
+/// 优先调用远程 API，失败、超时或熔断时回退到本地计算
+pub(crate) async fn count_all_tokens(
+    model: &str,
+    system: Option<&[SystemMessage]>,
+    messages: &[Message],
+    tools: Option<&[Tool]>,
 ) -> u64 {
     // 检查是否配置了远程 API
     if let Some(config) = get_config() {
         if let Some(api_url) = &config.api_url {
-            // 尝试调用远程 API
-            let result = tokio::task::block_in_place(|| {
-                tokio::runtime::Handle::current().block_on(call_remote_count_tokens(
-                    api_url, config, model, &system, &messages, &tools,
-                ))
-            });
-
-            match result {
-                Ok(tokens) => {
-                    tracing::debug!("远程 count_tokens API 返回: {}", tokens);
-                    return tokens;
-                }
-                Err(e) => {
-                    tracing::warn!("远程 count_tokens API 调用失败，回退到本地计算: {}", e);
+            if REMOTE_BREAKER.allow() {
+                let request = CountTokensRequestRef {
+                    model,
+                    messages,
+                    system,
+                    tools,
+                };
+                let result = tokio::time::timeout(
+                    REMOTE_TIMEOUT,
+                    call_remote_count_tokens(api_url, config, &request),
+                )
+                .await
+                .unwrap_or_else(|_| Err("请求超时".into()));
+
+                match result {
+                    Ok(tokens) => {
+                        REMOTE_BREAKER.record_success();
+                        tracing::debug!("远程 count_tokens API 返回: {}", tokens);
+                        return tokens;
+                    }
+                    Err(e) => {
+                        REMOTE_BREAKER.record_failure();
+                        tracing::warn!("远程 count_tokens API 调用失败，回退到本地计算: {}", e);
+                    }
                 }
+            } else {
+                tracing::debug!("远程 count_tokens API 熔断中，使用本地计算");
             }
         }
     }
@@ -141,20 +368,9 @@ pub(crate) fn count_all_tokens(
 async fn call_remote_count_tokens(
     api_url: &str,
     config: &CountTokensConfig,
-    model: String,
-    system: &Option<Vec<SystemMessage>>,
-    messages: &Vec<Message>,
-    tools: &Option<Vec<Tool>>,
+    request: &CountTokensRequestRef<'_>,
 ) -> Result<u64, Box<dyn std::error::Error + Send + Sync>> {
-    let client = build_client(config.proxy.as_ref(), 300, config.tls_backend)?;
-
-    // 构建请求体
-    let request = CountTokensRequest {
-        model: model, // 模型名称用于 token 计算
-        messages: messages.clone(),
-        system: system.clone(),
-        tools: tools.clone(),
-    };
+    let client = remote_client(config)?;
 
     // 构建请求
     let mut req_builder = client.post(api_url);
@@ -171,7 +387,7 @@ async fn call_remote_count_tokens(
     // 发送请求
     let response = req_builder
         .header("Content-Type", "application/json")
-        .json(&request)
+        .json(request)
         .send()
         .await?;
 
@@ -184,41 +400,28 @@ async fn call_remote_count_tokens(
 }
 
 /// 本地计算请求的输入 tokens
+///
+/// 每个 system 块、消息和工具定义的计数结果都会按内容哈希缓存
 fn count_all_tokens_local(
-    system: Option<Vec<SystemMessage>>,
-    messages: Vec<Message>,
-    tools: Option<Vec<Tool>>,
+    system: Option<&[SystemMessage]>,
+    messages: &[Message],
+    tools: Option<&[Tool]>,
 ) -> u64 {
     let mut total = 0;
 
     // 系统消息
-    if let Some(ref system) = system {
-        for msg in system {
-            total += count_tokens(&msg.text);
-        }
+    for msg in system.unwrap_or_default() {
+        total += count_system_tokens(msg);
     }
 
     // 用户消息
-    for msg in &messages {
-        if let serde_json::Value::String(s) = &msg.content {
-            total += count_tokens(s);
-        } else if let serde_json::Value::Array(arr) = &msg.content {
-            for item in arr {
-                if let Some(text) = item.get("text").and_then(|v| v.as_str()) {
-                    total += count_tokens(text);
-                }
-            }
-        }
+    for msg in messages {
+        total += count_message_tokens(msg);
     }
 
     // 工具定义
-    if let Some(ref tools) = tools {
-        for tool in tools {
-            total += count_tokens(&tool.name);
-            total += count_tokens(&tool.description);
-            let input_schema_json = serde_json::to_string(&tool.input_schema).unwrap_or_default();
-            total += count_tokens(&input_schema_json);
-        }
+    for tool in tools.unwrap_or_default() {
+        total += count_tool_tokens(tool);
     }
 
     total.max(1)
@@ -243,3 +446,98 @@ pub(crate) fn estimate_output_tokens(content: &[serde_json::Value]) -> i32 {
 
     total.max(1)
 }
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    /// 逐字符计算的参考实现
+    fn char_units_reference(text: &str) -> u64 {
+        text.chars()
+            .map(|c| if is_non_western_char(c) { 4 } else { 1 })
+            .sum()
+    }
+
+    #[test]
+    fn test_char_units_matches_per_char_reference() {
+        let samples = [
+            "",
+            "hello",
+            "exactly8",
+            "hello world, this is a longer ascii sentence",
+            "你好世界",
+            "mixed 中文 and English 文本 together",
+            "café résumé naïve",
+            "emoji 🚀 rocket and 日本語 テキスト",
+            "a中",
+            "中a",
+        ];
+        for text in samples {
+            assert_eq!(char_units(text), char_units_reference(text), "{:?}", text);
+        }
+    }
+
+    #[test]
+    fn test_count_tokens_multipliers() {
+        assert_eq!(count_tokens(""), 0);
+        // 400 个 ASCII 字符 = 100 token，命中 1.3 倍区间
+        assert_eq!(count_tokens(&"a".repeat(400)), 130);
+        // 100 个中文字符 = 100 token
+        assert_eq!(count_tokens(&"中".repeat(100)), 130);
+    }
+
+    #[test]
+    fn test_count_all_tokens_local_is_stable_across_calls() {
+        let system = vec![SystemMessage {
+            text: "You are a helpful assistant.".to_string(),
+        }];
+        let messages = vec![
+            Message {
+                role: "user".to_string(),
+                content: serde_json::json!("你好"),
+            },
+            Message {
+                role: "assistant".to_string(),
+                content: serde_json::json!([{"type": "text", "text": "Hello there"}]),
+            },
+        ];
+        let tool: Tool = serde_json::from_value(serde_json::json!({
+            "name": "read_file",
+            "description": "Read a file",
+            "input_schema": {"type": "object", "properties": {"path": {"type": "string"}}}
+        }))
+        .unwrap();
+        let tools = vec![tool];
+
+        let expected = count_tokens(&system[0].text)
+            + count_tokens("你好")
+            + count_tokens("Hello there")
+            + count_tokens("read_file")
+            + count_tokens("Read a file")
+            + count_tokens(&serde_json::to_string(&tools[0].input_schema).unwrap());
+
+        for _ in 0..2 {
+            let total =
+                count_all_tokens_local(Some(system.as_slice()), &messages, Some(tools.as_slice()));
+            assert_eq!(total, expected);
+        }
+    }
+
+    #[test]
+    fn test_circuit_breaker_opens_and_probes() {
+        let breaker = CircuitBreaker::new();
+        for _ in 0..BREAKER_FAILURE_THRESHOLD {
+            assert!(breaker.allow());
+            breaker.record_failure();
+        }
+        assert!(!breaker.allow());
+
+        // 冷却结束后只放行一个探测请求
+        *breaker.open_until.lock() = Some(Instant::now());
+        assert!(breaker.allow());
+        assert!(!breaker.allow());
+
+        breaker.record_success();
+        assert!(breaker.allow());
+    }
+}